@@ -0,0 +1,248 @@
+# admission.py
+"""Admission control for posted messages.
+
+A post is turned away before its body is read when it is larger than
+`max_bytes` (413), when its client has used up its token bucket (429), or
+when the ingest queue is full (503). Accepted messages go onto a bounded
+queue drained by a single writer thread, so bursts of posts turn into a
+few batched disk writes instead of one write per request thread. A post
+is only acknowledged once its batch is written; a failed write answers
+500 and one that is not written in time 503. Webhook deliveries are size
+checked against `webhook_max_bytes` and rate limited before their body is
+read, since the signature can only be verified afterwards.
+"""
+import math
+import queue
+import threading
+import time
+from collections import OrderedDict
+import metrics
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+class TokenBucket:
+    """Allows `burst` events at once, refilled at `rate` tokens per second"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now=None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic() if now is None else now
+
+    def take(self, now=None):
+        """Spend a token; returns 0 if one was available, else seconds until one is"""
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+class RateLimiter:
+    """One token bucket per client address, keeping the most recent max_clients"""
+
+    def __init__(self, per_minute, burst, max_clients=10000):
+        self.rate = per_minute / 60
+        self.burst = max(burst, 1)
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def check(self, client):
+        """Seconds the client must wait before posting again, 0 if it may post now"""
+        if not self.enabled:
+            return 0
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > self.max_clients:
+                    # Least recently seen clients go first; they return with a full bucket
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+            return bucket.take()
+
+class Pending:
+    """A submitted item; `error` holds the exception if its batch failed"""
+
+    __slots__ = ('error', '_done')
+
+    def __init__(self):
+        self.error = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        """True once the item's batch was handled (written or failed)"""
+        return self._done.wait(timeout)
+
+    def finish(self, error=None):
+        self.error = error
+        self._done.set()
+
+class IngestQueue:
+    """Bounded queue of accepted items, written in batches by one thread.
+
+    handler(items) is called with up to batch_size items at a time. submit()
+    never blocks: it returns None when the queue is full so the caller can
+    shed the load instead of piling up request threads.
+    """
+
+    def __init__(self, handler, maxsize=1000, batch_size=100):
+        self.handler = handler
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize)
+        self._thread = None
+        # Items written per second, measured over recent batches
+        self._throughput = None
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def full(self):
+        return self._queue.full()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Write what is queued and stop the writer thread"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, item):
+        """Queue an item and return its Pending, or None when full"""
+        written = Pending()
+        try:
+            self._queue.put_nowait((item, written))
+        except queue.Full:
+            return None
+        metrics.ingest_queue_depth.set(self._queue.qsize())
+        return written
+
+    def retry_after(self):
+        """Whole seconds until the queue has likely drained, at least 1"""
+        if not self._throughput:
+            return 1
+        return min(max(math.ceil(self._queue.qsize() / self._throughput), 1), 60)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            batch = [first] if first is not None else []
+            stopping = first is None
+            while len(batch) < self.batch_size and not stopping:
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stopping = True
+                else:
+                    batch.append(entry)
+            if batch:
+                self._write(batch)
+            if stopping:
+                return
+
+    def _write(self, batch):
+        start = time.perf_counter()
+        error = None
+        try:
+            self.handler([item for item, _ in batch])
+        except Exception as e:
+            logger.error(f"Error writing {len(batch)} queued messages: {e}")
+            error = e
+        elapsed = time.perf_counter() - start
+        if elapsed > 0:
+            rate = len(batch) / elapsed
+            self._throughput = rate if self._throughput is None else 0.8 * self._throughput + 0.2 * rate
+        metrics.ingest_queue_depth.set(self._queue.qsize())
+        for _, written in batch:
+            written.finish(error)
+
+class AdmissionControl:
+    """Decides whether a post is read, rate limited or shed"""
+
+    def __init__(self, limiter, ingest, max_bytes, webhook_max_bytes=0):
+        self.limiter = limiter
+        self.ingest = ingest
+        self.max_bytes = max_bytes
+        self.webhook_max_bytes = webhook_max_bytes
+
+    @classmethod
+    def from_settings(cls, settings, handler):
+        return cls(
+            RateLimiter(settings.post_rate_per_minute, settings.post_burst),
+            IngestQueue(handler, maxsize=settings.ingest_queue_size),
+            settings.max_message_bytes,
+            settings.webhook_max_bytes
+        )
+
+    def check(self, client, content_length):
+        """None when the body may be read, else (status, reason, retry_after or None)"""
+        rejection = self._check(client, content_length, self.max_bytes)
+        if rejection is None and self.ingest.full():
+            return self.shed()
+        return rejection
+
+    def check_webhook(self, client, content_length):
+        """Like check, for a webhook delivery: read before its signature is
+        verified, so it is size checked and rate limited the same way"""
+        return self._check(client, content_length, self.webhook_max_bytes)
+
+    def wait(self, written, timeout):
+        """None once a submitted post is written, else (status, reason, retry_after or None)"""
+        if not written.wait(timeout):
+            return self._reject(503, 'write_timeout', self.ingest.retry_after())
+        if written.error is not None:
+            return self._reject(500, 'write_failed')
+        return None
+
+    def shed(self):
+        """Rejection for a post that found the ingest queue full"""
+        return self._reject(503, 'queue_full', self.ingest.retry_after())
+
+    def _check(self, client, content_length, max_bytes):
+        try:
+            length = int(content_length)
+        except (TypeError, ValueError):
+            return self._reject(411, 'no_length')
+        if length < 0:
+            return self._reject(400, 'bad_length')
+        if max_bytes and length > max_bytes:
+            return self._reject(413, 'too_large')
+        wait = self.limiter.check(client)
+        if wait:
+            return self._reject(429, 'rate_limited', math.ceil(wait))
+        return None
+
+    def _reject(self, status, reason, retry_after=None):
+        metrics.post_rejections.inc(reason=reason)
+        return status, reason, retry_after
+
+def reject(handler, status, reason, retry_after=None):
+    """Answer a request turned away by admission control with a short text body"""
+    logger.warning(f"Rejected request: {reason}", extra={'client': handler.client_address[0], 'status': status})
+    body = f"{reason}\n".encode()
+    # The unread body is left behind, so the connection cannot be reused
+    handler.close_connection = True
+    handler.send_response(status)
+    if retry_after is not None:
+        handler.send_header('Retry-After', str(retry_after))
+    handler.send_header('Content-Type', 'text/plain')
+    handler.send_header('Content-Length', str(len(body)))
+    handler.send_header('Connection', 'close')
+    handler.end_headers()
+    handler.wfile.write(body)
@@ -0,0 +1,174 @@
+# author_registry.py
+"""How each author is shown, computed once and kept up to date.
+
+Every author has an entry holding a display name (whitespace collapsed,
+``Anonymous`` when blank), an escaped copy of it, a color picked by
+hashing the name, whether it is a system author, and how many messages it
+has. A color depends only on its author, so adding an author never shifts
+anyone else's and rendered fragments stay valid. Formatting a message is a
+dictionary lookup by its raw author string.
+
+Like the search index, the registry is a journaled JSON index of count
+changes. Messages posted here are remembered until a sync finds them in
+the listing, so their authors' counts survive syncs in between.
+"""
+import html
+import hashlib
+from collections import Counter
+from journaled_index import JournaledIndex
+from logger import get_logger
+from message import SYSTEM_AUTHORS
+
+logger = get_logger(__name__)
+
+ANONYMOUS = 'Anonymous'
+AUTHOR_COLORS = (
+    'bg-blue-100', 'bg-green-100', 'bg-yellow-100',
+    'bg-purple-100', 'bg-pink-100', 'bg-indigo-100'
+)
+SYSTEM_COLOR = 'bg-gray-100'
+
+def display_name(author):
+    """Author name as shown: whitespace collapsed, Anonymous when blank"""
+    return ' '.join((author or '').split()) or ANONYMOUS
+
+def author_key(author):
+    """Key an author is registered under; names differing only in case or spacing match"""
+    return display_name(author).casefold()
+
+class AuthorRegistry(JournaledIndex):
+    kind = 'author registry'
+
+    def __len__(self):
+        return len(self.authors)
+
+    def lookup(self, author):
+        """Entry for an author; authors without messages get one that is not stored"""
+        entry = self._entries.get(author)
+        if entry is None:
+            with self.lock:
+                key = author_key(author)
+                entry = self.authors.get(key) or self._new_entry(author)
+                self._entries[author] = entry
+        return entry
+
+    def present(self, messages):
+        """Set each message's color and displayed author name"""
+        self.refresh()
+        for msg in messages:
+            entry = self.lookup(msg.author)
+            msg.present(entry['color'], entry['name_html'])
+        return messages
+
+    def add_messages(self, messages, local=False):
+        """Count new messages, journaling the change; local marks messages posted here"""
+        messages = list(messages)
+        posted = {msg.key: author_key(msg.author) for msg in messages} if local else {}
+        self.update(Counter(msg.author for msg in messages), posted=posted)
+
+    def update(self, deltas, posted=None, published=()):
+        """Adjust message counts by {author: delta}, journaling the change.
+
+        posted maps keys of messages posted here to their author keys;
+        published lists keys of messages now in the listing, which stop
+        being counted as posted here.
+        """
+        counts = Counter()
+        for author, delta in deltas.items():
+            counts[author_key(author)] += delta
+        with self._writing(), self.lock:
+            published = [key for key in published if key in self.local_posts]
+            # Already counted when they were posted
+            for key in published:
+                counts[self.local_posts[key]] -= 1
+            counts = {key: delta for key, delta in counts.items() if delta}
+            if not counts and not posted and not published:
+                return
+            names = {author_key(author): author for author in deltas}
+            change = {'counts': counts, 'names': {key: names[key] for key in counts if key in names and key not in self.authors}}
+            if posted:
+                change['posted'] = posted
+            if published:
+                change['published'] = published
+            self._journal(change)
+            self._apply(change)
+        self._compact()
+
+    def sync(self, messages):
+        """Recount from a full message listing; returns how many authors changed.
+
+        Messages posted here that are not in the listing yet keep counting.
+        """
+        counts = Counter()
+        names = {}
+        seen = set()
+        for msg in messages:
+            key = author_key(msg.author)
+            counts[key] += 1
+            names.setdefault(key, msg.author)
+            seen.add(msg.key)
+        with self._writing():
+            with self.lock:
+                published = [key for key in self.local_posts if key in seen]
+                for key in published:
+                    del self.local_posts[key]
+                for key in self.local_posts.values():
+                    counts[key] += 1
+                changed = 0
+                for key in set(self.authors) | set(counts):
+                    entry = self.authors.get(key)
+                    if entry is None:
+                        entry = self.authors[key] = self._new_entry(names.get(key, key))
+                    elif entry['count'] == counts[key]:
+                        continue
+                    entry['count'] = counts[key]
+                    changed += 1
+                self._entries = {}
+            # Authors with no messages left keep their entry, and so their color
+            if changed or published or self.journaled:
+                self.save()
+        return changed
+
+    def _reset(self):
+        # author_key -> {'name', 'name_html', 'color', 'system', 'count'}
+        self.authors = {}
+        # Message.key of a message posted here and not in the listing yet -> its author_key
+        self.local_posts = {}
+        # Raw author string -> its entry, so lookups skip normalizing
+        self._entries = {}
+
+    def _restore(self, data):
+        self.authors = data.get('authors', {})
+        self.local_posts = data.get('local_posts', {})
+        self._entries = {}
+
+    def _snapshot(self):
+        return {
+            'authors': {key: dict(entry) for key, entry in self.authors.items()},
+            'local_posts': dict(self.local_posts),
+        }
+
+    def _replay(self, change):
+        self._apply(change)
+
+    def _apply(self, change):
+        for key, delta in change['counts'].items():
+            entry = self.authors.get(key)
+            if entry is None:
+                entry = self.authors[key] = self._new_entry(change['names'].get(key, key))
+            entry['count'] = max(entry['count'] + delta, 0)
+        self.local_posts.update(change.get('posted', {}))
+        for key in change.get('published', ()):
+            self.local_posts.pop(key, None)
+        # Cached lookups may point at entries that were just created
+        self._entries = {}
+
+    def _new_entry(self, author):
+        name = display_name(author)
+        system = name.casefold() in SYSTEM_AUTHORS
+        if system:
+            color = SYSTEM_COLOR
+        else:
+            digest = hashlib.sha256(name.casefold().encode()).digest()
+            color = AUTHOR_COLORS[int.from_bytes(digest[:4], 'big') % len(AUTHOR_COLORS)]
+        return {'name': name, 'name_html': html.escape(name), 'color': color, 'system': system, 'count': 0}
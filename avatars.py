@@ -0,0 +1,168 @@
+# avatars.py
+"""GitHub avatars of message authors, cached on disk.
+
+Layout under ``cache_dir/avatars``::
+
+    index.json      author -> avatar URL, ETag, content type, size, last use
+    <key>.img       image bytes, <key> being avatar_key(author)
+
+Avatars are fetched in the background of a sync, several at a time, at
+thumbnail size, and revalidated with their ETag once they are older than
+`max_age`. Pages link ``/avatar/<key>``, which is answered from disk; an
+author without a cached avatar (never fetched, or offline) gets a
+generated placeholder. The least recently used images are evicted once
+the cache grows past `max_bytes`.
+"""
+import os
+import json
+import html
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+PLACEHOLDER_COLORS = ('#93c5fd', '#86efac', '#fde68a', '#c4b5fd', '#f9a8d4', '#a5b4fc')
+
+@lru_cache(maxsize=4096)
+def avatar_key(author):
+    """Stable file and URL name for an author's avatar"""
+    return hashlib.sha256(author.casefold().encode()).hexdigest()[:16]
+
+def placeholder_svg(author):
+    """Initial on a colored circle, for authors without a cached avatar"""
+    digest = int(avatar_key(author), 16) if author else 0
+    color = PLACEHOLDER_COLORS[digest % len(PLACEHOLDER_COLORS)]
+    initial = html.escape(author.strip()[:1].upper())
+    return (
+        '<svg xmlns="http://www.w3.org/2000/svg" width="64" height="64" viewBox="0 0 64 64">'
+        f'<circle cx="32" cy="32" r="32" fill="{color}"/>'
+        '<text x="32" y="42" font-family="sans-serif" font-size="28" text-anchor="middle" '
+        f'fill="#1f2937">{initial}</text></svg>'
+    ).encode()
+
+class AvatarCache:
+    def __init__(self, directory, size=64, max_bytes=5 * 1024 * 1024, max_age=86400, workers=8):
+        self.directory = Path(directory)
+        self.size = size
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.workers = workers
+        self._lock = threading.Lock()
+        # avatar_key(author) -> entry; see the module docstring
+        self.entries = self._load()
+
+    def register(self, authors):
+        """Record {author: avatar URL} pairs seen in commits; returns how many were new or changed"""
+        changed = 0
+        with self._lock:
+            for author, url in authors.items():
+                key = avatar_key(author)
+                entry = self.entries.get(key)
+                if entry is None or entry['url'] != url:
+                    self.entries[key] = {'author': author, 'url': url, 'etag': None, 'content_type': None,
+                                         'size': 0, 'fetched': 0, 'used': 0}
+                    changed += 1
+        if changed:
+            self.save()
+        return changed
+
+    def refresh(self):
+        """Fetch avatars that are missing or stale, concurrently; returns how many were downloaded"""
+        now = time.time()
+        with self._lock:
+            due = [key for key, entry in self.entries.items() if now - entry['fetched'] >= self.max_age]
+        if not due:
+            return 0
+        import requests
+        session = requests.Session()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='avatar-fetch') as pool:
+            downloaded = sum(pool.map(lambda key: self._fetch(session, key), due))
+        self._evict()
+        self.save()
+        logger.info(f"Refreshed {len(due)} avatars, {downloaded} downloaded")
+        return downloaded
+
+    def get(self, key):
+        """(image bytes, content type) of a cached avatar, or None"""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or not entry['size']:
+                return None
+            entry['used'] = time.time()
+            content_type = entry['content_type']
+        try:
+            return (self.directory / f'{key}.img').read_bytes(), content_type
+        except FileNotFoundError:
+            return None
+
+    def placeholder(self, key):
+        """Placeholder image for an avatar that is not cached"""
+        entry = self.entries.get(key)
+        return placeholder_svg(entry['author'] if entry else '')
+
+    def save(self):
+        with self._lock:
+            data = json.dumps(self.entries, separators=(',', ':'))
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.directory / f'.index.json.{os.getpid()}.{threading.get_ident()}'
+        tmp.write_text(data)
+        os.replace(tmp, self.directory / 'index.json')
+
+    def _load(self):
+        try:
+            with open(self.directory / 'index.json') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError as e:
+            logger.warning(f"Ignoring unreadable avatar index: {e}")
+            return {}
+
+    def _fetch(self, session, key):
+        with self._lock:
+            entry = dict(self.entries[key])
+        headers = {'If-None-Match': entry['etag']} if entry['etag'] and entry['size'] else {}
+        separator = '&' if '?' in entry['url'] else '?'
+        try:
+            # GitHub scales avatars server side, so only the thumbnail is downloaded
+            response = session.get(f"{entry['url']}{separator}s={self.size}", headers=headers, timeout=10)
+            if response.status_code == 304:
+                updates = {'fetched': time.time()}
+            else:
+                response.raise_for_status()
+                path = self.directory / f'{key}.img'
+                self.directory.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_name(f'.{path.name}.{threading.get_ident()}')
+                tmp.write_bytes(response.content)
+                os.replace(tmp, path)
+                updates = {
+                    'etag': response.headers.get('ETag'),
+                    'content_type': response.headers.get('Content-Type', 'image/png'),
+                    'size': len(response.content),
+                    'fetched': time.time(),
+                }
+        except Exception as e:
+            # Keep serving the old image (or the placeholder) and try again next sync
+            logger.warning(f"Could not fetch avatar for {entry['author']}: {e}")
+            return 0
+        with self._lock:
+            if key in self.entries:
+                self.entries[key].update(updates)
+        return int('size' in updates)
+
+    def _evict(self):
+        with self._lock:
+            cached = sorted((e['used'] or e['fetched'], key) for key, e in self.entries.items() if e['size'])
+            total = sum(self.entries[key]['size'] for _, key in cached)
+            for _, key in cached:
+                if total <= self.max_bytes:
+                    break
+                total -= self.entries[key]['size']
+                # Not fetched again before max_age, so a small cache does not thrash
+                self.entries[key].update(size=0, etag=None)
+                (self.directory / f'{key}.img').unlink(missing_ok=True)
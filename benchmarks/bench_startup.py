@@ -0,0 +1,102 @@
+# benchmarks/bench_startup.py
+"""CLI startup regression benchmark.
+
+Measures `import cli` with `python -X importtime` and the wall time of
+scripted `cli send` runs, and fails if modules that `send` should never
+load (requests, the cache layer, ...) show up in its import graph.
+
+    python benchmarks/bench_startup.py --runs 20 --output startup.json
+    python benchmarks/bench_startup.py --baseline startup.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Modules that must not be imported just to send a message
+FORBIDDEN_FOR_SEND = ['requests', 'chat_system', 'github_client', 'cache_manager', 'search_index']
+
+def parse_importtime(stderr):
+    """Return {module: cumulative_us} from -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+        modules[name.strip()] = int(cumulative_us)
+    return modules
+
+def run_importtime(code, cwd):
+    """Run code under -X importtime and return per-module timings"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=cwd, capture_output=True, text=True,
+        env={**os.environ, 'PYTHONPATH': str(REPO_ROOT)}
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr[-2000:])
+    return parse_importtime(result.stderr)
+
+def time_send(runs, cwd):
+    """Wall time of `cli send` runs in seconds"""
+    timings = []
+    for i in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, str(REPO_ROOT / 'cli.py'), 'send', '--filename', f'bench_{i}', 'benchmark message'],
+            cwd=cwd, check=True, capture_output=True,
+            env={**os.environ, 'PYTHONPATH': str(REPO_ROOT)}
+        )
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CLI startup time.")
+    parser.add_argument('--runs', type=int, default=10, help='Number of `cli send` runs (default: 10)')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against a previous JSON result')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown against the baseline (default: 0.25)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        send_code = (
+            "import sys; sys.argv = ['cli', 'send', '--filename', 'bench_import', 'x']\n"
+            "import cli\n"
+            "try:\n    cli.cli()\nexcept SystemExit:\n    pass"
+        )
+        cli_modules = run_importtime('import cli', workdir)
+        send_modules = run_importtime(send_code, workdir)
+        send_times = time_send(args.runs, workdir)
+
+    results = {
+        'import_cli_us': cli_modules.get('cli', 0),
+        'send_import_total_us': sum(us for name, us in send_modules.items() if '.' not in name),
+        'send_median_s': statistics.median(send_times),
+        'send_min_s': min(send_times),
+        'forbidden_imports': [m for m in FORBIDDEN_FOR_SEND if m in send_modules],
+    }
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+    failed = bool(results['forbidden_imports'])
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        for key in ('import_cli_us', 'send_median_s'):
+            limit = baseline[key] * (1 + args.tolerance)
+            if results[key] > limit:
+                print(f"Regression: {key} {results[key]} > {limit:.6g}", file=sys.stderr)
+                failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
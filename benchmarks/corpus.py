@@ -0,0 +1,43 @@
+# benchmarks/corpus.py
+"""Deterministic synthetic message corpora for benchmarks."""
+import os
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+from message import Message
+
+WORDS = (
+    "banana chat hello world github message cache render commit push pull "
+    "thanks ok test anything another readme python server index search fast "
+    "slow latency the a and to of is it in that for on with"
+).split()
+
+AUTHORS = [f"user{i}" for i in range(40)] + ["system", "admin"]
+
+START = datetime(2024, 1, 1)
+
+def make_messages(count, seed=0):
+    """Return `count` messages with stable content, authors and dates"""
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        words = rng.choices(WORDS, k=rng.randint(3, 40))
+        messages.append(Message(
+            f'msg_{i:07d}.txt',
+            ' '.join(words),
+            rng.choice(AUTHORS),
+            START + timedelta(seconds=i * 37 + rng.randint(0, 30)),
+            f'{rng.getrandbits(160):040x}'
+        ))
+    return messages
+
+def write_messages_dir(messages, messages_dir):
+    """Write messages as .txt files, setting mtimes to the message dates"""
+    messages_dir = Path(messages_dir)
+    messages_dir.mkdir(parents=True, exist_ok=True)
+    for msg in messages:
+        path = messages_dir / msg.filename
+        path.write_text(msg.content)
+        timestamp = msg.date.timestamp()
+        os.utime(path, (timestamp, timestamp))
+    return messages_dir
@@ -0,0 +1,255 @@
+# benchmarks/run.py
+"""Benchmark suite for the sync, cache, render and serve paths.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --sizes 1000 --baseline results.json
+
+Each benchmark runs against a synthetic corpus in a temporary directory and
+reports the best of --repeat runs. The default sizes are 1k, 10k and 100k
+messages; the 100k corpus takes several minutes, so pass --sizes for a
+quick check. With --baseline, any benchmark slower
+than the baseline by more than --tolerance fails the run.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import functools
+import threading
+import urllib.parse
+import urllib.request
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from corpus import make_messages, write_messages_dir
+from fake_github import start_fake_github
+
+def best_of(repeat, func, setup=None):
+    """Return the fastest of `repeat` timed calls to func"""
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def bench_cache(messages, workdir, repeat):
+    from cache_manager import CacheManager
+    cache_dir = workdir / 'cache'
+    cache = CacheManager(cache_dir)
+    metadata = [{
+        'filename': msg.filename,
+        'author': msg.author,
+        'date': msg.date.isoformat(),
+        'commit_hash': msg.commit_hash
+    } for msg in messages]
+
+    def save():
+        for msg in messages:
+            cache.save_message(msg.filename, msg.content)
+        cache.save_metadata(metadata)
+
+    return {
+        'cache_save_message': best_of(repeat, save, cache.clear),
+        'cache_get_messages': best_of(repeat, cache.get_messages),
+    }
+
+def bench_update_cache(messages, workdir, repeat):
+    from chat_system import ChatSystem
+    from github_client import GitHubClient
+    server, base_url = start_fake_github(messages)
+    try:
+        # The cache and the indexes beside it live under workdir; see run_size
+        chat = ChatSystem('token', 'fake', 'bananachat')
+        chat._github = GitHubClient('token', 'fake', 'bananachat', api_url=base_url)
+        return {'chat_update_cache': best_of(repeat, chat.update_cache)}
+    finally:
+        server.shutdown()
+
+def bench_render(messages, workdir, repeat):
+    from html_generator import HtmlGenerator
+    from message_formatter import MessageFormatter
+    from template_manager import TemplateManager
+    generator = HtmlGenerator()
+    generator.messages_dir = workdir / 'messages'
+    formatter = MessageFormatter()
+    formatted = formatter.format_messages(messages)
+    template = TemplateManager()
+    return {
+        'html_generate': best_of(repeat, generator.generate_html),
+        'formatter_format_messages': best_of(repeat, lambda: formatter.format_messages(messages)),
+        'template_render': best_of(repeat, lambda: template.render(
+            title='BananaChat', messages=formatted, last_updated='2024-01-01 00:00:00'
+        )),
+    }
+
+def _serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_address[1]}'
+
+def _throughput(base_url, requests):
+    """Return (GET seconds, POST seconds) for `requests` of each"""
+    class NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+    opener = urllib.request.build_opener(NoRedirect)
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        opener.open(f'{base_url}/').read()
+    get_seconds = time.perf_counter() - start
+
+    body = urllib.parse.urlencode({'message': 'benchmark post'}).encode()
+    start = time.perf_counter()
+    for _ in range(requests):
+        try:
+            opener.open(urllib.request.Request(f'{base_url}/', data=body)).read()
+        except urllib.error.HTTPError as e:
+            if e.code != 303:
+                raise
+    post_seconds = time.perf_counter() - start
+    return get_seconds, post_seconds
+
+def bench_serve(messages, workdir, requests):
+    from http.server import HTTPServer
+    import server as legacy_server
+    from admission import RateLimiter
+    from request_handler import ChatRequestHandler, WorkerPoolHTTPServer
+    from html_generator import HtmlGenerator
+
+    results = {}
+    class QuietLegacyHandler(legacy_server.ChatRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    legacy_server.generate_chat_html()
+    # All requests come from one address; measure throughput, not the rate limit
+    legacy_server.admission.limiter = RateLimiter(0, 1)
+    legacy_server.admission.ingest.start()
+    httpd = HTTPServer(('127.0.0.1', 0), QuietLegacyHandler)
+    try:
+        get_s, post_s = _throughput(_serve(httpd), requests)
+        results['server_get_rps'] = requests / get_s
+        results['server_post_rps'] = requests / post_s
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        legacy_server.admission.ingest.stop()
+
+    handler = functools.partial(ChatRequestHandler, html_generator=HtmlGenerator())
+    httpd = WorkerPoolHTTPServer(('127.0.0.1', 0), handler, workers=4)
+    try:
+        get_s, post_s = _throughput(_serve(httpd), requests)
+        results['request_handler_get_rps'] = requests / get_s
+        results['request_handler_post_rps'] = requests / post_s
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+    return results
+
+def run_size(size, args):
+    messages = make_messages(size, seed=args.seed)
+    workdir = Path(tempfile.mkdtemp(prefix=f'bananachat-bench-{size}-'))
+    cwd = os.getcwd()
+    # Config, cache, indexes and avatars all resolve under workdir, so a
+    # run neither reads the user's settings nor writes to ~/.bananachat
+    env = {
+        'HOME': str(workdir / 'home'),
+        'BANANACHAT_CACHE_DIR': str(workdir / 'sync-cache'),
+        'BANANACHAT_AVATARS': 'false',
+    }
+    saved_env = {key: os.environ.get(key) for key in env}
+    os.environ.update(env)
+    try:
+        write_messages_dir(messages, workdir / 'messages')
+        shutil.copy(REPO_ROOT / 'style.css', workdir / 'style.css')
+        os.chdir(workdir)
+        results = {}
+        results.update(bench_cache(messages, workdir, args.repeat))
+        results.update(bench_update_cache(messages[:args.sync_limit], workdir, args.repeat))
+        results.update(bench_render(messages, workdir, args.repeat))
+        if not args.skip_serve:
+            results.update(bench_serve(messages, workdir, args.requests))
+        return results
+    finally:
+        os.chdir(cwd)
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def compare(results, baseline, tolerance):
+    """Return a list of regressions against a baseline result file"""
+    regressions = []
+    for size, current in results['results'].items():
+        previous = baseline.get('results', {}).get(size, {})
+        for name, value in current.items():
+            if name not in previous:
+                continue
+            # Throughput metrics regress when they drop, timings when they grow
+            if name.endswith('_rps'):
+                slower = value < previous[name] / (1 + tolerance)
+            else:
+                slower = value > previous[name] * (1 + tolerance)
+            if slower:
+                regressions.append(f"{name}[{size}]: {previous[name]:.6g} -> {value:.6g}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the BananaChat benchmark suite.")
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='Comma-separated corpus sizes (default: 1000,10000,100000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per benchmark, best is kept (default: 3)')
+    parser.add_argument('--requests', type=int, default=100, help='Requests per serve benchmark (default: 100)')
+    parser.add_argument('--sync-limit', type=int, default=1000,
+                        help='Maximum messages synced from the fake GitHub server (default: 1000)')
+    parser.add_argument('--skip-serve', action='store_true', help='Skip the HTTP server benchmarks')
+    parser.add_argument('--seed', type=int, default=0, help='Corpus random seed (default: 0)')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against a previous JSON result')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown (default: 0.2)')
+    args = parser.parse_args()
+
+    # Keep access logs out of the timings and off stdout, which carries the JSON
+    import logger
+    logging.getLogger('bananachat').setLevel(logging.WARNING)
+
+    results = {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': args.repeat,
+            'requests': args.requests,
+            'sync_limit': args.sync_limit,
+        },
+        'results': {},
+    }
+    for size in (int(s) for s in args.sizes.split(',')):
+        print(f"Running benchmarks for {size} messages...", file=sys.stderr)
+        results['results'][str(size)] = run_size(size, args)
+
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        Path(args.output).write_text(output)
+
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for line in regressions:
+            print(f"Regression: {line}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# cache_index.py
+"""Compact binary cache index that readers can mmap.
+
+Layout (little-endian)::
+
+    header   magic 'BCIX', version u16, reserved u16, sequence u64,
+             record count u32, strings offset u64
+    records  fixed-width, sorted by date:
+             date f64 (seconds since 1970-01-01, naive UTC),
+             filename, author, commit hash, content hash, blob sha as
+             (offset u32, length u32) into the strings section
+    strings  UTF-8 bytes
+
+Records are decoded on access straight from the mapping, so opening an
+index costs a stat and an mmap no matter how many messages it holds.
+"""
+import bisect
+import mmap
+import struct
+from datetime import datetime, timedelta
+
+MAGIC = b'BCIX'
+VERSION = 2
+HEADER = struct.Struct('<4sHHQIQ')
+RECORD = struct.Struct('<d' + 'II' * 5)
+EPOCH = datetime(1970, 1, 1)
+
+def to_epoch(date):
+    return (date - EPOCH).total_seconds()
+
+def from_epoch(seconds):
+    return EPOCH + timedelta(seconds=seconds)
+
+def write_index(path, metadata, sequence):
+    """Write metadata entries (dicts with ISO 'date') as a binary index"""
+    entries = sorted(
+        ((to_epoch(datetime.fromisoformat(m['date'])), m) for m in metadata),
+        key=lambda item: item[0]
+    )
+    strings = bytearray()
+    records = bytearray()
+
+    def add_string(value):
+        data = (value or '').encode()
+        offset = len(strings)
+        strings.extend(data)
+        return offset, len(data)
+
+    for date, meta in entries:
+        records += RECORD.pack(
+            date,
+            *add_string(meta['filename']),
+            *add_string(meta['author']),
+            *add_string(meta.get('commit_hash')),
+            *add_string(meta.get('content_hash')),
+            *add_string(meta.get('sha'))
+        )
+
+    strings_offset = HEADER.size + len(records)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, sequence, len(entries), strings_offset))
+        f.write(records)
+        f.write(strings)
+
+class IndexReader:
+    """Read-only, memory-mapped view of a binary cache index"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, self.sequence, self.count, self._strings = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f"Not a cache index (version {VERSION}): {path}")
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        """Return (date, filename, author, commit_hash, content_hash, sha) for record i"""
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        date, *spans = RECORD.unpack_from(self._map, HEADER.size + i * RECORD.size)
+        filename, author, commit_hash, body_hash, sha = (
+            self._string(spans[j], spans[j + 1]) for j in range(0, len(spans), 2)
+        )
+        return from_epoch(date), filename, author, commit_hash or None, body_hash or None, sha or None
+
+    def date_at(self, i):
+        return RECORD.unpack_from(self._map, HEADER.size + i * RECORD.size)[0]
+
+    def bisect_date(self, date):
+        """Index of the first record dated at or after date"""
+        target = to_epoch(date)
+        return bisect.bisect_left(range(self.count), target, key=self.date_at)
+
+    def close(self):
+        self._map.close()
+
+    def _string(self, offset, length):
+        start = self._strings + offset
+        return self._map[start:start + length].decode()
@@ -1,72 +1,539 @@
 # cache_manager.py
+import os
 import json
+import shutil
+import time
+import random
+import tempfile
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from logger import logger
+import metrics
+from cache_index import IndexReader, write_index
+from compression import Codec, train_dictionary
+from file_lock import FileLock
+from logger import get_logger
+from message import Message, content_hash
+
+logger = get_logger(__name__)
+
+# Field order of IndexReader records
+INDEX_FIELDS = ('date', 'filename', 'author', 'commit_hash', 'content_hash', 'sha')
+
+def _fsync_path(path, directory=False):
+    flags = os.O_RDONLY | (getattr(os, 'O_DIRECTORY', 0) if directory else 0)
+    try:
+        fd = os.open(path, flags)
+    except OSError:
+        # Directories cannot be opened for fsync on every platform
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+# Suffix of blobs compressed with a shared dictionary
+COMPRESSED_SUFFIX = '.z'
+# Bodies sampled to train a compression dictionary
+DICTIONARY_SAMPLES = 5000
+# Distinct bodies remembered while reading; repeats are usually close together
+BODY_MEMO_SIZE = 4096
+
+def blob_path(blobs_dir, digest):
+    """Where the body with the given content hash is stored"""
+    return Path(blobs_dir) / digest[:2] / digest
+
+def _write_atomic(path, data):
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}')
+    with open(tmp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+class CacheSnapshot:
+    """A cache generation being built in a staging directory.
+
+    Nothing written here is visible to readers until the snapshot is
+    committed by CacheManager, which swaps the `CURRENT` pointer to it.
+    Message bodies go to the shared blob store, keyed by content hash, so
+    a body is stored once no matter how many messages or generations use it.
+    """
+
+    def __init__(self, path, blobs_dir, base_metadata=None):
+        self.path = Path(path)
+        self.blobs_dir = Path(blobs_dir)
+        self.metadata_dir = self.path / 'metadata'
+        self.metadata_dir.mkdir(parents=True, exist_ok=True)
+        self._written = []
+        self._dirs = set()
+        self.metadata = base_metadata
+        # filename -> content hash of bodies saved into this snapshot
+        self._hashes = {m['filename']: m.get('content_hash') for m in base_metadata or []}
+
+    def save_message(self, filename, content):
+        """Store a message body, returning its content hash"""
+        digest = content_hash(content)
+        path = blob_path(self.blobs_dir, digest)
+        if not path.exists() and not path.with_name(digest + COMPRESSED_SUFFIX).exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f'.{digest}.{os.getpid()}')
+            tmp.write_text(content)
+            os.replace(tmp, path)
+            self._written.append(path)
+            self._dirs.add(path.parent)
+        self._hashes[filename] = digest
+        return digest
+
+    def delete_message(self, filename):
+        self._hashes.pop(filename, None)
+        if self.metadata is not None:
+            self.metadata = [m for m in self.metadata if m['filename'] != filename]
+
+    def save_metadata(self, metadata):
+        """Write the metadata index for the snapshot"""
+        for meta in metadata:
+            if not meta.get('content_hash'):
+                meta['content_hash'] = self._hashes.get(meta['filename'])
+        path = self.metadata_dir / 'index.json'
+        with open(path, 'w') as f:
+            json.dump(metadata, f, default=str, separators=(',', ':'))
+        self._written.append(path)
+        self.metadata = metadata
+
+    def write_index(self, sequence):
+        """Write the binary index for readers, stamped with the generation number"""
+        path = self.metadata_dir / 'index.bin'
+        write_index(path, self.metadata or [], sequence)
+        self._written.append(path)
+
+    def fsync(self):
+        """Flush every written file and directory to disk"""
+        for path in self._written:
+            _fsync_path(path)
+        for directory in (*self._dirs, self.metadata_dir, self.path):
+            _fsync_path(directory, directory=True)
 
 class CacheManager:
-    def __init__(self, cache_dir):
+    """On-disk message cache made of immutable, versioned generations.
+
+    Layout::
+
+        cache_dir/CURRENT                      name of the live generation
+        cache_dir/blobs/<hh>/<hash>            message bodies, by content hash
+        cache_dir/blobs/<hh>/<hash>.z          cold bodies, compressed
+        cache_dir/dicts/<id>.zdict             shared compression dictionaries
+        cache_dir/generations/<seq>/metadata/  index.json and index.bin
+
+    Writers build a new generation in a staging directory and atomically
+    replace CURRENT; readers resolve CURRENT once per read, so they never
+    see a partially written cache. The newest `keep_generations` are kept
+    for rollback and for readers still holding an older generation; blobs
+    no kept generation refers to are removed when old ones are pruned.
+
+    With compression on, every body except those of the newest
+    `hot_messages` messages is stored zlib-compressed against a shared
+    dictionary trained on the cache's own messages; recent messages stay
+    plain so the common "latest messages" reads never decompress.
+
+    Writers in any process are serialized by an flock on cache_dir/.lock,
+    held from begin_snapshot until commit or abort. Readers take no lock:
+    they map the generation's binary index, and use sequence() (the
+    generation number) to notice when a newer one has been published.
+    """
+
+    def __init__(self, cache_dir, keep_generations=3, compress=False, hot_messages=1000):
         self.cache_dir = Path(cache_dir)
-        self.messages_cache = self.cache_dir / 'messages'
-        self.metadata_cache = self.cache_dir / 'metadata'
-        
+        self.generations_dir = self.cache_dir / 'generations'
+        self.blobs_dir = self.cache_dir / 'blobs'
+        self.dicts_dir = self.cache_dir / 'dicts'
+        self.compress = compress
+        self.hot_messages = hot_messages
+        self._codec = None
+        self.pointer = self.cache_dir / 'CURRENT'
+        self.keep_generations = max(keep_generations, 1)
+        self.lock = FileLock(self.cache_dir / '.lock')
+        self._pending = None
+        self._reader = None
+        self._reader_generation = None
+
         # Create cache directories
-        self.cache_dir.mkdir(parents=True, exist_ok=True)
-        self.messages_cache.mkdir(exist_ok=True)
-        self.metadata_cache.mkdir(exist_ok=True)
+        self.generations_dir.mkdir(parents=True, exist_ok=True)
+
+    def current_generation(self):
+        """Return the live generation directory, or None if the cache is empty"""
+        try:
+            name = self.pointer.read_text().strip()
+        except FileNotFoundError:
+            return None
+        path = self.generations_dir / name
+        return path if path.is_dir() else None
+
+    def sequence(self):
+        """Change sequence number: the live generation's number, 0 if empty"""
+        generation = self.current_generation()
+        return int(generation.name) if generation else 0
+
+    def open_index(self):
+        """Memory-mapped index of the live generation, reopened only when it changes"""
+        generation = self.current_generation()
+        if generation is None:
+            return None
+        if generation != self._reader_generation:
+            index_path = generation / 'metadata' / 'index.bin'
+            if not index_path.exists():
+                return None
+            try:
+                reader = IndexReader(index_path)
+            except ValueError:
+                # Written by an older version; readers use index.json instead
+                return None
+            # The old reader is not closed: other threads and lazy iterators
+            # may still be reading it; its map is released once they are done
+            self._reader = reader
+            self._reader_generation = generation
+        return self._reader
+
+    @property
+    def codec(self):
+        """Codec loaded with every dictionary in the cache"""
+        if self._codec is None:
+            self._codec = Codec()
+            self._load_dictionaries()
+        return self._codec
+
+    def read_blob(self, digest):
+        """Return the body stored under a content hash, decompressing cold ones"""
+        path = blob_path(self.blobs_dir, digest)
+        try:
+            return path.read_text()
+        except FileNotFoundError:
+            data = path.with_name(digest + COMPRESSED_SUFFIX).read_bytes()
+        try:
+            return self.codec.decompress(data).decode()
+        except KeyError:
+            # Trained by another process since the dictionaries were loaded
+            self._load_dictionaries()
+            return self.codec.decompress(data).decode()
+
+    def generations(self):
+        """Committed generation directories, oldest first"""
+        return sorted(
+            (p for p in self.generations_dir.iterdir() if p.is_dir() and p.name.isdigit()),
+            key=lambda p: int(p.name)
+        )
+
+    def begin_snapshot(self, incremental=False):
+        """Start a new generation in a staging directory.
+
+        With incremental=True the snapshot starts from the current
+        generation's metadata; its bodies are already in the blob store.
+        """
+        self.lock.acquire()
+        try:
+            base = None
+            if incremental:
+                base = self._read_metadata(self.current_generation()) or []
+            staging = tempfile.mkdtemp(dir=self.generations_dir, prefix='.staging-')
+            return CacheSnapshot(staging, self.blobs_dir, base_metadata=base)
+        except BaseException:
+            self.lock.release()
+            raise
+
+    @contextmanager
+    def snapshot(self, incremental=False):
+        """Build a new generation and publish it when the block succeeds"""
+        snap = self.begin_snapshot(incremental)
+        try:
+            yield snap
+        except BaseException:
+            self.abort(snap)
+            raise
+        self.commit(snap)
 
     def save_message(self, filename, content):
-        """Save a message to cache"""
+        """Stage a message for the next generation, published by save_metadata"""
         try:
-            cache_path = self.messages_cache / filename
-            cache_path.write_text(content)
+            if self._pending is None:
+                self._pending = self.begin_snapshot()
+            self._pending.save_message(filename, content)
         except Exception as e:
             logger.error(f"Error saving message to cache: {e}")
             raise
 
     def save_metadata(self, metadata):
-        """Save metadata index"""
+        """Save metadata index and publish the staged generation"""
+        snap, self._pending = self._pending or self.begin_snapshot(), None
         try:
-            with open(self.metadata_cache / 'index.json', 'w') as f:
-                json.dump(metadata, f, indent=2, default=str)
-            
-            with open(self.cache_dir / 'last_update', 'w') as f:
-                f.write(datetime.now().isoformat())
+            snap.save_metadata(metadata)
         except Exception as e:
+            self.abort(snap)
             logger.error(f"Error saving metadata: {e}")
             raise
+        try:
+            self.commit(snap)
+        except Exception as e:
+            logger.error(f"Error publishing cache generation: {e}")
+            raise
+
+    def get_messages(self, limit=None, since=None):
+        """Get cached messages with metadata, oldest first.
 
-    def get_messages(self):
-        """Get all cached messages with metadata"""
+        With limit and/or since only the newest limit messages dated at or
+        after since are read; the binary index is sorted by date, so this
+        costs a bisect rather than a pass over the whole history.
+        """
         try:
-            if not (self.metadata_cache / 'index.json').exists():
-                return []
-                
-            with open(self.metadata_cache / 'index.json') as f:
-                metadata = json.load(f)
-                
-            messages = []
-            for meta in metadata:
-                msg_path = self.messages_cache / meta['filename']
-                if msg_path.exists():
-                    messages.append({
-                        'filename': meta['filename'],
-                        'content': msg_path.read_text(),
-                        'author': meta['author'],
-                        'date': datetime.fromisoformat(meta['date'])
-                    })
-            return messages
+            return list(self.iter_messages(limit, since))
         except Exception as e:
             logger.error(f"Error reading cache: {e}")
             return []
 
+    def iter_messages(self, limit=None, since=None):
+        """Yield cached messages oldest first, reading each body as it is reached.
+
+        Unlike get_messages nothing is collected, so a caller streaming the
+        whole history holds one message at a time. Errors are raised.
+        """
+        generation = self.current_generation()
+        reader = self.open_index()
+        if reader is not None:
+            metrics.cache_lookups.inc(cache='index', result='hit')
+            start = reader.bisect_date(since) if since is not None else 0
+            if limit is not None:
+                start = max(start, len(reader) - limit)
+            entries = (
+                dict(zip(INDEX_FIELDS, reader[i]))
+                for i in range(start, len(reader))
+            )
+        else:
+            # Caches written before generations existed keep their flat layout
+            generation = generation or self.cache_dir
+            index_path = generation / 'metadata' / 'index.json'
+            if not index_path.exists():
+                metrics.cache_lookups.inc(cache='index', result='miss')
+                return
+            metrics.cache_lookups.inc(cache='index', result='hit')
+            with open(index_path) as f:
+                entries = [
+                    {**meta, 'date': datetime.fromisoformat(meta['date'])}
+                    for meta in json.load(f)
+                ]
+            entries.sort(key=lambda meta: meta['date'])
+            if since is not None:
+                entries = [meta for meta in entries if meta['date'] >= since]
+            if limit is not None:
+                entries = entries[max(len(entries) - limit, 0):]
+
+        bodies = {}
+        for meta in entries:
+            digest = meta.get('content_hash')
+            content = bodies.get(digest)
+            if content is None:
+                # Generations from before the blob store keep bodies by filename
+                try:
+                    if digest:
+                        content = self.read_blob(digest)
+                    else:
+                        content = (generation / 'messages' / meta['filename']).read_text()
+                except FileNotFoundError:
+                    metrics.cache_lookups.inc(cache='messages', result='miss')
+                    continue
+                if digest:
+                    if len(bodies) >= BODY_MEMO_SIZE:
+                        bodies.clear()
+                    bodies[digest] = content
+            metrics.cache_lookups.inc(cache='messages', result='hit')
+            yield Message(
+                meta['filename'],
+                content,
+                meta['author'],
+                meta['date'],
+                meta.get('commit_hash'),
+                meta.get('sha')
+            )
+
+    def rollback(self):
+        """Point CURRENT back at the previous generation"""
+        with self.lock:
+            current = self.current_generation()
+            older = [g for g in self.generations() if current is None or int(g.name) < int(current.name)]
+            if not older:
+                raise RuntimeError("No older cache generation to roll back to")
+            self._swap(older[-1].name)
+            return older[-1].name
+
     def clear(self):
-        """Clear the cache"""
+        """Clear the cache by publishing an empty generation"""
         try:
-            for file in self.messages_cache.glob('*.txt'):
-                file.unlink()
-            if (self.metadata_cache / 'index.json').exists():
-                (self.metadata_cache / 'index.json').unlink()
+            with self.snapshot() as snap:
+                snap.save_metadata([])
         except Exception as e:
             logger.error(f"Error clearing cache: {e}")
             raise
+
+    def commit(self, snap):
+        """Flush a snapshot to disk and make it the live generation"""
+        try:
+            existing = self.generations()
+            sequence = int(existing[-1].name) + 1 if existing else 1
+            snap.write_index(sequence)
+            snap.fsync()
+
+            name = f'{sequence:08d}'
+            os.rename(snap.path, self.generations_dir / name)
+            _fsync_path(self.generations_dir, directory=True)
+            self._swap(name)
+
+            with open(self.cache_dir / 'last_update', 'w') as f:
+                f.write(datetime.now().isoformat())
+            self._prune()
+            if self.compress:
+                try:
+                    self.compress_cold()
+                except Exception as e:
+                    # The generation is published; bodies just stay uncompressed
+                    logger.warning(f"Error compressing cold cache bodies: {e}")
+        except BaseException:
+            shutil.rmtree(snap.path, ignore_errors=True)
+            raise
+        finally:
+            self.lock.release()
+
+    def abort(self, snap):
+        """Discard a snapshot that will not be published"""
+        try:
+            shutil.rmtree(snap.path, ignore_errors=True)
+        finally:
+            self.lock.release()
+
+    def compress_cold(self, retrain=False):
+        """Compress bodies outside the newest hot_messages of the live generation.
+
+        The newest dictionary is reused unless retrain is set or none exists
+        yet; older dictionaries are kept for the blobs compressed with them.
+        Returns the number of blobs compressed.
+        """
+        with self.lock:
+            metadata = self._read_metadata(self.current_generation()) or []
+            metadata.sort(key=lambda meta: meta['date'])
+            split = max(len(metadata) - self.hot_messages, 0)
+            hot = {meta.get('content_hash') for meta in metadata[split:]}
+            cold = [
+                path for path in dict.fromkeys(
+                    blob_path(self.blobs_dir, meta['content_hash'])
+                    for meta in metadata[:split] if meta.get('content_hash')
+                )
+                if path.name not in hot and path.exists()
+            ]
+            if not cold:
+                return 0
+
+            key = None if retrain else self._newest_dictionary()
+            if key is None:
+                sample = random.sample(cold, min(len(cold), DICTIONARY_SAMPLES))
+                key = self._save_dictionary(train_dictionary(path.read_text() for path in sample))
+
+            compressed = 0
+            for path in cold:
+                raw = path.read_bytes()
+                data = self.codec.compress(raw, key)
+                if len(data) >= len(raw):
+                    continue
+                _write_atomic(path.with_name(path.name + COMPRESSED_SUFFIX), data)
+                path.unlink()
+                compressed += 1
+            logger.info(f"Compressed {compressed} cold cache bodies", extra={'compressed': compressed})
+            return compressed
+
+    def stats(self):
+        """Storage and compression figures for the blob store"""
+        plain = compressed = 0
+        plain_bytes = stored_bytes = raw_bytes = 0
+        decode_seconds = 0.0
+        if self.blobs_dir.is_dir():
+            for bucket in self.blobs_dir.iterdir():
+                for blob in bucket.iterdir():
+                    if blob.name.startswith('.'):
+                        continue
+                    size = blob.stat().st_size
+                    if blob.name.endswith(COMPRESSED_SUFFIX):
+                        data = blob.read_bytes()
+                        start = time.perf_counter()
+                        raw_bytes += len(self.codec.decompress(data))
+                        decode_seconds += time.perf_counter() - start
+                        stored_bytes += size
+                        compressed += 1
+                    else:
+                        plain_bytes += size
+                        plain += 1
+        dictionaries = list(self.dicts_dir.glob('*.zdict')) if self.dicts_dir.is_dir() else []
+        return {
+            'generations': len(self.generations()),
+            'blobs': plain + compressed,
+            'plain_blobs': plain,
+            'plain_bytes': plain_bytes,
+            'compressed_blobs': compressed,
+            'compressed_bytes': stored_bytes,
+            'uncompressed_bytes': raw_bytes,
+            'ratio': round(raw_bytes / stored_bytes, 3) if stored_bytes else None,
+            'decode_us_per_blob': round(decode_seconds / compressed * 1e6, 3) if compressed else None,
+            'dictionaries': len(dictionaries),
+            'dictionary_bytes': sum(path.stat().st_size for path in dictionaries),
+        }
+
+    def _load_dictionaries(self):
+        if self.dicts_dir.is_dir():
+            for path in self.dicts_dir.glob('*.zdict'):
+                self.codec.add_dictionary(path.read_bytes())
+
+    def _newest_dictionary(self):
+        if not self.dicts_dir.is_dir():
+            return None
+        paths = sorted(self.dicts_dir.glob('*.zdict'), key=lambda p: p.stat().st_mtime)
+        return self.codec.add_dictionary(paths[-1].read_bytes()) if paths else None
+
+    def _save_dictionary(self, dictionary):
+        key = self.codec.add_dictionary(dictionary)
+        self.dicts_dir.mkdir(parents=True, exist_ok=True)
+        _write_atomic(self.dicts_dir / f'{key}.zdict', dictionary)
+        return key
+
+    def _swap(self, name):
+        """Atomically replace the CURRENT pointer"""
+        tmp = self.cache_dir / f'.CURRENT.{os.getpid()}'
+        with open(tmp, 'w') as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.pointer)
+        _fsync_path(self.cache_dir, directory=True)
+
+    def _read_metadata(self, generation):
+        if generation is None:
+            return None
+        try:
+            with open(generation / 'metadata' / 'index.json') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _prune(self):
+        current = self.current_generation()
+        for generation in self.generations()[:-self.keep_generations]:
+            if generation != current:
+                shutil.rmtree(generation, ignore_errors=True)
+        self._collect_blobs()
+
+    def _collect_blobs(self):
+        """Remove bodies no remaining generation refers to"""
+        referenced = set()
+        for generation in self.generations():
+            for meta in self._read_metadata(generation) or []:
+                referenced.add(meta.get('content_hash'))
+        if not self.blobs_dir.is_dir():
+            return
+        for bucket in self.blobs_dir.iterdir():
+            for blob in bucket.iterdir():
+                if blob.name.removesuffix(COMPRESSED_SUFFIX) not in referenced:
+                    blob.unlink(missing_ok=True)
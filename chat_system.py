@@ -1,10 +1,25 @@
 # chat_system.py
+import json
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from itertools import islice
+from operator import attrgetter
 from pathlib import Path
 from config import Config
+from author_registry import AuthorRegistry
+from avatars import AvatarCache
 from cache_manager import CacheManager
 from github_client import GitHubClient
-from logger import logger
+from local_client import LocalClient
+from message import dedupe, merge_timelines, message_key
+from search_index import SearchIndex
+from segments import MessageStore, segment_name
+from thread_index import ThreadIndex
+from logger import get_logger
+
+logger = get_logger(__name__)
 
 class ChatSystem:
     def __init__(self, token=None, owner=None, repo=None):
@@ -12,58 +27,374 @@ class ChatSystem:
         
         # Use provided values or fall back to config
         self.token = token or self.config.get('github_token')
-        self.owner = owner or self.config.get('owner')
-        self.repo = repo or self.config.get('repo')
+        if owner or repo:
+            self.repos = [(owner or self.config.get('owner'), repo or self.config.get('repo'))]
+        else:
+            self.repos = self.config.values.repo_list() or [(self.config.get('owner'), self.config.get('repo'))]
+        # The first repository is the primary one, cached at the top of cache_dir
+        self.owner, self.repo = self.repos[0]
         
-        self.cache = CacheManager(self.config.get('cache_dir'))
-        self.github = GitHubClient(self.token, self.owner, self.repo)
+        self._cache = None
+        self._github = None
+        self._index = None
+        self._threads = None
+        self._authors = None
+        self._avatars = None
+        self._message_store = None
+        self._caches = {}
+        self._clients = {}
+        # Guards creating the attributes above: repositories are fetched on
+        # worker threads, which may reach for them at the same time
+        self._lock = threading.RLock()
+        # Held while a sync or webhook change updates the caches and indexes;
+        # callers publishing the result elsewhere hold it across both
+        self.sync_lock = threading.RLock()
+
+    def _lazy(self, attr, create):
+        """Value of attr, created with create() on first use"""
+        value = getattr(self, attr)
+        if value is None:
+            with self._lock:
+                value = getattr(self, attr)
+                if value is None:
+                    value = create()
+                    setattr(self, attr, value)
+        return value
+
+    @property
+    def cache(self):
+        """Cache manager, created on first use"""
+        return self._lazy('_cache', lambda: self._cache_manager(self.config.get('cache_dir')))
+
+    @property
+    def github(self):
+        """GitHub client, created on first use"""
+        return self._lazy('_github', lambda: self._client(self.owner, self.repo))
+
+    @property
+    def source(self):
+        """Message source selected by the backend setting"""
+        if self.config.get('backend') == 'local':
+            return LocalClient(self.config.get('messages_dir'))
+        return self.github
+
+    @property
+    def index(self):
+        """Search index stored beside the cache, loaded on first use"""
+        return self._lazy('_index', lambda: SearchIndex(Path(self.config.get('cache_dir')) / 'search_index.json'))
+
+    @property
+    def threads(self):
+        """Reply thread index stored beside the cache, loaded on first use"""
+        return self._lazy('_threads', lambda: ThreadIndex(
+            Path(self.config.get('cache_dir')) / 'thread_index.json', read_body=self._read_body
+        ))
+
+    @property
+    def authors(self):
+        """Author registry stored beside the cache, loaded on first use"""
+        return self._lazy('_authors', lambda: AuthorRegistry(Path(self.config.get('cache_dir')) / 'authors.json'))
+
+    @property
+    def avatars(self):
+        """Avatar cache stored beside the message cache, loaded on first use"""
+        return self._lazy('_avatars', lambda: AvatarCache(
+            Path(self.config.get('cache_dir')) / 'avatars',
+            size=self.config.get('avatar_size'),
+            max_bytes=self.config.get('avatar_cache_bytes'),
+            max_age=self.config.get('avatar_max_age'),
+            workers=self.config.get('concurrency')
+        ))
+
+    @property
+    def federated(self):
+        """True when the channel spans more than one GitHub repository"""
+        return len(self.repos) > 1 and self.config.get('backend') != 'local'
+
+    def cache_for(self, owner, repo):
+        """Cache of one repository; each extra repository has its own namespace"""
+        if (owner, repo) == (self.owner, self.repo):
+            return self.cache
+        with self._lock:
+            if (owner, repo) not in self._caches:
+                path = Path(self.config.get('cache_dir')) / 'repos' / f'{owner}__{repo}'
+                self._caches[owner, repo] = self._cache_manager(path)
+            return self._caches[owner, repo]
+
+    def client_for(self, owner, repo):
+        """GitHub client of one repository"""
+        if (owner, repo) == (self.owner, self.repo):
+            return self.github
+        with self._lock:
+            if (owner, repo) not in self._clients:
+                self._clients[owner, repo] = self._client(owner, repo)
+            return self._clients[owner, repo]
 
     def update_cache(self):
-        """Update local cache from GitHub"""
+        """Update local cache from GitHub and return the cached messages.
+
+        With several repositories, each is fetched concurrently into its own
+        cache and the merged timeline is returned, oldest first. Runs under
+        sync_lock, so webhook changes land before or after it, not inside.
+        """
         try:
-            messages = self.github.get_messages()
-            
-            # Clear existing cache
-            self.cache.clear()
-            
-            # Save messages and metadata
-            metadata = []
-            for msg in messages:
-                self.cache.save_message(msg['filename'], msg['content'])
-                metadata.append({
-                    'filename': msg['filename'],
-                    'author': msg['author'],
-                    'date': msg['date'].isoformat(),
-                    'commit_hash': msg.get('commit_hash')
-                })
-            
-            self.cache.save_metadata(metadata)
+            with self.sync_lock:
+                if self.config.get('backend') == 'local':
+                    messages = dedupe(self.source.get_messages(), self.config.get('dedup_policy'))
+                    self._store(self.cache, messages)
+                elif not self.federated:
+                    messages = self._update_repo(self.owner, self.repo)
+                else:
+                    messages = self._merge(self._map_repos(self._update_repo))
+
+                self.sync_indexes(messages)
+            self.refresh_avatars()
+            return messages
             
         except Exception as e:
             logger.error(f"Error updating cache: {e}")
             raise
 
-    def format_messages(self, use_cache=True):
-        """Format messages for display"""
+    def sync_indexes(self, messages):
+        """Bring the search, thread and author indexes in line with a full listing"""
+        self.index.sync(messages)
+        self.threads.sync(messages)
+        self.authors.sync(messages)
+
+    def timeline(self, limit=None, since=None):
+        """Cached messages of every repository as one timeline, newest first"""
+        if not self.federated:
+            messages = self.cache.get_messages(limit, since)
+            messages.reverse()
+            return messages
+        # Each cache reads back oldest first; merge them newest first so the
+        # merge can stop once limit messages have been produced
+        streams = [reversed(self._tag(self.cache_for(*repo).get_messages(limit, since), repo)) for repo in self.repos]
+        merged = merge_timelines(streams, self.config.get('dedup_policy'), newest_first=True)
+        return list(islice(merged, limit))
+
+    def apply_changes(self, messages, removed=(), repo=None):
+        """Apply added or changed messages and removed filenames to the cache and search index.
+
+        Only the given messages are written; everything else is carried over
+        from the current cache generation of repo (the primary one by default).
+        Runs under sync_lock: a full sync that started earlier would otherwise
+        commit its older listing over these changes.
+        """
         try:
-            messages = self.cache.get_messages() if use_cache else self.github.get_messages()
-            
-            if not messages:
-                return "No messages found."
-                
-            # Sort messages by date
-            messages.sort(key=lambda x: x['date'])
-            
-            # Format each message
-            formatted = []
+            with self.sync_lock:
+                cache = self.cache_for(*repo) if repo else self.cache
+                messages = self._tag(messages, repo)
+                changed = {msg.filename for msg in messages} | set(removed)
+                counts = Counter(msg.author for msg in messages)
+                with cache.snapshot(incremental=True) as snapshot:
+                    metadata = []
+                    for meta in snapshot.metadata:
+                        if meta['filename'] in changed:
+                            counts[meta['author']] -= 1
+                        else:
+                            metadata.append(meta)
+                    for msg in messages:
+                        metadata.append(self._save_message(snapshot, msg))
+                    snapshot.save_metadata(metadata)
+
+                # Indexes are keyed across repositories; see Message.key
+                for key in self.removed_keys(removed, repo):
+                    self.index.remove_message(key)
+                    self.threads.remove_message(key)
+                for msg in sorted(messages, key=attrgetter('timestamp')):
+                    self.index.add_message(msg)
+                    self.threads.add_message(msg)
+                self.authors.update(counts, published=[msg.key for msg in messages])
+        except Exception as e:
+            logger.error(f"Error applying changes to cache: {e}")
+            raise
+
+    def removed_keys(self, removed, repo=None):
+        """Message keys of filenames removed from repo"""
+        repo = None if repo is None or tuple(repo) == (self.owner, self.repo) else tuple(repo)
+        return [message_key(filename, repo) for filename in removed]
+
+    def refresh_avatars(self):
+        """Fetch new or stale author avatars; failures only cost the avatars"""
+        if not self.config.get('avatars') or self.config.get('backend') == 'local':
+            return
+        try:
+            self.avatars.refresh()
+        except Exception as e:
+            logger.warning(f"Error refreshing avatars: {e}")
+
+    def _update_repo(self, owner, repo):
+        """Fetch one repository into its cache and return its messages"""
+        cache = self.cache_for(owner, repo)
+        client = self.client_for(owner, repo)
+        # Files whose blob SHA is unchanged are reused from the cache
+        known = {msg.filename: msg for msg in cache.get_messages() if msg.blob_sha}
+        messages = self._tag(dedupe(client.iter_messages(known), self.config.get('dedup_policy')), (owner, repo))
+        self._store(cache, messages)
+        if self.config.get('avatars'):
+            self.avatars.register(client.authors)
+        return messages
+
+    def _fetch_repo(self, owner, repo):
+        return self._tag(self.client_for(owner, repo).get_messages(), (owner, repo))
+
+    def _map_repos(self, func):
+        """Run func(owner, repo) for every repository concurrently.
+
+        A repository that fails is logged and read from its cache instead,
+        so one unreachable fork does not hide the rest of the channel.
+        """
+        workers = min(self.config.get('concurrency'), len(self.repos))
+        results = []
+        errors = []
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='repo-fetch') as pool:
+            futures = {pool.submit(func, owner, repo): (owner, repo) for owner, repo in self.repos}
+            for future, (owner, repo) in futures.items():
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    logger.error(f"Error fetching {owner}/{repo}: {e}")
+                    errors.append(e)
+                    results.append(self._tag(self.cache_for(owner, repo).get_messages(), (owner, repo)))
+        if len(errors) == len(self.repos):
+            raise errors[0]
+        return results
+
+    def _merge(self, results):
+        """Merge per-repository message lists into one timeline, oldest first"""
+        streams = [sorted(messages, key=attrgetter('timestamp')) for messages in results]
+        return list(merge_timelines(streams, self.config.get('dedup_policy')))
+
+    def _tag(self, messages, repo):
+        """Mark messages read from a repository other than the primary one with it"""
+        if repo is None or tuple(repo) == (self.owner, self.repo):
+            return messages
+        repo = tuple(repo)
+        if isinstance(messages, list):
             for msg in messages:
-                formatted.append(
-                    f"[{msg['date'].strftime('%Y-%m-%d %H:%M:%S')}] "
-                    f"{msg['author']} ({msg['filename']}): {msg['content']}"
-                )
-                
-            return '\n'.join(formatted)
-            
+                msg.repo = repo
+            return messages
+
+        def tagged():
+            for msg in messages:
+                msg.repo = repo
+                yield msg
+        return tagged()
+
+    def _store(self, cache, messages):
+        # Build the new cache generation off to the side; readers keep
+        # seeing the previous one until it is complete and swapped in
+        with cache.snapshot() as snapshot:
+            snapshot.save_metadata([self._save_message(snapshot, msg) for msg in messages])
+
+    def _cache_manager(self, path):
+        return CacheManager(
+            path,
+            keep_generations=self.config.get('cache_generations'),
+            compress=self.config.get('cache_compress'),
+            hot_messages=self.config.get('cache_hot_messages')
+        )
+
+    def _client(self, owner, repo):
+        return GitHubClient(
+            self.token, owner, repo,
+            api_url=self.config.get('github_api_url'),
+            raw_url=self.config.get('github_raw_url'),
+            branch=self.config.get('github_branch')
+        )
+
+    def _read_body(self, node):
+        """Body of a thread index node: from its repository's cache, or from
+        the messages directory for a message posted here and not synced yet"""
+        repo = tuple(node['repo']) if node.get('repo') else (self.owner, self.repo)
+        if node.get('content_hash'):
+            try:
+                return self.cache_for(*repo).read_blob(node['content_hash'])
+            except (OSError, KeyError):
+                pass
+        store = self._lazy('_message_store', lambda: MessageStore(self.config.get('messages_dir')))
+        date = datetime.fromisoformat(node['date'])
+        for msg in store.read_segment(segment_name(date)):
+            if msg.filename == node['filename']:
+                return msg.content
+        return ''
+
+    def _save_message(self, snapshot, msg):
+        """Store a message body in a snapshot and return its metadata entry"""
+        return {
+            'filename': msg.filename,
+            'author': msg.author,
+            'date': msg.date.isoformat(),
+            'commit_hash': msg.commit_hash,
+            'content_hash': snapshot.save_message(msg.filename, msg.content),
+            'sha': msg.blob_sha
+        }
+
+    def search(self, query, page=1, per_page=20):
+        """Search messages by content and author"""
+        return self.index.search(query, page=page, per_page=per_page)
+
+    def iter_messages(self, use_cache=True, limit=None, since=None):
+        """Yield messages oldest first, optionally only the newest limit or those since a date.
+
+        Cached and local messages are streamed from date-ordered sources (the
+        binary index, monthly segments) and merged, so the full history is
+        never collected or sorted. Only GitHub fetches arrive as whole lists.
+        """
+        if use_cache:
+            if limit is not None and self.federated:
+                # The newest limit messages are found merging newest first
+                return reversed(self.timeline(limit, since))
+            if not self.federated:
+                return self.cache.iter_messages(limit, since)
+            streams = [self._tag(self.cache_for(*repo).iter_messages(since=since), repo) for repo in self.repos]
+            return merge_timelines(streams, self.config.get('dedup_policy'))
+        if self.config.get('backend') == 'local':
+            return self.source.iter_messages(limit, since)
+        messages = self._merge(self._map_repos(self._fetch_repo))
+        if since is not None:
+            messages = [msg for msg in messages if msg.date >= since]
+        if limit is not None:
+            messages = messages[max(len(messages) - limit, 0):]
+        return iter(messages)
+
+    def iter_lines(self, use_cache=True, limit=None, since=None, fmt='text'):
+        """Yield one display line, or with fmt='ndjson' one JSON record, per message"""
+        for msg in self.iter_messages(use_cache, limit, since):
+            if fmt == 'ndjson':
+                yield json.dumps(msg.to_dict())
+            else:
+                yield f"[{msg.formatted_date}] {msg.author} ({msg.filename}): {msg.content}"
+
+    def import_messages(self, messages, replace=False):
+        """Write a stream of messages into the primary cache as one new generation.
+
+        Bodies are stored as they arrive; only the metadata list is held in
+        memory. Messages replace cached ones with the same filename, or with
+        replace=True the whole cache; the indexes are then synced with the
+        cache. Returns how many were imported.
+        """
+        try:
+            count = 0
+            with self.cache.snapshot(incremental=not replace) as snapshot:
+                metadata = {meta['filename']: meta for meta in snapshot.metadata or []}
+                for msg in messages:
+                    metadata[msg.filename] = self._save_message(snapshot, msg)
+                    count += 1
+                snapshot.save_metadata(list(metadata.values()))
+            # Imported messages are searchable and threaded like synced ones
+            self.sync_indexes(self.timeline())
+            return count
+        except Exception as e:
+            logger.error(f"Error importing messages: {e}")
+            raise
+
+    def format_messages(self, use_cache=True, limit=None, since=None):
+        """Format messages for display, optionally only the newest limit or those since a date"""
+        try:
+            formatted = '\n'.join(self.iter_lines(use_cache, limit, since))
+            return formatted or "No messages found."
         except Exception as e:
             logger.error(f"Error formatting messages: {e}")
             return f"Error: Unable to format messages: {e}"
@@ -1,19 +1,51 @@
+import importlib
 import click
-from commands.show import show
-from commands.send import send
-from commands.config import config, show_config
-from commands.cache import update_cache
 
-@click.group()
-def cli():
-    """GitHub-based chat system"""
-    pass
+# Commands are imported on first use so that `cli send` does not pay for
+# requests, the cache layer or the search index.
+LAZY_COMMANDS = {
+    'show': 'commands.show:show',
+    'send': 'commands.send:send',
+    'flush': 'commands.publish:flush',
+    'config': 'commands.config:config',
+    'show-config': 'commands.config:show_config',
+    'update-cache': 'commands.cache:update_cache',
+    'rollback-cache': 'commands.cache:rollback_cache',
+    'compress-cache': 'commands.cache:compress_cache',
+    'cache-stats': 'commands.cache:cache_stats',
+    'search': 'commands.search:search',
+    'migrate-messages': 'commands.messages:migrate_messages',
+    'replay-webhook': 'commands.webhook:replay_webhook',
+    'export': 'commands.transfer:export',
+    'import': 'commands.transfer:import_messages',
+}
+
+class LazyGroup(click.Group):
+    """Click group that resolves commands from import paths when invoked"""
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands or {}
 
-cli.add_command(show)
-cli.add_command(send)
-cli.add_command(config)
-cli.add_command(show_config)
-cli.add_command(update_cache)
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, name):
+        if name in self.lazy_commands:
+            module_name, attr = self.lazy_commands[name].split(':')
+            return getattr(importlib.import_module(module_name), attr)
+        return super().get_command(ctx, name)
+
+@click.group(cls=LazyGroup, lazy_commands=LAZY_COMMANDS)
+@click.option('--profile', is_flag=True, help='Profile the command and write a .pstats file to profile_dir')
+@click.pass_context
+def cli(ctx, profile):
+    """GitHub-based chat system"""
+    if profile:
+        from config import load_settings
+        from profiling import Profiler
+        # Stopped when the context closes, after the subcommand has run
+        ctx.with_resource(Profiler(load_settings().profile_dir).profile(ctx.invoked_subcommand or 'cli'))
 
 if __name__ == '__main__':
     cli()
@@ -13,3 +13,36 @@ def update_cache():
         click.echo(f"Error updating cache: {e}", err=True)
         sys.exit(1)
 
+@click.command(name='rollback-cache')
+def rollback_cache():
+    """Restore the previous cache generation"""
+    try:
+        chat = ChatSystem()
+        generation = chat.cache.rollback()
+        click.echo(f"Cache rolled back to generation {generation}")
+    except Exception as e:
+        click.echo(f"Error rolling back cache: {e}", err=True)
+        sys.exit(1)
+
+@click.command(name='compress-cache')
+@click.option('--retrain', is_flag=True, help='Train a new compression dictionary')
+def compress_cache(retrain):
+    """Compress cold message bodies in the cache"""
+    try:
+        chat = ChatSystem()
+        count = chat.cache.compress_cold(retrain=retrain)
+        click.echo(f"Compressed {count} message bodies")
+    except Exception as e:
+        click.echo(f"Error compressing cache: {e}", err=True)
+        sys.exit(1)
+
+@click.command(name='cache-stats')
+def cache_stats():
+    """Show cache size and compression statistics"""
+    try:
+        chat = ChatSystem()
+        for key, value in chat.cache.stats().items():
+            click.echo(f"{key}: {value}")
+    except Exception as e:
+        click.echo(f"Error reading cache stats: {e}", err=True)
+        sys.exit(1)
@@ -1,8 +1,8 @@
 import sys
 import click
-from config import Config
+from config import Config, Settings, KEY_ALIASES
 
-SUPPORTED_KEYS = ['github_token', 'repo_owner', 'repo_name', 'cache_enabled']
+SUPPORTED_KEYS = Settings.keys()
 
 @click.command()
 @click.argument('key', required=False)
@@ -16,6 +16,7 @@ def config(key, value):
         click.echo("\nUsage: cli config KEY VALUE")
         return
 
+    key = KEY_ALIASES.get(key, key)
     if key not in SUPPORTED_KEYS:
         click.echo(f"Error: Unsupported configuration key: {key}")
         click.echo("Run 'cli config' to see supported keys")
@@ -24,7 +25,7 @@ def config(key, value):
     try:
         conf = Config()
         conf.set(key, value)
-        click.echo(f"Set {key} to {value}")
+        click.echo(f"Set {key} to {conf.get(key)}")
     except Exception as e:
         click.echo(f"Error setting config: {e}", err=True)
         sys.exit(1)
@@ -34,14 +35,10 @@ def show_config():
     """Show current configuration"""
     try:
         conf = Config()
-        if not conf.settings:
-            click.echo("No configuration values set")
-            click.echo("\nSupported keys:")
-            for key in SUPPORTED_KEYS:
-                click.echo(f"  {key}")
-            return
+        if not conf.config_file.exists():
+            click.echo("No configuration file, showing defaults\n")
 
-        for key, value in conf.settings.items():
+        for key, value in conf.values.as_dict().items():
             click.echo(f"{key}: {value}")
     except Exception as e:
         click.echo(f"Error reading config: {e}", err=True)
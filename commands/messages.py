@@ -0,0 +1,16 @@
+import sys
+import click
+from config import load_settings
+from segments import MessageStore
+
+@click.command(name='migrate-messages')
+@click.option('--messages-dir', help='Messages directory (default: messages_dir setting)')
+def migrate_messages(messages_dir):
+    """Move flat message files into monthly segments"""
+    try:
+        store = MessageStore(messages_dir or load_settings().messages_dir)
+        moved = store.migrate()
+        click.echo(f"Moved {moved} messages into {len(store.segments())} segments")
+    except Exception as e:
+        click.echo(f"Error migrating messages: {e}", err=True)
+        sys.exit(1)
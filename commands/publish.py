@@ -0,0 +1,30 @@
+import sys
+from pathlib import Path
+import click
+from config import load_settings
+from outbox import Outbox
+
+def open_outbox():
+    return Outbox(Path(load_settings().cache_dir) / 'outbox')
+
+def flush_outbox(outbox):
+    """Publish everything queued in outbox and report the commit"""
+    settings = load_settings()
+    github = None
+    if settings.publish_via != 'git':
+        from chat_system import ChatSystem
+        github = ChatSystem().github
+    count, sha = outbox.flush(github, via=settings.publish_via)
+    if count:
+        click.echo(f"Published {count} messages in commit {sha[:12]}")
+    else:
+        click.echo("Nothing to publish.")
+
+@click.command()
+def flush():
+    """Publish all queued messages as a single commit"""
+    try:
+        flush_outbox(open_outbox())
+    except Exception as e:
+        click.echo(f"Error publishing messages: {e}", err=True)
+        sys.exit(1)
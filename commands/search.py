@@ -0,0 +1,31 @@
+import sys
+import click
+from chat_system import ChatSystem
+
+@click.command()
+@click.argument('query', required=False)
+@click.option('--page', default=1, type=int, help='Result page to show')
+@click.option('--per-page', default=20, type=int, help='Results per page')
+def search(query, page, per_page):
+    """Search cached messages"""
+    if not query:
+        click.echo("Usage: cli search [OPTIONS] QUERY")
+        click.echo("\nRun 'cli update-cache' first to build the search index.")
+        return
+
+    try:
+        chat = ChatSystem()
+        results, total = chat.search(query, page=page, per_page=per_page)
+        if not results:
+            click.echo("No matching messages.")
+            return
+
+        for msg in results:
+            click.echo(
+                f"[{msg.formatted_date}] {msg.author} ({msg.filename}): {msg.content}"
+            )
+        pages = (total + per_page - 1) // per_page
+        click.echo(f"\nPage {page} of {pages} ({total} results)")
+    except Exception as e:
+        click.echo(f"Error searching messages: {e}", err=True)
+        sys.exit(1)
@@ -1,33 +1,44 @@
 import sys
 import click
 import time
-from pathlib import Path
-from chat_system import ChatSystem
+from segments import MessageStore
 
 @click.command()
 @click.option('--filename', help='Optional custom filename (without .txt)')
+@click.option('--queue', is_flag=True, help='Queue the message for the next flush')
+@click.option('--publish', is_flag=True, help='Commit the message and everything queued to GitHub now')
 @click.argument('message', required=False)
-def send(message, filename):
+def send(message, filename, queue, publish):
     """Send a new message"""
     if not message:
         click.echo("Available options:")
         click.echo("  --filename TEXT  Optional custom filename (without .txt)")
+        click.echo("  --queue          Queue the message for the next flush")
+        click.echo("  --publish        Commit the message and everything queued to GitHub now")
         click.echo("\nUsage: cli send [OPTIONS] MESSAGE")
         return
 
     try:
-        chat = ChatSystem()
         if not filename:
-            filename = f"msg_{int(time.time())}"
+            # Nanoseconds, like posts: scripted sends land in the same second
+            filename = f"msg_{time.time_ns()}"
         
-        messages_dir = Path('messages')
-        messages_dir.mkdir(exist_ok=True)
-        
-        filepath = messages_dir / f"{filename}.txt"
-        filepath.write_text(message)
+        store = MessageStore('messages')
+        filepath = store.write(f"{filename}.txt", message)
         
         click.echo(f"Message saved to {filepath}")
-        click.echo("Remember to commit and push your changes!")
+        if not (queue or publish):
+            click.echo("Remember to commit and push your changes!")
+            return
+
+        # Publishing needs the config and GitHub client; plain sends stay light
+        from commands.publish import flush_outbox, open_outbox
+        outbox = open_outbox()
+        outbox.add(f"messages/{filepath.relative_to(store.root).as_posix()}", message, filepath.resolve())
+        if publish:
+            flush_outbox(outbox)
+        else:
+            click.echo(f"Queued; {len(outbox)} messages waiting for 'cli flush'")
     except Exception as e:
         click.echo(f"Error sending message: {e}", err=True)
         sys.exit(1)
@@ -1,3 +1,4 @@
+import os
 import sys
 import click
 from chat_system import ChatSystem
@@ -6,20 +7,39 @@ from chat_system import ChatSystem
 @click.option('--token', help='GitHub API token')
 @click.option('--owner', help='Repository owner')
 @click.option('--repo', help='Repository name')
-@click.option('--cache/--no-cache', default=True, help='Use cached messages')
-def show(token, owner, repo, cache):
+@click.option('--cache/--no-cache', default=None, help='Use cached messages')
+@click.option('--limit', type=click.IntRange(min=0), help='Show only the newest N messages')
+@click.option('--since', type=click.DateTime(), help='Show only messages from this date on')
+@click.option('--format', 'fmt', type=click.Choice(['text', 'ndjson']), default='text',
+              help='Print display lines or one JSON record per message')
+def show(token, owner, repo, cache, limit, since, fmt):
     """Display all messages"""
     if not any([token, owner, repo]):
         click.echo("Available options:")
         click.echo("  --token TEXT   GitHub API token")
         click.echo("  --owner TEXT   Repository owner")
         click.echo("  --repo TEXT    Repository name")
-        click.echo("  --cache/--no-cache  Use cached messages (default: True)")
+        click.echo("  --cache/--no-cache  Use cached messages (default: cache_enabled)")
+        click.echo("  --limit INTEGER  Show only the newest N messages")
+        click.echo("  --since DATE   Show only messages from this date on")
+        click.echo("  --format [text|ndjson]  Output format (default: text)")
         return
 
     try:
         chat = ChatSystem(token, owner, repo)
-        click.echo(chat.format_messages(use_cache=cache))
+        if cache is None:
+            cache = chat.config.get('cache_enabled')
+        # Lines are written as they are produced, so long histories start
+        # printing at once and are never held in memory as a whole
+        shown = False
+        for line in chat.iter_lines(use_cache=cache, limit=limit, since=since, fmt=fmt):
+            click.echo(line)
+            shown = True
+        if not shown and fmt == 'text':
+            click.echo("No messages found.")
+    except BrokenPipeError:
+        # The reader went away (e.g. piped into head); stop quietly
+        sys.stdout = open(os.devnull, 'w')
     except Exception as e:
         click.echo(f"Error: {e}", err=True)
         sys.exit(1)
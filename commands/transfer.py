@@ -0,0 +1,62 @@
+import os
+import sys
+import json
+import click
+from chat_system import ChatSystem
+from message import Message
+from segments import MessageStore
+
+def _records(lines):
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield Message.from_dict(json.loads(line))
+        except (ValueError, KeyError) as e:
+            raise click.ClickException(f"Invalid record on line {number}: {e}")
+
+@click.command(name='export')
+@click.option('--from', 'source', type=click.Choice(['cache', 'store']), default='cache',
+              help='Export the message cache or the local messages directory')
+@click.option('--since', type=click.DateTime(), help='Export only messages from this date on')
+@click.option('--output', '-o', type=click.File('w'), default='-', help='File to write (default: stdout)')
+def export(source, since, output):
+    """Write messages as NDJSON, oldest first"""
+    try:
+        chat = ChatSystem()
+        if source == 'cache':
+            messages = chat.iter_messages(use_cache=True, since=since)
+        else:
+            messages = MessageStore(chat.config.get('messages_dir')).iter_oldest(since)
+        count = 0
+        for msg in messages:
+            output.write(json.dumps(msg.to_dict()) + '\n')
+            count += 1
+        output.flush()
+        click.echo(f"Exported {count} messages", err=True)
+    except BrokenPipeError:
+        # The reader went away (e.g. piped into head); stop quietly
+        sys.stdout = open(os.devnull, 'w')
+    except Exception as e:
+        click.echo(f"Error exporting messages: {e}", err=True)
+        sys.exit(1)
+
+@click.command(name='import')
+@click.argument('source', type=click.File('r'), default='-')
+@click.option('--to', 'target', type=click.Choice(['cache', 'store']), default='cache',
+              help='Import into the message cache or the local messages directory')
+@click.option('--replace', is_flag=True, help='Replace the cached messages instead of adding to them')
+def import_messages(source, target, replace):
+    """Read NDJSON messages written by export"""
+    try:
+        chat = ChatSystem()
+        if target == 'cache':
+            count = chat.import_messages(_records(source), replace=replace)
+        else:
+            count = MessageStore(chat.config.get('messages_dir')).write_many(_records(source))
+        click.echo(f"Imported {count} messages")
+    except click.ClickException:
+        raise
+    except Exception as e:
+        click.echo(f"Error importing messages: {e}", err=True)
+        sys.exit(1)
@@ -0,0 +1,45 @@
+import sys
+import json
+import urllib.error
+import urllib.request
+import click
+from config import load_settings
+from webhook import sign
+
+@click.command(name='replay-webhook')
+@click.argument('payloads', nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option('--url', default='http://localhost:8000/webhook', help='Webhook endpoint to post to')
+@click.option('--event', default='push', help='Event for raw payload files (default: push)')
+def replay_webhook(payloads, url, event):
+    """Post recorded webhook payloads to a running server, signed with webhook_secret"""
+    if not payloads:
+        click.echo("Usage: cli replay-webhook [OPTIONS] PAYLOAD...")
+        click.echo("\nPayloads are files recorded via webhook_record_dir, or raw GitHub payloads.")
+        return
+
+    secret = load_settings().webhook_secret
+    if not secret:
+        click.echo("Error: webhook_secret is not configured", err=True)
+        sys.exit(1)
+
+    for path in payloads:
+        with open(path) as f:
+            data = json.load(f)
+        # Recorded deliveries wrap the payload with its event and delivery ID
+        recorded = 'payload' in data and 'event' in data
+        payload = data['payload'] if recorded else data
+        body = json.dumps(payload).encode()
+        request = urllib.request.Request(url, data=body, method='POST', headers={
+            'Content-Type': 'application/json',
+            'X-GitHub-Event': data['event'] if recorded else event,
+            'X-GitHub-Delivery': data.get('delivery') or 'replay',
+            'X-Hub-Signature-256': sign(secret, body),
+        })
+        try:
+            with urllib.request.urlopen(request) as response:
+                click.echo(f"{path}: {response.status}")
+        except urllib.error.HTTPError as e:
+            click.echo(f"{path}: {e.code}", err=True)
+        except urllib.error.URLError as e:
+            click.echo(f"Error posting {path}: {e.reason}", err=True)
+            sys.exit(1)
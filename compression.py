@@ -0,0 +1,74 @@
+# compression.py
+"""zlib compression with a shared dictionary for small, similar texts.
+
+Chat messages are too short for zlib to find much redundancy inside any
+one of them; the redundancy is across messages. A preset dictionary built
+from a sample of bodies gives every message that shared context.
+
+Compressed data is framed as::
+
+    magic 'BCZ1', dictionary id (16 ASCII hex chars), raw deflate stream
+"""
+import re
+import zlib
+import hashlib
+from collections import Counter
+
+MAGIC = b'BCZ1'
+ID_LENGTH = 16
+# zlib only looks back 32 KiB, so a larger dictionary is never used
+MAX_DICTIONARY_SIZE = 32 * 1024
+
+_PIECES = re.compile(r'\S+\s*')
+
+def dictionary_id(dictionary):
+    return hashlib.sha256(dictionary).hexdigest()[:ID_LENGTH]
+
+def train_dictionary(samples, size=MAX_DICTIONARY_SIZE):
+    """Build a preset dictionary from sample texts.
+
+    Words and whole short messages that recur across samples are kept, the
+    most common last, since zlib encodes matches near the end of the
+    dictionary with the shortest distances.
+    """
+    counts = Counter()
+    for text in samples:
+        if len(text) <= 64:
+            counts[text] += 1
+        counts.update(_PIECES.findall(text))
+
+    pieces = []
+    total = 0
+    for piece, count in counts.most_common():
+        if count < 2 or total + len(piece.encode()) > size:
+            continue
+        pieces.append(piece)
+        total += len(piece.encode())
+    return ''.join(reversed(pieces)).encode()
+
+class Codec:
+    """Compresses and decompresses with the dictionaries it has been given"""
+
+    def __init__(self, level=9):
+        self.level = level
+        self.dictionaries = {}
+
+    def add_dictionary(self, dictionary):
+        """Register a dictionary and return its id"""
+        key = dictionary_id(dictionary)
+        self.dictionaries[key] = dictionary
+        return key
+
+    def compress(self, data, key):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=self.dictionaries[key])
+        return MAGIC + key.encode() + compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not compressed data")
+        start = len(MAGIC) + ID_LENGTH
+        key = data[len(MAGIC):start].decode()
+        if key not in self.dictionaries:
+            raise KeyError(f"Unknown compression dictionary: {key}")
+        decompressor = zlib.decompressobj(-zlib.MAX_WBITS, zdict=self.dictionaries[key])
+        return decompressor.decompress(data[start:]) + decompressor.flush()
@@ -1,42 +1,280 @@
 # config.py
 import os
 import json
+import logging
+import tempfile
+from dataclasses import dataclass, field, fields, asdict
 from pathlib import Path
+from message import DEDUP_POLICIES
+
+# logger.py reads these settings when it starts, so it cannot be imported here
+logger = logging.getLogger('bananachat.config')
+
+BACKENDS = ('github', 'local')
+# How `send --publish` and `flush` commit messages
+PUBLISH_MODES = ('auto', 'api', 'git')
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+# Older key names accepted by `cli config`
+KEY_ALIASES = {
+    'repo_owner': 'owner',
+    'repo_name': 'repo',
+}
+
+TRUE_VALUES = {'1', 'true', 'yes', 'on'}
+FALSE_VALUES = {'0', 'false', 'no', 'off'}
+
+def _default_cache_dir():
+    return str(Path.home() / '.bananachat' / 'cache')
+
+@dataclass(slots=True)
+class Settings:
+    """Typed, validated configuration values"""
+    github_token: str = ''
+    github_api_url: str = 'https://api.github.com'
+    github_raw_url: str = ''
+    github_branch: str = ''
+    owner: str = ''
+    repo: str = ''
+    # Comma-separated owner/repo list read as one channel; owner/repo when empty
+    repos: str = ''
+    cache_dir: str = field(default_factory=_default_cache_dir)
+    messages_dir: str = 'messages'
+    cache_enabled: bool = True
+    cache_generations: int = 3
+    cache_compress: bool = False
+    cache_hot_messages: int = 1000
+    dedup_policy: str = 'exact'
+    backend: str = 'github'
+    publish_via: str = 'auto'
+    concurrency: int = 8
+    server_workers: int = 4
+    sync_interval: int = 0
+    sync_jitter: int = 10
+    sync_max_backoff: int = 900
+    webhook_secret: str = ''
+    webhook_coalesce_ms: int = 1000
+    webhook_record_dir: str = ''
+    # Largest webhook body read before its signature is checked; bigger
+    # pushes get 413 and are picked up by the next sync
+    webhook_max_bytes: int = 5 * 1024 * 1024
+    # Posts allowed per client per minute (0 for no limit) and how many at once
+    post_rate_per_minute: int = 30
+    post_burst: int = 10
+    max_message_bytes: int = 64 * 1024
+    ingest_queue_size: int = 1000
+    # GitHub avatars of message authors, cached under cache_dir/avatars
+    avatars: bool = True
+    avatar_size: int = 64
+    avatar_cache_bytes: int = 5 * 1024 * 1024
+    avatar_max_age: int = 86400
+    # Where --profile writes .pstats files, and the slowest requests it keeps
+    profile_dir: str = 'profiles'
+    profile_threshold_ms: int = 500
+    log_file: str = 'chat.log'
+    log_max_bytes: int = 10 * 1024 * 1024
+    log_backups: int = 5
+    log_level: str = 'INFO'
+    log_levels: str = ''
+
+    @classmethod
+    def keys(cls):
+        return [f.name for f in fields(cls)]
+
+    @classmethod
+    def from_dict(cls, values):
+        """Build settings from raw strings or JSON values, validating each key"""
+        types = {f.name: f.type for f in fields(cls)}
+        kwargs = {}
+        for key, value in values.items():
+            key = KEY_ALIASES.get(key, key)
+            if key in types:
+                kwargs[key] = coerce(key, value, types[key])
+        settings = cls(**kwargs)
+        settings.validate()
+        return settings
+
+    @classmethod
+    def lenient(cls, values):
+        """Like from_dict, but invalid values keep their defaults; returns (settings, errors)"""
+        types = {f.name: f.type for f in fields(cls)}
+        settings = cls()
+        errors = []
+        for key, value in values.items():
+            key = KEY_ALIASES.get(key, key)
+            if key not in types:
+                continue
+            previous = getattr(settings, key)
+            try:
+                setattr(settings, key, coerce(key, value, types[key]))
+                settings.validate()
+            except ValueError as e:
+                setattr(settings, key, previous)
+                errors.append(str(e))
+        return settings, errors
+
+    def validate(self):
+        if self.backend not in BACKENDS:
+            raise ValueError(f"backend must be one of {', '.join(BACKENDS)}, got {self.backend!r}")
+        if self.publish_via not in PUBLISH_MODES:
+            raise ValueError(f"publish_via must be one of {', '.join(PUBLISH_MODES)}, got {self.publish_via!r}")
+        parse_repos(self.repos)
+        for key in ('concurrency', 'server_workers', 'cache_generations', 'ingest_queue_size', 'avatar_size'):
+            if getattr(self, key) < 1:
+                raise ValueError(f"{key} must be at least 1")
+        if self.dedup_policy not in DEDUP_POLICIES:
+            raise ValueError(f"dedup_policy must be one of {', '.join(DEDUP_POLICIES)}, got {self.dedup_policy!r}")
+        for key in ('cache_hot_messages', 'sync_interval', 'sync_jitter', 'sync_max_backoff', 'webhook_coalesce_ms',
+                    'post_rate_per_minute', 'post_burst', 'max_message_bytes', 'webhook_max_bytes', 'profile_threshold_ms',
+                    'avatar_cache_bytes', 'avatar_max_age'):
+            if getattr(self, key) < 0:
+                raise ValueError(f"{key} must not be negative")
+        levels = [self.log_level] + [item.partition('=')[2] for item in self.log_levels.split(',') if item.strip()]
+        for level in levels:
+            if level.strip().upper() not in LOG_LEVELS:
+                raise ValueError(f"log level must be one of {', '.join(LOG_LEVELS)}, got {level!r}")
+
+    def as_dict(self):
+        return asdict(self)
+
+    def repo_list(self):
+        """(owner, repo) pairs making up the channel"""
+        return parse_repos(self.repos) or ([(self.owner, self.repo)] if self.owner and self.repo else [])
+
+def parse_repos(spec):
+    """Parse 'owner/repo,owner/repo' into a list of (owner, repo) pairs"""
+    repos = []
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        owner, _, repo = item.partition('/')
+        if not owner or not repo or '/' in repo:
+            raise ValueError(f"repos entries must look like owner/repo, got {item!r}")
+        if (owner, repo) not in repos:
+            repos.append((owner, repo))
+    return repos
+
+def coerce(key, value, type_):
+    """Convert a raw config value to the type declared for its key"""
+    if type_ in (bool, 'bool'):
+        if isinstance(value, bool):
+            return value
+        text = str(value).strip().lower()
+        if text in TRUE_VALUES:
+            return True
+        if text in FALSE_VALUES:
+            return False
+        raise ValueError(f"{key} must be a boolean, got {value!r}")
+    if type_ in (int, 'int'):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{key} must be an integer, got {value!r}")
+    if isinstance(value, (list, tuple)):
+        return ','.join(map(str, value))
+    return str(value)
+
+def env_overrides():
+    """Collect BANANACHAT_* environment overrides for known keys"""
+    overrides = {}
+    for key in Settings.keys():
+        value = os.environ.get(f'BANANACHAT_{key.upper()}')
+        if value is not None:
+            overrides[key] = value
+    return overrides
+
+# config file path -> (stat signature, raw file values, parsed Settings or
+# None, the ValueError raised parsing them or None)
+_cache = {}
+
+def read_config_file(config_file):
+    """Return raw values from a config file, cached until its mtime changes"""
+    return _load(config_file)[1]
+
+def load_settings(config_file=None):
+    """Return Settings for a config file, re-parsing only when it changes"""
+    _, _, settings, error = _load(config_file or Path.home() / '.bananachat.json')
+    if error is not None:
+        raise ValueError(str(error))
+    return settings
+
+def _load(config_file):
+    config_file = Path(config_file)
+    try:
+        stat = config_file.stat()
+        mtime = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    except FileNotFoundError:
+        mtime = None
+
+    cached = _cache.get(config_file)
+    if cached and cached[0] == mtime:
+        return cached
+
+    raw = {}
+    if mtime is not None:
+        try:
+            with open(config_file) as f:
+                raw = json.load(f)
+        except json.JSONDecodeError:
+            raw = {}
+    try:
+        entry = (mtime, raw, Settings.from_dict({**raw, **env_overrides()}), None)
+    except ValueError as e:
+        entry = (mtime, raw, None, e)
+    _cache[config_file] = entry
+    return entry
 
 class Config:
     def __init__(self):
         self.config_file = Path.home() / '.bananachat.json'
-        self.defaults = {
-            'github_token': '',
-            'owner': '',
-            'repo': '',
-            'cache_dir': str(Path.home() / '.bananachat' / 'cache'),
-            'messages_dir': 'messages'
-        }
+        self.defaults = Settings().as_dict()
         self.settings = self.load_config()
+        self.values = self._load_values()
 
     def load_config(self):
-        """Load config from file or create with defaults"""
-        if self.config_file.exists():
-            try:
-                with open(self.config_file) as f:
-                    return {**self.defaults, **json.load(f)}
-            except json.JSONDecodeError:
-                return self.defaults
-        return self.defaults
+        """Load config from file merged over the defaults"""
+        return {**self.defaults, **read_config_file(self.config_file)}
 
     def save_config(self):
-        """Save current config to file"""
+        """Atomically save current config to file"""
         self.config_file.parent.mkdir(parents=True, exist_ok=True)
-        with open(self.config_file, 'w') as f:
-            json.dump(self.settings, f, indent=2)
+        fd, tmp_path = tempfile.mkstemp(dir=self.config_file.parent, prefix='.bananachat.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.settings, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.config_file)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+        self.values = self._load_values()
+
+    def _load_values(self):
+        """Parsed settings; invalid values are logged and fall back to defaults.
+
+        One invalid value must not keep `cli config` or `show-config` from
+        working, so the rest of the file still applies.
+        """
+        try:
+            return load_settings(self.config_file)
+        except ValueError:
+            settings, errors = Settings.lenient({**read_config_file(self.config_file), **env_overrides()})
+            for error in errors:
+                logger.warning(f"Ignoring invalid setting in {self.config_file}: {error}")
+            return settings
 
     def get(self, key):
-        """Get a config value, first checking env vars"""
-        env_var = f'BANANACHAT_{key.upper()}'
-        return os.getenv(env_var, self.settings.get(key, self.defaults.get(key)))
+        """Get a config value; env overrides are applied when the file is parsed"""
+        key = KEY_ALIASES.get(key, key)
+        if key in self.defaults:
+            return getattr(self.values, key)
+        return self.settings.get(key)
 
     def set(self, key, value):
-        """Set a config value and save"""
+        """Validate, set a config value and save"""
+        key = KEY_ALIASES.get(key, key)
+        if key in self.defaults:
+            # Only the new value is checked, so a bad one elsewhere can be fixed
+            Settings.from_dict({key: value})
+            value = coerce(key, value, type(self.defaults[key]))
         self.settings[key] = value
         self.save_config()
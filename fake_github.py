@@ -0,0 +1,372 @@
+# fake_github.py
+"""Local stand-in for the GitHub API, for offline and load testing.
+
+Serves a messages tree through the REST contents, commits and git trees
+endpoints, raw file downloads, author avatars and a small GraphQL subset, and accepts
+commits through the git data API (trees, commits, ref updates). Latency, page
+sizes, ETags and rate limits behave like GitHub's so the client's
+concurrency and retry behaviour can be measured realistically:
+
+    python fake_github.py --messages-dir messages --port 9000 --latency 50
+    cli config github_api_url http://localhost:9000
+"""
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import urllib.parse
+from datetime import datetime
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from avatars import placeholder_svg
+
+# GitHub's contents API lists at most this many directory entries
+CONTENTS_LIMIT = 1000
+
+class FakeRepo:
+    """In-memory repository: path -> message with author, date and shas"""
+
+    def __init__(self, owner='fake', name='bananachat', branch='main'):
+        self.owner = owner
+        self.name = name
+        self.branch = branch
+        self.files = {}
+        self.lock = threading.RLock()
+        # Objects created through the git data API: sha -> tree or commit
+        self.trees = {}
+        self.commits = {}
+
+    @classmethod
+    def from_messages(cls, messages, **kwargs):
+        """Build a repo from Message objects"""
+        repo = cls(**kwargs)
+        for msg in messages:
+            repo.add_file(f"messages/{msg.filename}", msg.content, msg.author, msg.date, msg.commit_hash)
+        return repo
+
+    @classmethod
+    def from_directory(cls, messages_dir, **kwargs):
+        """Build a repo from .txt files on disk, dated by mtime"""
+        repo = cls(**kwargs)
+        root = Path(messages_dir)
+        for path in sorted(root.rglob('*.txt')):
+            relative = path.relative_to(root).as_posix()
+            repo.add_file(f'messages/{relative}', path.read_text().strip(), 'fake-user',
+                          datetime.utcfromtimestamp(path.stat().st_mtime))
+        return repo
+
+    def add_file(self, path, content, author, date, commit_sha=None):
+        blob_sha = hashlib.sha1(f'blob {len(content.encode())}\0{content}'.encode()).hexdigest()
+        commit_sha = commit_sha or hashlib.sha1(f'{path}{author}{date}'.encode()).hexdigest()
+        with self.lock:
+            self.files[path] = {
+                'path': path,
+                'content': content,
+                'author': author,
+                'date': date,
+                'sha': blob_sha,
+                'commit_sha': commit_sha,
+            }
+
+    def listing(self, directory):
+        """Direct children of a directory: (files, subdirectory names)"""
+        prefix = directory.rstrip('/') + '/'
+        files, dirs = [], set()
+        for path, entry in sorted(self.files.items()):
+            if not path.startswith(prefix):
+                continue
+            rest = path[len(prefix):]
+            if '/' in rest:
+                dirs.add(rest.split('/', 1)[0])
+            else:
+                files.append(entry)
+        return files, sorted(dirs)
+
+    def head_sha(self):
+        digest = hashlib.sha1()
+        for path, entry in sorted(self.files.items()):
+            digest.update(f"{path}{entry['sha']}".encode())
+        return digest.hexdigest()
+
+class FakeGitHubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if not self._admit():
+            return
+        url = urllib.parse.urlsplit(self.path)
+        params = {k: v[0] for k, v in urllib.parse.parse_qs(url.query).items()}
+        repo = self.server.repo
+        repo_prefix = f'/repos/{repo.owner}/{repo.name}'
+
+        if url.path.startswith(f'/raw/{repo.owner}/{repo.name}/'):
+            path = url.path.split('/', 5)[5]
+            entry = repo.files.get(urllib.parse.unquote(path))
+            if entry:
+                self._send(entry['content'].encode(), 'text/plain; charset=utf-8', etag=entry['sha'])
+            else:
+                self._not_found()
+        elif url.path.startswith(f'{repo_prefix}/contents/'):
+            self._contents(urllib.parse.unquote(url.path[len(f'{repo_prefix}/contents/'):]))
+        elif url.path == f'{repo_prefix}/commits':
+            self._commits(params)
+        elif url.path.startswith(f'{repo_prefix}/git/trees/'):
+            self._tree(params)
+        elif url.path == f'{repo_prefix}/git/ref/heads/{repo.branch}':
+            self._send_json({'ref': f'refs/heads/{repo.branch}', 'object': {'sha': repo.head_sha(), 'type': 'commit'}})
+        elif url.path.startswith(f'{repo_prefix}/git/commits/'):
+            # Trees are not stored separately: a commit's tree has the commit's sha
+            sha = url.path.rsplit('/', 1)[-1]
+            self._send_json({'sha': sha, 'tree': {'sha': sha}})
+        elif url.path == repo_prefix:
+            self._send_json({'full_name': f'{repo.owner}/{repo.name}', 'default_branch': repo.branch})
+        elif url.path.startswith('/avatars/'):
+            # A generated image stands in for the author's avatar
+            body = placeholder_svg(urllib.parse.unquote(url.path[len('/avatars/'):]))
+            self._send(body, 'image/svg+xml', etag=hashlib.sha1(body).hexdigest())
+        else:
+            self._not_found()
+
+    def do_POST(self):
+        if not self._admit():
+            return
+        repo = self.server.repo
+        repo_prefix = f'/repos/{repo.owner}/{repo.name}'
+        request = self._read_json()
+        if self.path == '/graphql':
+            self._send_json(self._graphql(request.get('query', ''), request.get('variables') or {}))
+        elif self.path == f'{repo_prefix}/git/trees':
+            sha = hashlib.sha1(json.dumps(request, sort_keys=True).encode()).hexdigest()
+            repo.trees[sha] = request
+            self._send_json({'sha': sha}, status=201)
+        elif self.path == f'{repo_prefix}/git/commits':
+            sha = hashlib.sha1(json.dumps(request, sort_keys=True).encode() + str(time.time()).encode()).hexdigest()
+            repo.commits[sha] = request
+            self._send_json({'sha': sha, 'tree': {'sha': request.get('tree')}}, status=201)
+        else:
+            self._not_found()
+
+    def do_PATCH(self):
+        if not self._admit():
+            return
+        repo = self.server.repo
+        if self.path != f'/repos/{repo.owner}/{repo.name}/git/refs/heads/{repo.branch}':
+            return self._not_found()
+        request = self._read_json()
+        commit = repo.commits.get(request.get('sha'))
+        if commit is None:
+            return self._send(b'{"message": "Object does not exist"}', 'application/json', 422)
+        tree = repo.trees.get(commit.get('tree'), {})
+        author = (commit.get('author') or {}).get('name', 'fake-user')
+        with repo.lock:
+            if not request.get('force') and commit.get('parents') != [repo.head_sha()]:
+                return self._send(b'{"message": "Update is not a fast forward"}', 'application/json', 422)
+            for item in tree.get('tree', []):
+                if 'sha' in item and item['sha'] is None:
+                    repo.files.pop(item['path'], None)
+                else:
+                    repo.add_file(item['path'], item.get('content', ''), author, datetime.utcnow(), request['sha'])
+        self._send_json({'ref': f'refs/heads/{repo.branch}', 'object': {'sha': repo.head_sha(), 'type': 'commit'}})
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _contents(self, path):
+        repo = self.server.repo
+        if path in repo.files:
+            entry = repo.files[path]
+            return self._send_json(self._content_item(entry))
+        files, dirs = repo.listing(path)
+        if not files and not dirs:
+            return self._not_found()
+        items = [self._content_item(entry) for entry in files]
+        items += [{'type': 'dir', 'name': name, 'path': f'{path}/{name}'} for name in dirs]
+        self._send_json(items[:CONTENTS_LIMIT])
+
+    def _content_item(self, entry):
+        repo = self.server.repo
+        return {
+            'type': 'file',
+            'name': entry['path'].rsplit('/', 1)[-1],
+            'path': entry['path'],
+            'sha': entry['sha'],
+            'size': len(entry['content'].encode()),
+            'download_url': f"{self._base_url()}/raw/{repo.owner}/{repo.name}/{repo.branch}/{urllib.parse.quote(entry['path'])}",
+        }
+
+    def _commits(self, params):
+        repo = self.server.repo
+        path = params.get('path')
+        entries = [repo.files[path]] if path in repo.files else ([] if path else list(repo.files.values()))
+        entries.sort(key=lambda e: e['date'], reverse=True)
+        commits = [{
+            'sha': entry['commit_sha'],
+            'commit': {'author': {
+                'name': entry['author'],
+                'email': f"{entry['author']}@users.noreply.github.com",
+                'date': entry['date'].strftime('%Y-%m-%dT%H:%M:%SZ'),
+            }},
+            'author': {'login': entry['author'], 'avatar_url': f"{self._base_url()}/avatars/{entry['author']}"},
+        } for entry in entries]
+        self._send_page(commits, params, '/repos/{}/{}/commits'.format(repo.owner, repo.name))
+
+    def _tree(self, params):
+        repo = self.server.repo
+        tree = []
+        seen_dirs = set()
+        for path, entry in sorted(repo.files.items()):
+            parts = path.split('/')
+            for depth in range(1, len(parts)):
+                directory = '/'.join(parts[:depth])
+                if directory not in seen_dirs:
+                    seen_dirs.add(directory)
+                    tree.append({'path': directory, 'type': 'tree', 'mode': '040000'})
+            tree.append({'path': path, 'type': 'blob', 'mode': '100644', 'sha': entry['sha'],
+                         'size': len(entry['content'].encode())})
+        if params.get('recursive') not in ('1', 'true'):
+            tree = [item for item in tree if '/' not in item['path']]
+        self._send_json({'sha': repo.head_sha(), 'tree': tree, 'truncated': False})
+
+    def _graphql(self, query, variables):
+        """Answer the two query shapes the client needs: tree entries and path history"""
+        repo = self.server.repo
+        if 'history' in query:
+            path = variables.get('path', '')
+            entry = repo.files.get(path)
+            nodes = []
+            if entry:
+                nodes.append({
+                    'oid': entry['commit_sha'],
+                    'author': {'name': entry['author'], 'date': entry['date'].strftime('%Y-%m-%dT%H:%M:%SZ')},
+                })
+            return {'data': {'repository': {'object': {'history': {'nodes': nodes}}}}}
+        if 'entries' in query:
+            expression = variables.get('expression', f'{repo.branch}:messages')
+            directory = expression.split(':', 1)[-1]
+            files, dirs = repo.listing(directory)
+            entries = [{'name': e['path'].rsplit('/', 1)[-1], 'type': 'blob', 'oid': e['sha'],
+                        'object': {'text': e['content']}} for e in files]
+            entries += [{'name': name, 'type': 'tree', 'object': {}} for name in dirs]
+            return {'data': {'repository': {'object': {'entries': entries}}}}
+        return {'errors': [{'message': 'Unsupported query for fake GitHub server'}]}
+
+    def _send_page(self, items, params, path):
+        """Send one page of items with a GitHub-style Link header"""
+        per_page = min(int(params.get('per_page', 30)), 100)
+        page = max(int(params.get('page', 1)), 1)
+        last = max((len(items) + per_page - 1) // per_page, 1)
+        links = []
+        for rel, number in (('next', page + 1), ('last', last)):
+            if page < last:
+                query = urllib.parse.urlencode({**params, 'per_page': per_page, 'page': number})
+                links.append(f'<{self._base_url()}{path}?{query}>; rel="{rel}"')
+        start = (page - 1) * per_page
+        headers = {'Link': ', '.join(links)} if links else {}
+        self._send_json(items[start:start + per_page], headers)
+
+    def _admit(self):
+        """Apply latency and rate limiting; returns False if the request was rejected"""
+        server = self.server
+        if server.latency:
+            time.sleep(max(server.latency + random.uniform(-server.jitter, server.jitter), 0) / 1000)
+        with server.rate_lock:
+            now = time.time()
+            if now >= server.rate_reset:
+                server.rate_reset = now + server.rate_window
+                server.rate_remaining = server.rate_limit
+            server.rate_remaining -= 1
+            self._rate_headers = {
+                'X-RateLimit-Limit': str(server.rate_limit),
+                'X-RateLimit-Remaining': str(max(server.rate_remaining, 0)),
+                'X-RateLimit-Reset': str(int(server.rate_reset)),
+            }
+            exhausted = server.rate_remaining < 0
+        if exhausted:
+            self._send(b'{"message": "API rate limit exceeded"}', 'application/json', 403,
+                       headers={'Retry-After': str(int(server.rate_reset - time.time()) + 1)})
+            return False
+        return True
+
+    def _send_json(self, data, headers=None, status=200):
+        body = json.dumps(data).encode()
+        self._send(body, 'application/json; charset=utf-8', status, headers=headers,
+                   etag=hashlib.sha1(body).hexdigest())
+
+    def _send(self, body, content_type, status=200, headers=None, etag=None):
+        if etag and status == 200:
+            headers = {**(headers or {}), 'ETag': f'"{etag}"'}
+            if self.headers.get('If-None-Match') == f'"{etag}"':
+                status, body = 304, b''
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in {**self._rate_headers, **(headers or {})}.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self):
+        self._send(b'{"message": "Not Found"}', 'application/json', 404)
+
+    def _base_url(self):
+        return f"http://{self.headers.get('Host', '%s:%d' % self.server.server_address[:2])}"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+class FakeGitHubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, repo, latency=0, jitter=0, rate_limit=5000, rate_window=3600, verbose=False):
+        super().__init__(address, FakeGitHubHandler)
+        self.repo = repo
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.rate_remaining = rate_limit
+        self.rate_reset = time.time() + rate_window
+        self.rate_lock = threading.Lock()
+        self.verbose = verbose
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+def start_fake_github(messages, **kwargs):
+    """Serve messages on a background thread; returns (server, base_url)"""
+    repo = FakeRepo.from_messages(messages, owner=kwargs.pop('owner', 'fake'), name=kwargs.pop('name', 'bananachat'))
+    server = FakeGitHubServer(('127.0.0.1', kwargs.pop('port', 0)), repo, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.base_url
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a messages tree through a fake GitHub API.")
+    parser.add_argument("--messages-dir", default="messages", help="Directory to serve (default: messages)")
+    parser.add_argument("--owner", default="fake", help="Repository owner (default: fake)")
+    parser.add_argument("--repo", default="bananachat", help="Repository name (default: bananachat)")
+    parser.add_argument("--port", type=int, default=9000, help="Port to listen on (default: 9000)")
+    parser.add_argument("--latency", type=float, default=0, help="Added latency per request in ms")
+    parser.add_argument("--jitter", type=float, default=0, help="Random +/- latency jitter in ms")
+    parser.add_argument("--rate-limit", type=int, default=5000, help="Requests allowed per window (default: 5000)")
+    parser.add_argument("--rate-window", type=int, default=3600, help="Rate limit window in seconds (default: 3600)")
+    parser.add_argument("--verbose", action="store_true", help="Log each request")
+    args = parser.parse_args()
+
+    repo = FakeRepo.from_directory(args.messages_dir, owner=args.owner, name=args.repo)
+    server = FakeGitHubServer(("", args.port), repo, latency=args.latency, jitter=args.jitter,
+                              rate_limit=args.rate_limit, rate_window=args.rate_window, verbose=args.verbose)
+    print(f"Fake GitHub API for {args.owner}/{args.repo} ({len(repo.files)} files) on http://localhost:{args.port}")
+    print(f"Point the client at it with: cli config github_api_url http://localhost:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# file_lock.py
+import os
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+# One in-process record per lock file: the thread lock threads queue on
+# before touching flock, and the descriptor and depth of its holder
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+class _LockState:
+    __slots__ = ('lock', 'fd', 'depth')
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.fd = None
+        self.depth = 0
+
+class FileLock:
+    """Exclusive advisory lock shared by every process using the same file.
+
+    Re-entrant within a thread. Readers never take it; it only orders
+    writers. On platforms without fcntl it degrades to a thread lock.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        # Shared by every FileLock on this path, so nesting two of them in
+        # one thread takes flock once instead of deadlocking on it
+        with _thread_locks_guard:
+            self._state = _thread_locks.setdefault(str(self.path.resolve()), _LockState())
+
+    def acquire(self):
+        state = self._state
+        state.lock.acquire()
+        try:
+            if state.depth == 0 and fcntl is not None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                except BaseException:
+                    os.close(fd)
+                    raise
+                state.fd = fd
+        except BaseException:
+            state.lock.release()
+            raise
+        state.depth += 1
+
+    def release(self):
+        state = self._state
+        state.depth -= 1
+        if state.depth == 0 and state.fd is not None:
+            fcntl.flock(state.fd, fcntl.LOCK_UN)
+            os.close(state.fd)
+            state.fd = None
+        state.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -11,12 +11,12 @@ from template_manager import TemplateManager
 def main():
     # Initialize components
     chat = ChatSystem()
-    formatter = MessageFormatter()
+    formatter = MessageFormatter(chat.authors)
     template = TemplateManager()
     
     # Get messages from cache or fetch new ones
     chat.update_cache()
-    messages = chat.cache.get_messages()
+    messages = chat.timeline()
     
     # Format messages for display
     formatted_messages = formatter.format_messages(messages)
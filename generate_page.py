@@ -1,20 +1,25 @@
 import os
+import hashlib
 
 # Define the path to the directory containing message files
 messages_dir = "messages"
 
-# Set to store unique file paths
-unique_message_files = set()
+# Content hash -> first file path seen with that content
+unique_messages = {}
 
-# Traverse the messages directory, including subdirectories
-for root, _, files in os.walk(messages_dir):
-    for file in files:
+# Traverse the messages directory, including subdirectories; nested clones
+# repeat the same files, so messages are deduplicated by content, not path
+for root, dirs, files in os.walk(messages_dir):
+    dirs.sort()
+    for file in sorted(files):
         if file.endswith(".txt"):  # Only include .txt files
             file_path = os.path.join(root, file)
-            unique_message_files.add(file_path)  # Automatically ignore duplicates
+            with open(file_path, "r") as f:
+                content = f.read().strip()
+            unique_messages.setdefault(hashlib.sha256(content.encode()).hexdigest(), (file_path, content))
 
-# Convert set to a sorted list
-sorted_message_files = sorted(unique_message_files)
+# Sort the unique messages by path
+sorted_messages = sorted(unique_messages.values())
 
 # Create HTML structure
 html_content = """
@@ -71,11 +76,7 @@ html_content = """
 """
 
 # Loop through the unique sorted files and add each to the HTML
-for index, filepath in enumerate(sorted_message_files):
-    # Read the content of each text file
-    with open(filepath, "r") as file:
-        content = file.read().strip()
-    
+for index, (filepath, content) in enumerate(sorted_messages):
     # Determine if the message is 'sent' or 'received' based on index
     message_class = "sent" if index % 2 == 0 else "received"
 
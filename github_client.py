@@ -1,37 +1,208 @@
 # github_client.py
-import requests
+import time
+import hashlib
+import logging
 from datetime import datetime
-from logger import logger
+from logger import get_logger, timed
+from message import Message
+from segments import SEGMENT_PATTERN
+
+logger = get_logger(__name__)
+
+GITHUB_API_URL = 'https://api.github.com'
+GITHUB_RAW_URL = 'https://raw.githubusercontent.com'
+
+# The contents API silently truncates directory listings at this many entries
+CONTENTS_LIMIT = 1000
+
+def blob_sha(data):
+    """Git blob SHA of file contents, as reported by the contents API"""
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
 
 class GitHubClient:
-    def __init__(self, token, owner, repo):
+    def __init__(self, token, owner, repo, api_url=GITHUB_API_URL, raw_url=None, branch=None):
+        self.api_url = api_url.rstrip('/')
+        if not raw_url:
+            raw_url = GITHUB_RAW_URL if self.api_url == GITHUB_API_URL else f'{self.api_url}/raw'
+        self.raw_url = raw_url.rstrip('/')
         self.owner = owner
         self.repo = repo
-        self.session = requests.Session()
-        self.session.headers.update({
-            'Authorization': f'token {token}',
-            'Accept': 'application/vnd.github.v3+json'
-        })
+        self.token = token
+        self.branch = branch or None
+        # Commit author name -> GitHub avatar URL, collected while fetching
+        self.authors = {}
+        self._session = None
+
+    @property
+    def session(self):
+        """HTTP session, created on first request so requests is imported lazily"""
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+            self._session.headers.update({
+                'Authorization': f'token {self.token}',
+                'Accept': 'application/vnd.github.v3+json'
+            })
+        return self._session
+
+    @property
+    def repo_url(self):
+        return f'{self.api_url}/repos/{self.owner}/{self.repo}'
+
+    @property
+    def default_branch(self):
+        """Branch commits are published to, looked up once if not configured"""
+        if self.branch is None:
+            response = self.session.get(self.repo_url)
+            response.raise_for_status()
+            self.branch = response.json()['default_branch']
+        return self.branch
+
+    def commit_files(self, files, message, retries=3):
+        """Commit {path: content} to the default branch as a single commit.
+
+        Uses the git data API: read the branch ref and its commit, create a
+        tree holding the new contents inline (so no per-file blob calls),
+        create the commit and fast-forward the ref. If the branch moved in
+        the meantime GitHub rejects the ref update with 422, and the commit
+        is rebuilt on the new head, up to `retries` times. Returns the sha
+        of the new commit.
+        """
+        branch = self.default_branch
+        tree = [{'path': path, 'mode': '100644', 'type': 'blob', 'content': content}
+                for path, content in files.items()]
+        for attempt in range(retries + 1):
+            parent = self._call('get', f'/git/ref/heads/{branch}')['object']['sha']
+            base_tree = self._call('get', f'/git/commits/{parent}')['tree']['sha']
+            new_tree = self._call('post', '/git/trees', {'base_tree': base_tree, 'tree': tree})['sha']
+            commit = self._call('post', '/git/commits', {'message': message, 'tree': new_tree, 'parents': [parent]})['sha']
+            response = self.session.patch(f'{self.repo_url}/git/refs/heads/{branch}', json={'sha': commit, 'force': False})
+            if response.status_code == 422 and attempt < retries:
+                logger.info(f"{branch} moved while committing, retrying ({attempt + 1}/{retries})")
+                time.sleep(0.1 * 2 ** attempt)
+                continue
+            response.raise_for_status()
+            logger.info(f"Committed {len(files)} files to {self.owner}/{self.repo}", extra={'commit': commit})
+            return commit
 
     def get_messages(self):
         """Fetch all messages from the repository"""
+        return list(self.iter_messages())
+
+    def iter_messages(self, known=None):
+        """Yield messages as their listing pages and files arrive.
+
+        known maps filenames to previously fetched messages; a file whose
+        blob SHA is unchanged is yielded from there without downloading it.
+        """
+        known = known or {}
         try:
-            url = f'https://api.github.com/repos/{self.owner}/{self.repo}/contents/messages'
-            response = self.session.get(url)
-            response.raise_for_status()
-            contents = response.json()
-            
-            messages = []
-            for item in contents:
-                if item['type'] == 'file' and item['name'].endswith('.txt'):
-                    message = self._process_message_file(item)
+            count = reused = 0
+            with timed(logger, "Fetched messages from GitHub", logging.INFO, repo=f'{self.owner}/{self.repo}'):
+                for item in self.iter_message_files():
+                    cached = known.get(item['name'])
+                    if cached is not None and item.get('sha') and cached.blob_sha == item['sha']:
+                        reused += 1
+                        message = cached
+                    else:
+                        message = self._process_message_file(item)
                     if message:
-                        messages.append(message)
-            return messages
+                        count += 1
+                        yield message
+            logger.debug(f"Fetched {count} messages", extra={'messages': count, 'reused': reused})
         except Exception as e:
             logger.error(f"Error fetching messages: {e}")
             raise
 
+    def iter_message_files(self):
+        """Yield message file entries from messages/ and its monthly segment
+        directories, switching to the git tree listing for large directories"""
+        seen = set()
+        pending = ['messages']
+        truncated = False
+        for directory in pending:
+            entries = 0
+            for item in self._paginate(f'{self.repo_url}/contents/{directory}'):
+                entries += 1
+                if item['type'] == 'file' and item['name'].endswith('.txt'):
+                    seen.add(item['path'])
+                    yield item
+                elif item['type'] == 'dir' and directory == 'messages' and SEGMENT_PATTERN.match(item['name']):
+                    # Monthly segments (see segments.py) are listed after the top level
+                    pending.append(item['path'])
+            truncated = truncated or entries >= CONTENTS_LIMIT
+        if not truncated:
+            return
+
+        # A listing may have been truncated: pick up the remaining files
+        # from the recursive tree of the default branch.
+        logger.info("Message directory reached the contents API limit, using the git tree listing")
+        for item in self._iter_tree_files('messages'):
+            if item['path'] not in seen:
+                yield item
+
+    def get_file(self, path, ref='HEAD'):
+        """Return (text, blob SHA) of a file at ref, fetched without any listing call"""
+        response = self.session.get(f'{self.raw_url}/{self.owner}/{self.repo}/{ref}/{path}')
+        response.raise_for_status()
+        return response.text, blob_sha(response.content)
+
+    def iter_commits(self, path=None, per_page=100):
+        """Yield commits touching path, newest first, one page at a time"""
+        params = {'per_page': per_page}
+        if path:
+            params['path'] = path
+        yield from self._paginate(f'{self.repo_url}/commits', params)
+
+    def get_last_commit(self, path):
+        """Return the most recent commit touching path, or None"""
+        response = self.session.get(f'{self.repo_url}/commits', params={'path': path, 'per_page': 1})
+        response.raise_for_status()
+        commits = response.json()
+        return commits[0] if commits else None
+
+    def _iter_tree_files(self, directory, ref='HEAD'):
+        """Yield contents-style entries for .txt blobs under directory or its segments"""
+        response = self.session.get(f'{self.repo_url}/git/trees/{ref}', params={'recursive': 1})
+        response.raise_for_status()
+        tree = response.json()
+        if tree.get('truncated'):
+            logger.warning("Git tree listing was truncated by GitHub; some messages may be missing")
+        prefix = directory.rstrip('/') + '/'
+        for entry in tree.get('tree', []):
+            path = entry['path']
+            if entry['type'] != 'blob' or not path.startswith(prefix) or not path.endswith('.txt'):
+                continue
+            segment, _, name = path[len(prefix):].rpartition('/')
+            if segment and not SEGMENT_PATTERN.match(segment):
+                continue
+            yield {
+                'type': 'file',
+                'name': name,
+                'path': path,
+                'sha': entry.get('sha'),
+                'download_url': f'{self.raw_url}/{self.owner}/{self.repo}/{ref}/{path}'
+            }
+
+    def _call(self, method, path, payload=None):
+        response = self.session.request(method, f'{self.repo_url}{path}', json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    def _paginate(self, url, params=None):
+        """Yield items from a list endpoint, following Link rel="next" headers"""
+        while url:
+            response = self.session.get(url, params=params)
+            response.raise_for_status()
+            data = response.json()
+            if isinstance(data, list):
+                yield from data
+            else:
+                yield data
+            url = response.links.get('next', {}).get('url')
+            # The next link already carries the query string
+            params = None
+
     def _process_message_file(self, item):
         """Process a single message file"""
         try:
@@ -39,32 +210,26 @@ class GitHubClient:
             response = self.session.get(item['download_url'])
             response.raise_for_status()
             content = response.text.strip()
-            
+
             # Get commit info
-            commits_url = f'https://api.github.com/repos/{self.owner}/{self.repo}/commits'
-            commits_response = self.session.get(commits_url, params={'path': f"messages/{item['name']}"})
-            commits_response.raise_for_status()
-            commits = commits_response.json()
-            
-            if commits:
-                author = commits[0]['commit']['author']['name']
+            commit = self.get_last_commit(item.get('path') or f"messages/{item['name']}")
+
+            if commit:
+                author = commit['commit']['author']['name']
+                avatar_url = (commit.get('author') or {}).get('avatar_url')
+                if avatar_url:
+                    self.authors[author] = avatar_url
                 date = datetime.strptime(
-                    commits[0]['commit']['author']['date'],
+                    commit['commit']['author']['date'],
                     '%Y-%m-%dT%H:%M:%SZ'
                 )
-                commit_hash = commits[0]['sha']
+                commit_hash = commit['sha']
             else:
                 author = "unknown"
                 date = datetime.now()
                 commit_hash = None
-            
-            return {
-                'filename': item['name'],
-                'content': content,
-                'author': author,
-                'date': date,
-                'commit_hash': commit_hash
-            }
+
+            return Message(item['name'], content, author, date, commit_hash, item.get('sha'))
         except Exception as e:
             logger.error(f"Error processing message {item['name']}: {e}")
             return None
@@ -1,63 +1,81 @@
 # html_generator.py
-import html
 from datetime import datetime
+from operator import attrgetter
 from pathlib import Path
+import metrics
+from author_registry import AuthorRegistry
+from config import load_settings
+from message import dedupe
+from profiling import phase
+from segments import MessageStore
 from template_manager import TemplateManager
 
 class HtmlGenerator:
-    def __init__(self):
-        self.template = TemplateManager()
+    def __init__(self, synced=None, assets=None, threads=None, avatars=False, authors=None):
+        self.template = TemplateManager(assets, threads, avatars)
+        self.threads = threads
+        # AuthorRegistry giving each author's color and display name
+        self.authors = authors if authors is not None else AuthorRegistry()
+        # SyncWorker whose GitHub messages are shown alongside local ones
+        self.synced = synced
         self.messages_dir = Path("messages")
+        self.store = MessageStore(self.messages_dir)
+        self.dedup_policy = load_settings().dedup_policy
 
-    def generate_html(self):
-        """Generate HTML for the chat interface"""
-        messages = self._get_messages()
-        return self.template.render(
-            title="BananaChat",
-            messages=self._format_messages(messages),
-            last_updated=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        )
-
-    def _get_messages(self):
-        """Get all messages from the messages directory"""
+    def generate_html(self, limit=None, since=None):
+        """Generate HTML for the chat interface, optionally only the newest messages"""
+        with metrics.render_latency.time():
+            with phase('load'):
+                messages = self._get_messages(limit, since)
+            metrics.message_count.set(len(messages))
+            with phase('render'):
+                return self.template.render(
+                    title="BananaChat",
+                    messages=self.authors.present(messages),
+                    last_updated=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                )
+
+    def generate_search_html(self, query, results, total, page, per_page):
+        """Generate HTML for a page of search results"""
+        with phase('render'):
+            return self.template.render_search(
+                title="BananaChat",
+                query=query,
+                messages=self.authors.present(results),
+                total=total,
+                page=page,
+                per_page=per_page
+            )
+
+    def generate_thread_html(self, root, page=1, per_page=50):
+        """Generate HTML for one page of a thread, or None if there is no such thread"""
+        with phase('load'):
+            entries, summary = self.threads.thread(root, page, per_page) if self.threads else ([], None)
+        if summary is None:
+            return None
+        self.authors.present(msg for msg, _ in entries)
+        with phase('render'):
+            return self.template.render_thread("BananaChat", entries, summary, page, per_page)
+
+    def _get_messages(self, limit=None, since=None):
+        """Get messages from the messages directory, newest first"""
         messages = []
         try:
-            # Get all message files
-            for file in self.messages_dir.glob("*.txt"):
-                try:
-                    content = file.read_text().strip()
-                    # Get both creation and modification times
-                    stats = file.stat()
-                    # Use the more recent of ctime or mtime
-                    timestamp = max(stats.st_ctime, stats.st_mtime)
-
-                    messages.append({
-                        'content': content,
-                        'filename': file.name,
-                        'date': datetime.fromtimestamp(timestamp)
-                    })
-                except Exception as e:
-                    print(f"Error reading {file}: {e}")
+            # Only the segments holding the requested messages are read
+            messages = self.store.latest(limit, since)
+            if self.synced is not None:
+                # Local files are usually a checkout of the same repository;
+                # the synced copy carries the real author and commit date
+                merged = {msg.key: msg for msg in messages}
+                merged.update((msg.key, msg) for msg in self.synced.latest(limit, since))
+                messages = list(merged.values())
+            messages = dedupe(messages, self.dedup_policy)
 
             # Sort messages by date, newest first
-            messages.sort(key=lambda x: x['date'], reverse=True)
+            messages.sort(key=attrgetter('timestamp'), reverse=True)
+            messages = messages[:limit]
 
         except Exception as e:
             print(f"Error accessing messages directory: {e}")
 
         return messages
-
-    def _format_messages(self, messages):
-        """Format messages for display"""
-        # Messages are already sorted in _get_messages()
-        return [self._format_message(msg) for msg in messages]
-
-    def _format_message(self, msg):
-        return {
-            'content': html.escape(msg['content']),
-            'author': 'Anonymous',
-            'timestamp': msg['date'].strftime('%Y-%m-%d %H:%M:%S'),
-            'filename': html.escape(msg['filename']),
-            'color_class': 'bg-gray-100',
-            'is_system_msg': False
-        }
\ No newline at end of file
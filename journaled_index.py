@@ -0,0 +1,251 @@
+# journaled_index.py
+"""JSON indexes kept up to date through an append-only journal.
+
+The full index is stored as JSON; changes made since it was written are
+appended to a journal beside it (``.log``), one JSON line each, so a
+change costs one small write. Loading reads the index and replays the
+journal. The journal is folded back into the index by every sync, and
+once it holds JOURNAL_LIMIT entries, since a server that only takes posts
+never syncs.
+
+The server and a cron `update-cache` may share the files, so writers take
+a FileLock (``.lock``) and first catch up with what the other process
+saved or journaled; readers pick such changes up within REFRESH_INTERVAL.
+
+Messages posted to this server are marked local: they are not in the
+GitHub listing until they are published, so a sync does not prune them.
+"""
+import os
+import json
+import time
+import tempfile
+import threading
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from file_lock import FileLock
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Journal entries replayed on load before the index is rewritten in full
+JOURNAL_LIMIT = 1000
+# Seconds between checks for changes made by another process
+REFRESH_INTERVAL = 1.0
+
+def _signature(path):
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+def _size(path):
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+class JournaledIndex:
+    """Base for indexes saved as a JSON snapshot plus a journal.
+
+    Subclasses hold their state in attributes set by _reset and provide
+    _restore (snapshot data -> state), _snapshot (state -> copy safe to
+    write outside the lock) and _replay (apply one journal entry). Changes
+    are made inside _writing() and journaled with _journal.
+    """
+
+    # Name used in log messages
+    kind = 'index'
+
+    def __init__(self, index_path=None):
+        self.index_path = Path(index_path) if index_path else None
+        self.journal_path = self.index_path.with_suffix('.log') if self.index_path else None
+        self.file_lock = FileLock(self.index_path.with_suffix('.lock')) if self.index_path else None
+        self.journaled = 0
+        self.lock = threading.RLock()
+        # What of the files on disk is reflected in memory
+        self._snapshot_signature = None
+        self._journal_offset = 0
+        self._checked = 0
+        self._reset()
+        if self.index_path:
+            self.load()
+
+    def load(self):
+        """Load the index and replay any journaled changes"""
+        with self.file_lock, self.lock:
+            self._reset()
+            self.journaled = 0
+            self._journal_offset = 0
+            try:
+                self._snapshot_signature = _signature(self.index_path)
+                if self._snapshot_signature is not None:
+                    with open(self.index_path) as f:
+                        self._restore(json.load(f))
+                # A journal being compacted when a process stopped comes first
+                self._replay_from(self._compacting_path(), 0)
+                self._journal_offset = self._replay_from(self.journal_path, 0)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Error loading {self.kind}, rebuilding: {e}")
+                self._reset()
+            self._checked = time.monotonic()
+
+    def refresh(self):
+        """Pick up changes another process saved or journaled, at most every REFRESH_INTERVAL"""
+        if not self.index_path or time.monotonic() - self._checked < REFRESH_INTERVAL:
+            return
+        self._checked = time.monotonic()
+        if self._changed_on_disk():
+            with self._writing():
+                pass
+
+    def save(self):
+        """Write the full index and truncate the journal.
+
+        The index is copied under the lock and written outside it, so
+        readers are not held up by the write. Changes made meanwhile in
+        this process wait for the file lock and go to a fresh journal.
+        """
+        if not self.index_path:
+            return
+        with self.file_lock:
+            try:
+                compacting = self._compacting_path()
+                with self.lock:
+                    self._catch_up()
+                    data = self._snapshot()
+                    if self.journal_path.exists():
+                        os.replace(self.journal_path, compacting)
+                    self.journaled = 0
+                    self._journal_offset = 0
+                self.index_path.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=self.index_path.parent, prefix=f'{self.index_path.name}.', suffix='.tmp')
+                try:
+                    with os.fdopen(fd, 'w') as f:
+                        json.dump(data, f, separators=(',', ':'))
+                    os.replace(tmp_path, self.index_path)
+                except BaseException:
+                    Path(tmp_path).unlink(missing_ok=True)
+                    raise
+                self._snapshot_signature = _signature(self.index_path)
+                compacting.unlink(missing_ok=True)
+            except Exception as e:
+                logger.error(f"Error saving {self.kind}: {e}")
+                raise
+
+    @contextmanager
+    def _writing(self):
+        """Hold the file lock, with memory caught up with the files"""
+        with self.file_lock or nullcontext():
+            if self.index_path:
+                with self.lock:
+                    self._catch_up()
+            yield
+
+    def _changed_on_disk(self):
+        return (_signature(self.index_path) != self._snapshot_signature
+                or _size(self.journal_path) != self._journal_offset)
+
+    def _catch_up(self):
+        # Called holding the file lock
+        if _signature(self.index_path) != self._snapshot_signature or _size(self.journal_path) < self._journal_offset:
+            # Another process compacted: its snapshot holds everything up to now
+            self.load()
+        elif _size(self.journal_path) > self._journal_offset:
+            self._journal_offset = self._replay_from(self.journal_path, self._journal_offset)
+
+    def _replay_from(self, journal, offset):
+        """Replay complete journal lines from a byte offset; returns the offset reached"""
+        try:
+            with open(journal, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    self._replay(json.loads(line))
+                    self.journaled += 1
+                    offset += len(line)
+        except FileNotFoundError:
+            pass
+        return offset
+
+    def _journal(self, entry):
+        # Called inside _writing(), so the journal ends where this process last read it
+        if not self.journal_path:
+            return
+        try:
+            line = (json.dumps(entry, separators=(',', ':')) + '\n').encode()
+            self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.journal_path, 'ab') as f:
+                f.write(line)
+            self._journal_offset += len(line)
+            self.journaled += 1
+        except Exception as e:
+            logger.error(f"Error writing {self.kind} journal: {e}")
+
+    def _compacting_path(self):
+        return self.journal_path.with_suffix('.log.compacting')
+
+    def _compact(self):
+        if self.journaled >= JOURNAL_LIMIT:
+            self.save()
+
+    def _reset(self):
+        raise NotImplementedError
+
+    def _restore(self, data):
+        raise NotImplementedError
+
+    def _snapshot(self):
+        raise NotImplementedError
+
+    def _replay(self, entry):
+        raise NotImplementedError
+
+class MessageIndex(JournaledIndex):
+    """Journaled index with an entry per message, kept in line with listings.
+
+    Subclasses provide _add_message, _remove_message and _local_keys.
+    """
+
+    def add_message(self, msg, local=False):
+        """Add a single message, journaling the change; local marks a message posted here"""
+        with self._writing(), self.lock:
+            changed = self._add_message(msg, local)
+        self._compact()
+        return changed
+
+    def remove_message(self, key):
+        """Drop a message by its Message.key"""
+        with self._writing(), self.lock:
+            self._remove_message(key)
+        self._compact()
+
+    def sync(self, messages):
+        """Bring the index in line with a full message listing"""
+        seen = set()
+        changed = 0
+        with self._writing():
+            for msg in messages:
+                seen.add(msg.key)
+                with self.lock:
+                    if self._add_message(msg):
+                        changed += 1
+            with self.lock:
+                stale = [key for key, local in self._local_keys() if key not in seen and not local]
+                for key in stale:
+                    self._remove_message(key)
+                    changed += 1
+            if changed or self.journaled:
+                self.save()
+        return changed
+
+    def _add_message(self, msg, local=False):
+        raise NotImplementedError
+
+    def _remove_message(self, key):
+        raise NotImplementedError
+
+    def _local_keys(self):
+        """(key, local) for every message in the index"""
+        raise NotImplementedError
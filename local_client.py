@@ -0,0 +1,18 @@
+# local_client.py
+from segments import MessageStore
+
+class LocalClient:
+    """Message source backed by a local checkout of the messages directory"""
+
+    def __init__(self, messages_dir):
+        self.store = MessageStore(messages_dir)
+
+    def get_messages(self, limit=None, since=None):
+        """Read messages from the local messages directory, newest first"""
+        return self.store.latest(limit, since)
+
+    def iter_messages(self, limit=None, since=None):
+        """Yield messages oldest first; with limit only the newest limit of them"""
+        if limit is not None:
+            return reversed(self.store.latest(limit, since))
+        return self.store.iter_oldest(since)
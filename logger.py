@@ -1,18 +1,123 @@
 # logger.py
 import sys
+import json
+import time
+import queue
+import atexit
 import logging
-from pathlib import Path
+import contextvars
+import logging.handlers
+from contextlib import contextmanager
+
+# Set per request/command so every record logged while handling it carries the ID
+request_id = contextvars.ContextVar('request_id', default=None)
+
+# Attributes every LogRecord has; anything else was passed via `extra=`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id'}
+
+class ContextFilter(logging.Filter):
+    """Attach the current request ID to each record"""
+
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        if getattr(record, 'request_id', None):
+            entry['request_id'] = record.request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+_listener = None
+
+def _parse_levels(spec):
+    """Parse 'module=LEVEL,module=LEVEL' into a dict"""
+    levels = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, level = item.partition('=')
+        levels[name.strip()] = level.strip().upper()
+    return levels
 
 def setup_logger():
-    """Configure and return the application logger"""
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('chat.log'),
-            logging.StreamHandler(sys.stdout)
-        ]
+    """Route application logs through a queue to rotating JSON and stderr handlers.
+
+    The console copy goes to stderr so commands that print data on stdout
+    (show --format ndjson, export -o -) keep it machine-readable.
+
+    Callers only pay for putting a record on an in-memory queue; formatting and
+    disk I/O happen on the listener thread.
+    """
+    global _listener
+    app_logger = logging.getLogger('bananachat')
+    if _listener is not None:
+        return app_logger
+
+    from config import Settings, load_settings
+    try:
+        settings = load_settings()
+    except ValueError:
+        settings = Settings()
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        settings.log_file,
+        maxBytes=settings.log_max_bytes,
+        backupCount=settings.log_backups,
+        delay=True
     )
-    return logging.getLogger(__name__)
+    file_handler.setFormatter(JsonFormatter())
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    app_logger.addHandler(queue_handler)
+    app_logger.setLevel(settings.log_level.upper())
+    app_logger.propagate = False
+    for name, level in _parse_levels(settings.log_levels).items():
+        logging.getLogger(f'bananachat.{name}').setLevel(level)
+    return app_logger
+
+def get_logger(name):
+    """Return the logger for a module, e.g. get_logger(__name__)"""
+    setup_logger()
+    return logging.getLogger(f'bananachat.{name}')
+
+@contextmanager
+def log_context(rid):
+    """Tag records logged inside the block with a request ID"""
+    token = request_id.set(rid)
+    try:
+        yield
+    finally:
+        request_id.reset(token)
+
+@contextmanager
+def timed(log, message, level=logging.DEBUG, **fields):
+    """Log message with a duration_ms field once the block finishes"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if log.isEnabledFor(level):
+            duration_ms = round((time.perf_counter() - start) * 1000, 3)
+            log.log(level, message, extra={'duration_ms': duration_ms, **fields})
 
-logger = setup_logger()
+logger = get_logger('app')
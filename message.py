@@ -0,0 +1,173 @@
+# message.py
+import html
+import heapq
+import hashlib
+from datetime import datetime, timezone
+from operator import attrgetter
+
+EPOCH = datetime(1970, 1, 1)
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+SYSTEM_AUTHORS = frozenset({'system', 'admin'})
+
+# What counts as a duplicate when the same text appears more than once:
+#   none    - keep every message
+#   exact   - same text, author and date (mirrored copies of one message)
+#   author  - same text from the same author, at any date
+#   content - same text from anyone
+DEDUP_POLICIES = ('none', 'exact', 'author', 'content')
+
+def content_hash(content):
+    """Key a message body is stored under"""
+    return hashlib.sha256(content.encode()).hexdigest()
+
+def message_key(filename, repo=None):
+    """Key of a message file in repo (owner, repo), or in the primary repository"""
+    return f'{repo[0]}/{repo[1]}/{filename}' if repo else filename
+
+class Message:
+    """A single chat message.
+
+    Messages are created once by a source (GitHub, the cache or the local
+    messages directory) and passed through formatting and rendering as-is.
+    The sort timestamp is computed up front; escaped and formatted strings
+    are computed on first use and memoized.
+    """
+
+    __slots__ = (
+        'filename', 'content', 'author', 'date', 'commit_hash', 'blob_sha', 'repo', 'color_class',
+        'timestamp', '_content_hash', '_content_html', '_author_html', '_filename_html', '_formatted_date'
+    )
+
+    def __init__(self, filename, content, author='Anonymous', date=None, commit_hash=None, blob_sha=None):
+        self.filename = filename
+        self.content = content
+        self.author = author
+        self.date = date or datetime.now()
+        self.commit_hash = commit_hash
+        # Git blob SHA of the file the message was read from, when known
+        self.blob_sha = blob_sha
+        # (owner, repo) for messages from a repository other than the primary one
+        self.repo = None
+        self.color_class = 'bg-gray-100'
+        # Naive dates are treated as UTC, matching GitHub commit dates
+        if self.date.tzinfo is None:
+            self.timestamp = (self.date - EPOCH).total_seconds()
+        else:
+            self.timestamp = self.date.timestamp()
+        self._content_hash = None
+        self._content_html = None
+        self._author_html = None
+        self._filename_html = None
+        self._formatted_date = None
+
+    def __repr__(self):
+        return f'Message({self.filename!r}, author={self.author!r}, date={self.date!r})'
+
+    @property
+    def key(self):
+        """Identity across repositories: the filename, prefixed with owner/repo outside the primary one"""
+        return message_key(self.filename, self.repo)
+
+    @property
+    def content_hash(self):
+        if self._content_hash is None:
+            self._content_hash = content_hash(self.content)
+        return self._content_hash
+
+    @property
+    def content_html(self):
+        if self._content_html is None:
+            self._content_html = html.escape(self.content)
+        return self._content_html
+
+    @property
+    def author_html(self):
+        if self._author_html is None:
+            self._author_html = html.escape(self.author)
+        return self._author_html
+
+    @property
+    def filename_html(self):
+        if self._filename_html is None:
+            self._filename_html = html.escape(self.filename)
+        return self._filename_html
+
+    @property
+    def formatted_date(self):
+        if self._formatted_date is None:
+            self._formatted_date = self.date.strftime(DATE_FORMAT)
+        return self._formatted_date
+
+    def present(self, color_class, author_html):
+        """Set how the author is shown, from their author registry entry"""
+        self.color_class = color_class
+        self._author_html = author_html
+
+    @property
+    def is_system_msg(self):
+        return self.author.lower() in SYSTEM_AUTHORS
+
+    def to_dict(self):
+        """Plain-data form for JSON serialization"""
+        return {
+            'filename': self.filename,
+            'content': self.content,
+            'author': self.author,
+            'date': self.date.isoformat(),
+            'commit_hash': self.commit_hash,
+            'blob_sha': self.blob_sha
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        date = data.get('date')
+        if isinstance(date, str):
+            date = datetime.fromisoformat(date)
+        # Dates are naive UTC throughout, as in webhook.parse_push
+        if date is not None and date.tzinfo is not None:
+            date = date.astimezone(timezone.utc).replace(tzinfo=None)
+        return cls(data['filename'], data['content'], data.get('author', 'Anonymous'),
+                   date, data.get('commit_hash'), data.get('blob_sha'))
+
+_DEDUP_KEYS = {
+    'exact': lambda m: (m.content_hash, m.author, m.timestamp),
+    'author': lambda m: (m.content_hash, m.author),
+    'content': lambda m: m.content_hash,
+}
+
+def dedupe(messages, policy='exact'):
+    """Drop repeated messages under a DEDUP_POLICIES policy, keeping the earliest copy"""
+    if policy == 'none':
+        return list(messages)
+    if policy not in _DEDUP_KEYS:
+        raise ValueError(f"Unknown dedup policy: {policy}")
+
+    key = _DEDUP_KEYS[policy]
+    kept = {}
+    for msg in messages:
+        k = key(msg)
+        current = kept.get(k)
+        if current is None or msg.timestamp < current.timestamp:
+            kept[k] = msg
+    return list(kept.values())
+
+def merge_timelines(streams, policy='exact', newest_first=False):
+    """Lazily merge date-sorted message streams into one timeline.
+
+    Streams must all be sorted oldest first, or all newest first with
+    newest_first=True. A message seen in more than one stream (a fork
+    carrying the same file and commit, or a copy matching the dedup
+    policy) is yielded once.
+    """
+    key = _DEDUP_KEYS.get(policy)
+    seen = set()
+    for msg in heapq.merge(*streams, key=attrgetter('timestamp'), reverse=newest_first):
+        keys = []
+        if msg.commit_hash:
+            keys.append((msg.commit_hash, msg.filename))
+        if key is not None:
+            keys.append(key(msg))
+        if any(k in seen for k in keys):
+            continue
+        seen.update(keys)
+        yield msg
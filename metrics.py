@@ -0,0 +1,144 @@
+# metrics.py
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, registry, name, help_text):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f'{self.name}{_format_labels(key)} {_format_value(value)}')
+        return lines
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not self.registry.enabled:
+            return
+        key = _labels_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        with self.lock:
+            self.values[_labels_key(labels)] = value
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, registry, name, help_text, buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if not self.registry.enabled:
+            return
+        key = _labels_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{self.name}_bucket{_format_labels(key, [("le", le)])} {cumulative}')
+                lines.append(f'{self.name}_sum{_format_labels(key)} {total!r}')
+                lines.append(f'{self.name}_count{_format_labels(key)} {count}')
+        return lines
+
+class Registry:
+    """Holds metrics and renders them in Prometheus text format.
+
+    Metrics are no-ops until the registry is enabled, so instrumented code
+    costs one attribute check when metrics are off.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.metrics = []
+
+    def counter(self, name, help_text):
+        return self._add(Counter(self, name, help_text))
+
+    def gauge(self, name, help_text):
+        return self._add(Gauge(self, name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(self, name, help_text, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+registry = Registry()
+
+http_requests = registry.counter('bananachat_http_requests_total', 'HTTP requests by route, method and status')
+http_latency = registry.histogram('bananachat_http_request_duration_seconds', 'HTTP request latency by route')
+http_bytes = registry.counter('bananachat_http_response_bytes_total', 'Response bytes sent by route')
+render_latency = registry.histogram('bananachat_render_duration_seconds', 'Time spent in HtmlGenerator.generate_html')
+message_count = registry.gauge('bananachat_messages', 'Messages in the last rendered page')
+cache_lookups = registry.counter('bananachat_cache_lookups_total', 'Cache lookups by cache and result (hit or miss)')
+sync_runs = registry.counter('bananachat_sync_runs_total', 'Background syncs by result (ok or error)')
+sync_duration = registry.histogram('bananachat_sync_duration_seconds', 'Time spent in a background sync')
+sync_last_success = registry.gauge('bananachat_sync_last_success_timestamp_seconds', 'Unix time of the last successful background sync')
+post_rejections = registry.counter('bananachat_post_rejections_total', 'Message posts turned away by reason')
+ingest_queue_depth = registry.gauge('bananachat_ingest_queue_depth', 'Accepted messages waiting to be written')
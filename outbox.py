@@ -0,0 +1,126 @@
+# outbox.py
+"""Messages waiting to be published, committed together in one batch.
+
+`send --queue` and `send --publish` add messages here; `flush` (and
+`send --publish`) commit everything pending as a single commit, either
+through a local git checkout or through the GitHub git data API.
+
+Only message files are committed. The monthly segment indexes stay local;
+other clones read each message's date and author from the commit that
+publishes it.
+"""
+import os
+import json
+import time
+import subprocess
+from pathlib import Path
+from file_lock import FileLock
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+def git_toplevel(path):
+    """Root of the git work tree containing path if it has a remote, else None"""
+    try:
+        root = subprocess.run(
+            ['git', '-C', str(path), 'rev-parse', '--show-toplevel'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+        remotes = subprocess.run(['git', '-C', root, 'remote'], capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return Path(root) if remotes.strip() else None
+
+class Outbox:
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.lock = FileLock(self.directory / '.lock')
+
+    def __len__(self):
+        return len(self.pending())
+
+    def add(self, path, content, local_path=None):
+        """Queue content for publishing at path (relative to the repository root)"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entry = {'path': path, 'content': content, 'local_path': str(local_path) if local_path else None}
+        target = self.directory / f'{time.time_ns()}.json'
+        tmp = target.with_name('.' + target.name)
+        tmp.write_text(json.dumps(entry))
+        os.replace(tmp, target)
+        return target.stem
+
+    def pending(self):
+        """Queued (id, entry) pairs, oldest first"""
+        if not self.directory.is_dir():
+            return []
+        entries = []
+        for path in sorted(self.directory.glob('*.json')):
+            with open(path) as f:
+                entries.append((path.stem, json.load(f)))
+        return entries
+
+    def flush(self, github=None, via='auto', retries=3):
+        """Publish every pending message as one commit.
+
+        via='git' commits and pushes from the local checkout the messages
+        were written to, 'api' commits through the GitHub API, and 'auto'
+        uses git when the messages live in a checkout with a remote.
+        Returns (number of messages published, commit sha or None).
+        """
+        with self.lock:
+            pending = self.pending()
+            if not pending:
+                return 0, None
+            entries = [entry for _, entry in pending]
+            message = (f"Add {len(entries)} messages" if len(entries) > 1
+                       else f"Add message {Path(entries[0]['path']).name}")
+
+            root = self._git_root(entries) if via in ('auto', 'git') else None
+            if root is not None:
+                sha = self._publish_git(root, entries, message, retries)
+            elif via == 'git':
+                raise RuntimeError("Messages are not in a git checkout with a remote")
+            else:
+                if github is None:
+                    raise RuntimeError("No GitHub client to publish through")
+                sha = github.commit_files({e['path']: e['content'] for e in entries}, message, retries)
+
+            for entry_id, _ in pending:
+                (self.directory / f'{entry_id}.json').unlink(missing_ok=True)
+            return len(entries), sha
+
+    def _git_root(self, entries):
+        local_paths = [e['local_path'] for e in entries]
+        if not all(local_paths):
+            return None
+        return git_toplevel(Path(local_paths[0]).parent)
+
+    def _publish_git(self, root, entries, message, retries):
+        def git(*args):
+            return subprocess.run(['git', '-C', str(root), *args], capture_output=True, text=True, check=True).stdout
+
+        paths = []
+        for entry in entries:
+            local = Path(entry['local_path'])
+            if not local.exists():
+                local.parent.mkdir(parents=True, exist_ok=True)
+                local.write_text(entry['content'])
+            paths.append(str(local.resolve().relative_to(root)))
+        git('add', '--', *paths)
+        # Nothing is staged when a previous flush committed but failed to push
+        staged = subprocess.run(['git', '-C', str(root), 'diff', '--cached', '--quiet', '--', *paths])
+        if staged.returncode:
+            git('commit', '-m', message, '--', *paths)
+        sha = git('rev-parse', 'HEAD').strip()
+        for attempt in range(retries + 1):
+            try:
+                git('push')
+                break
+            except subprocess.CalledProcessError as e:
+                if attempt == retries:
+                    raise RuntimeError(f"git push failed: {e.stderr.strip()}")
+                # Someone pushed first: replay our commit on top and try again
+                logger.info(f"Push rejected, rebasing and retrying ({attempt + 1}/{retries})")
+                git('pull', '--rebase', '--autostash')
+                sha = git('rev-parse', 'HEAD').strip()
+        return sha
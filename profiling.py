@@ -0,0 +1,115 @@
+# profiling.py
+"""Opt-in profiling of commands and requests, and per-phase timings.
+
+`Profiler.profile` runs cProfile around a command or request and writes a
+``.pstats`` file when it took at least `threshold_ms` (load it with
+``python -m pstats``, snakeviz or flameprof for a flame graph). Only one
+run is profiled at a time; concurrent requests go unprofiled rather than
+wait.
+
+`timings` and `phase` collect how long the load, format and render steps
+of a page took, for the Server-Timing header.
+"""
+import re
+import time
+import cProfile
+import functools
+import threading
+import contextvars
+import urllib.parse
+from contextlib import contextmanager
+from pathlib import Path
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Phase name -> seconds, for the page being built in this context
+_phases = contextvars.ContextVar('phases', default=None)
+
+@contextmanager
+def timings():
+    """Collect the durations of phases run in the enclosed block"""
+    phases = {}
+    token = _phases.set(phases)
+    try:
+        yield phases
+    finally:
+        _phases.reset(token)
+
+@contextmanager
+def phase(name):
+    """Time a step of building a response; free when nothing is collecting"""
+    phases = _phases.get()
+    if phases is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = phases.get(name, 0) + time.perf_counter() - start
+
+def server_timing(phases):
+    """Server-Timing header value for collected phases"""
+    return ', '.join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in phases.items())
+
+def profiled(method):
+    """Profile a request handler's do_* method when the handler's `profiler` is set.
+
+    Only the dispatched request is profiled, after its request line has been
+    read, so an idle connection never holds the profiler.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        profiler = getattr(self, 'profiler', None)
+        if profiler is None:
+            return method(self, *args, **kwargs)
+        with profiler.profile(f"{self.command} {urllib.parse.urlsplit(self.path).path}"):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+class ProfileRun:
+    """One profiled command or request; set label once it is known"""
+
+    def __init__(self, label):
+        self.label = label
+        self.path = None
+
+class Profiler:
+    def __init__(self, output_dir, threshold_ms=0):
+        self.output_dir = Path(output_dir)
+        self.threshold_ms = threshold_ms
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def profile(self, label):
+        """Profile the enclosed block, saving the stats if it was slow enough"""
+        if not self._lock.acquire(blocking=False):
+            yield ProfileRun(label)
+            return
+        run = ProfileRun(label)
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                yield run
+            finally:
+                profiler.disable()
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                if elapsed_ms >= self.threshold_ms:
+                    run.path = self._dump(profiler, run.label, elapsed_ms)
+        finally:
+            self._lock.release()
+
+    def _dump(self, profiler, label, elapsed_ms):
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', label).strip('-')[:60] or 'run'
+        path = self.output_dir / f'{time.time_ns()}-{slug}-{round(elapsed_ms)}ms.pstats'
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(path)
+        except OSError as e:
+            logger.warning(f"Could not write profile: {e}")
+            return None
+        logger.info(f"Profiled {label} ({elapsed_ms:.1f} ms) to {path}")
+        return path
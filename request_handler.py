@@ -1,43 +1,167 @@
 # request_handler.py
+import argparse
+import functools
+import hashlib
 import http.server
+import json
+import socketserver
 import urllib.parse
 import time
-from pathlib import Path
-from logger import logger
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from admission import AdmissionControl, reject
+from message import Message
+from profiling import Profiler, phase, profiled, server_timing, timings
+from static_assets import AssetTable, send_asset
+from logger import get_logger, log_context, request_id
+
+logger = get_logger(__name__)
+
+# Paths reported as their own metrics label; threads are "/thread", avatars
+# "/avatar", static assets "static" and everything else "other"
+ROUTES = {"/", "/search", "/metrics", "/sync", "/webhook"}
+
+class CountingWriter:
+	"""Wrap a response stream and count the bytes written to it"""
+
+	def __init__(self, raw):
+		self.raw = raw
+		self.bytes_written = 0
+
+	def write(self, data):
+		self.bytes_written += len(data)
+		return self.raw.write(data)
+
+	def __getattr__(self, name):
+		return getattr(self.raw, name)
+
+def store_messages(store, chat_system, messages):
+	"""Write a batch of posted messages and add them to the search and thread indexes and author counts"""
+	store.write_many(messages)
+	if chat_system:
+		for msg in messages:
+			chat_system.index.add_message(msg, local=True)
+			chat_system.threads.add_message(msg, local=True)
+		chat_system.authors.add_messages(messages, local=True)
 
 class ChatRequestHandler(http.server.BaseHTTPRequestHandler):
-	def __init__(self, *args, chat_system=None, html_generator=None):
+	SEARCH_PAGE_SIZE = 20
+	THREAD_PAGE_SIZE = 50
+	# Avatars change rarely and their URL is per author; placeholders are
+	# replaced once the real image has been fetched
+	AVATAR_MAX_AGE = "public, max-age=604800"
+	PLACEHOLDER_MAX_AGE = "public, max-age=300"
+	# Headers and body go out as separate writes; don't hold the body back
+	disable_nagle_algorithm = True
+	# Seconds a post waits for its message to be written before redirecting
+	INGEST_WAIT = 5
+	# Seconds a connection may sit idle or stall mid-request; the pool has a
+	# fixed number of workers, so stalled clients must not keep them
+	timeout = 30
+
+	def __init__(self, *args, chat_system=None, html_generator=None, sync_worker=None, webhook=None, admission=None, assets=None, profiler=None):
 		self.chat_system = chat_system
 		self.html_generator = html_generator
+		self.sync_worker = sync_worker
+		self.webhook = webhook
+		self.admission = admission
+		self.assets = assets
+		self.profiler = profiler
 		super().__init__(*args)
 
+	def setup(self):
+		super().setup()
+		self.wfile = CountingWriter(self.wfile)
+
+	def handle_one_request(self):
+		with log_context(uuid.uuid4().hex[:12]):
+			self._status = None
+			self._phases = None
+			start = time.perf_counter()
+			bytes_before = self.wfile.bytes_written
+			super().handle_one_request()
+			# Unset when the connection timed out before sending a request line
+			if getattr(self, "raw_requestline", None) and self._status is not None:
+				duration = time.perf_counter() - start
+				route = urllib.parse.urlsplit(self.path).path
+				if route.startswith("/thread/"):
+					route = "/thread"
+				elif route.startswith("/avatar/"):
+					route = "/avatar"
+				elif route not in ROUTES:
+					route = "static" if self.assets and self.assets.get(route) else "other"
+				metrics.http_requests.inc(route=route, method=self.command, status=self._status)
+				metrics.http_latency.observe(duration, route=route)
+				metrics.http_bytes.inc(self.wfile.bytes_written - bytes_before, route=route)
+				logger.info(
+					f"{self.command} {self.path} {self._status}",
+					extra={
+						'method': self.command,
+						'path': self.path,
+						'status': self._status,
+						'client': self.client_address[0],
+						'duration_ms': round(duration * 1000, 3),
+						'phases_ms': {name: round(seconds * 1000, 3) for name, seconds in (self._phases or {}).items()}
+					}
+				)
+
+	def end_headers(self):
+		self.send_header("X-Request-ID", request_id.get())
+		super().end_headers()
+
+	def log_request(self, code='-', size='-'):
+		# Access lines are logged once the request completes, with its duration
+		self._status = code.value if hasattr(code, 'value') else code
+
+	def log_message(self, format, *args):
+		logger.warning(format % args, extra={'client': self.client_address[0]})
+
+	@profiled
 	def do_GET(self):
 		try:
-			if self.path == "/":
+			url = urllib.parse.urlsplit(self.path)
+			if url.path == "/search":
+				self._handle_search(urllib.parse.parse_qs(url.query))
+			elif url.path.startswith("/thread/"):
+				self._handle_thread(urllib.parse.unquote(url.path[len("/thread/"):]), urllib.parse.parse_qs(url.query))
+			elif url.path.startswith("/avatar/") and self.chat_system:
+				self._handle_avatar(url.path[len("/avatar/"):])
+			elif self.path == "/":
+				# Generate fresh HTML
+				with timings() as phases:
+					body = self.html_generator.generate_html().encode()
+				self._send_html(body, phases)
+			elif url.path == "/metrics" and metrics.registry.enabled:
+				body = metrics.registry.render().encode()
 				self.send_response(200)
-				self.send_header("Content-type", "text/html")
+				self.send_header("Content-type", "text/plain; version=0.0.4")
+				self.send_header("Content-Length", str(len(body)))
 				self.end_headers()
-				
-				# Generate fresh HTML
-				html_content = self.html_generator.generate_html()
-				self.wfile.write(html_content.encode())
-			elif self.path == "/style.css":
+				self.wfile.write(body)
+			elif url.path == "/sync" and self.sync_worker:
+				body = json.dumps(self.sync_worker.status()).encode()
 				self.send_response(200)
-				self.send_header("Content-type", "text/css")
+				self.send_header("Content-type", "application/json")
+				self.send_header("Content-Length", str(len(body)))
 				self.end_headers()
-				
-				css_path = Path("style.css")
-				if css_path.exists():
-					self.wfile.write(css_path.read_bytes())
-				else:
-					self.send_error(404, "CSS file not found")
+				self.wfile.write(body)
+			elif self.assets and (found := self.assets.get(url.path)):
+				send_asset(self, *found)
 			else:
 				self.send_error(404, "File Not Found")
 		except Exception as e:
 			logger.error(f"Error handling GET request: {e}")
 			self.send_error(500, "Internal Server Error")
 
+	@profiled
 	def do_POST(self):
+		if urllib.parse.urlsplit(self.path).path == "/webhook":
+			return self._handle_webhook()
+		if self.admission:
+			rejection = self.admission.check(self.client_address[0], self.headers.get("Content-Length"))
+			if rejection:
+				return reject(self, *rejection)
 		try:
 			content_length = int(self.headers["Content-Length"])
 			post_data = self.rfile.read(content_length)
@@ -46,9 +170,18 @@ class ChatRequestHandler(http.server.BaseHTTPRequestHandler):
 			message = post_data.get("message", [""])[0]
 			
 			if message:
-				filename = f"msg_{int(time.time())}.txt"
-				Path("messages").mkdir(exist_ok=True)
-				(Path("messages") / filename).write_text(message)
+				# Nanoseconds keep posts within the same second apart
+				msg = Message(f"msg_{time.time_ns()}.txt", message)
+				if self.admission:
+					written = self.admission.ingest.submit(msg)
+					if written is None:
+						return reject(self, *self.admission.shed())
+					# Wait for the writer so the redirected page shows the message
+					failure = self.admission.wait(written, self.INGEST_WAIT)
+					if failure:
+						return reject(self, *failure)
+				else:
+					store_messages(self.html_generator.store, self.chat_system, [msg])
 				
 			# Redirect back to chat interface
 			self.send_response(303)
@@ -58,3 +191,188 @@ class ChatRequestHandler(http.server.BaseHTTPRequestHandler):
 		except Exception as e:
 			logger.error(f"Error handling POST request: {e}")
 			self.send_error(500, "Internal Server Error")
+
+	def _handle_webhook(self):
+		if not self.webhook:
+			self.send_error(404, "File Not Found")
+			return
+		if self.admission:
+			rejection = self.admission.check_webhook(self.client_address[0], self.headers.get("Content-Length"))
+			if rejection:
+				return reject(self, *rejection)
+		try:
+			body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+			status = self.webhook.handle(
+				self.headers.get("X-GitHub-Event", ""),
+				self.headers.get("X-GitHub-Delivery", ""),
+				body,
+				self.headers.get("X-Hub-Signature-256", "")
+			)
+		except Exception as e:
+			logger.error(f"Error handling webhook: {e}")
+			status = 500
+		self.send_response(status)
+		self.send_header("Content-Length", "0")
+		self.end_headers()
+
+	def _handle_search(self, params):
+		query = params.get("q", [""])[0].strip()
+		try:
+			page = max(int(params.get("page", ["1"])[0]), 1)
+		except ValueError:
+			page = 1
+
+		with timings() as phases:
+			results, total = [], 0
+			if query and self.chat_system:
+				with phase("load"):
+					results, total = self.chat_system.search(query, page, self.SEARCH_PAGE_SIZE)
+
+			body = self.html_generator.generate_search_html(
+				query, results, total, page, self.SEARCH_PAGE_SIZE
+			).encode()
+		self._send_html(body, phases)
+
+	def _handle_thread(self, thread, params):
+		try:
+			page = max(int(params.get("page", ["1"])[0]), 1)
+		except ValueError:
+			page = 1
+		root = self.chat_system.threads.find(thread) if self.chat_system else None
+		with timings() as phases:
+			html_content = self.html_generator.generate_thread_html(root, page, self.THREAD_PAGE_SIZE) if root else None
+		if html_content is None:
+			self.send_error(404, "Thread Not Found")
+			return
+		self._send_html(html_content.encode(), phases)
+
+	def _handle_avatar(self, key):
+		cached = self.chat_system.avatars.get(key)
+		if cached:
+			body, content_type = cached
+			cache_control = self.AVATAR_MAX_AGE
+		else:
+			# Not fetched yet, evicted or offline: a placeholder, kept briefly
+			body, content_type = self.chat_system.avatars.placeholder(key), "image/svg+xml"
+			cache_control = self.PLACEHOLDER_MAX_AGE
+		etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+		if self.headers.get("If-None-Match") == etag:
+			self.send_response(304)
+			self.send_header("ETag", etag)
+			self.send_header("Cache-Control", cache_control)
+			self.end_headers()
+			return
+		self.send_response(200)
+		self.send_header("Content-type", content_type)
+		self.send_header("Content-Length", str(len(body)))
+		self.send_header("ETag", etag)
+		self.send_header("Cache-Control", cache_control)
+		self.end_headers()
+		self.wfile.write(body)
+
+	def _send_html(self, body, phases):
+		"""Send a rendered page with a Server-Timing breakdown of how it was built"""
+		self.send_response(200)
+		self.send_header("Content-type", "text/html; charset=utf-8")
+		self.send_header("Content-Length", str(len(body)))
+		self.send_header("Server-Timing", server_timing(phases))
+		self.end_headers()
+		# Writing happens after the headers are out, so it only reaches the access log
+		start = time.perf_counter()
+		self.wfile.write(body)
+		phases["write"] = time.perf_counter() - start
+		self._phases = phases
+
+class WorkerPoolHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+	"""HTTP server that handles requests on a fixed-size thread pool"""
+	daemon_threads = True
+
+	def __init__(self, server_address, handler_class, workers=4):
+		super().__init__(server_address, handler_class)
+		self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chat-worker")
+
+	def process_request(self, request, client_address):
+		self.pool.submit(self.process_request_thread, request, client_address)
+
+	def server_close(self):
+		super().server_close()
+		self.pool.shutdown(wait=False)
+
+def main():
+	from chat_system import ChatSystem
+	from html_generator import HtmlGenerator
+
+	parser = argparse.ArgumentParser(description="Start the BananaChat web server.")
+	parser.add_argument("--port", type=int, default=8000, help="Port to run the server on (default: 8000)")
+	parser.add_argument("--metrics", action="store_true", help="Collect metrics and serve them at /metrics")
+	parser.add_argument("--profile", action="store_true", help="Profile requests, keeping those over profile_threshold_ms in profile_dir")
+	parser.add_argument("--sync-interval", type=int, help="Seconds between background GitHub syncs, 0 to disable (default: sync_interval)")
+	args = parser.parse_args()
+
+	if not (1 <= args.port <= 65535):
+		print(f"Error: Invalid port number {args.port}. Please provide a port between 1 and 65535.")
+		return
+
+	metrics.registry.enabled = args.metrics
+	chat_system = ChatSystem()
+	sync_interval = args.sync_interval if args.sync_interval is not None else chat_system.config.get("sync_interval")
+	sync_worker = None
+	if sync_interval > 0:
+		from sync_worker import SyncWorker
+		sync_worker = SyncWorker(
+			chat_system,
+			sync_interval,
+			jitter=chat_system.config.get("sync_jitter"),
+			max_backoff=chat_system.config.get("sync_max_backoff")
+		)
+		sync_worker.start()
+	webhook = None
+	if chat_system.config.get("webhook_secret"):
+		from webhook import WebhookReceiver
+		webhook = WebhookReceiver(
+			chat_system,
+			chat_system.config.get("webhook_secret"),
+			sync_worker=sync_worker,
+			delay=chat_system.config.get("webhook_coalesce_ms") / 1000,
+			record_dir=chat_system.config.get("webhook_record_dir")
+		)
+	assets = AssetTable()
+	html_generator = HtmlGenerator(
+		synced=sync_worker,
+		assets=assets,
+		threads=chat_system.threads,
+		authors=chat_system.authors,
+		avatars=chat_system.config.get("avatars") and chat_system.config.get("backend") != "local"
+	)
+	profiler = None
+	if args.profile:
+		profiler = Profiler(chat_system.config.get("profile_dir"), chat_system.config.get("profile_threshold_ms"))
+	admission = AdmissionControl.from_settings(
+		chat_system.config.values,
+		functools.partial(store_messages, html_generator.store, chat_system)
+	)
+	admission.ingest.start()
+	handler = functools.partial(
+		ChatRequestHandler,
+		chat_system=chat_system,
+		html_generator=html_generator,
+		sync_worker=sync_worker,
+		webhook=webhook,
+		admission=admission,
+		assets=assets,
+		profiler=profiler
+	)
+	httpd = WorkerPoolHTTPServer(("", args.port), handler, workers=chat_system.config.get("server_workers"))
+	print(f"Server running on http://localhost:{args.port}")
+
+	try:
+		httpd.serve_forever()
+	except KeyboardInterrupt:
+		print("Server shutting down...")
+		httpd.server_close()
+		admission.ingest.stop()
+		if sync_worker:
+			sync_worker.stop()
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,135 @@
+# search_index.py
+import heapq
+import math
+import re
+from collections import Counter
+from datetime import datetime
+from journaled_index import MessageIndex
+from logger import get_logger
+from message import Message
+
+logger = get_logger(__name__)
+
+TOKEN_RE = re.compile(r'\w+')
+
+# BM25 tuning constants
+K1 = 1.2
+B = 0.75
+
+def tokenize(text):
+    """Split text into lowercase search terms"""
+    return [t.casefold() for t in TOKEN_RE.findall(text or '')]
+
+class SearchIndex(MessageIndex):
+    """Inverted index over message content and author.
+
+    Stored as a journaled JSON index (see journaled_index). Its lock makes
+    it safe to search from request threads while a sync updates it.
+    """
+
+    kind = 'search index'
+
+    def __len__(self):
+        return len(self.docs)
+
+    def search(self, query, page=1, per_page=20):
+        """Return (messages, total) for a query, ranked by BM25 then recency"""
+        self.refresh()
+        with self.lock:
+            return self._search(set(tokenize(query)), page, per_page)
+
+    def _search(self, terms, page, per_page):
+        if not terms or not self.docs:
+            return [], 0
+
+        n_docs = len(self.docs)
+        avg_length = self.total_length / n_docs or 1
+        scores = Counter()
+        for term in terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for filename, tf in postings.items():
+                length = self.docs[filename]['length']
+                norm = tf + K1 * (1 - B + B * length / avg_length)
+                scores[filename] += idf * tf * (K1 + 1) / norm
+
+        start = max(page - 1, 0) * per_page
+        ranked = heapq.nlargest(
+            start + per_page, scores.items(),
+            key=lambda kv: (kv[1], self.docs[kv[0]]['date'])
+        )
+        results = []
+        for key, score in ranked[start:]:
+            doc = self.docs[key]
+            results.append(Message(doc['filename'], doc['content'], doc['author'], datetime.fromisoformat(doc['date'])))
+        return results, len(scores)
+
+    def _add_message(self, msg, local=False):
+        doc = {
+            'key': msg.key,
+            'filename': msg.filename,
+            'author': msg.author,
+            'date': msg.date.isoformat(),
+            'content': msg.content,
+        }
+        if local:
+            doc['local'] = True
+        existing = self.docs.get(doc['key'])
+        if existing and all(existing.get(key) == doc.get(key) for key in ('content', 'author', 'local')):
+            return False
+        self._journal({'op': 'add', 'doc': doc})
+        self._add(doc)
+        return True
+
+    def _remove_message(self, key):
+        if key in self.docs:
+            self._remove(key)
+            self._journal({'op': 'remove', 'key': key})
+
+    def _local_keys(self):
+        return [(key, doc.get('local', False)) for key, doc in self.docs.items()]
+
+    def _reset(self):
+        self.docs, self.postings, self.total_length = {}, {}, 0
+
+    def _restore(self, data):
+        self.docs = data.get('docs', {})
+        self.postings = data.get('postings', {})
+        self.total_length = sum(doc['length'] for doc in self.docs.values())
+
+    def _snapshot(self):
+        return {
+            'docs': dict(self.docs),
+            'postings': {term: dict(files) for term, files in self.postings.items()},
+        }
+
+    def _replay(self, entry):
+        if entry['op'] == 'add':
+            self._add(entry['doc'])
+        elif entry.get('key', entry.get('filename')) in self.docs:
+            self._remove(entry.get('key', entry.get('filename')))
+
+    def _add(self, doc):
+        # Indexes written before keys existed use the filename
+        key = doc.setdefault('key', doc['filename'])
+        if key in self.docs:
+            self._remove(key)
+        terms = Counter(tokenize(doc['content']) + tokenize(doc['author']))
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[key] = tf
+        doc['length'] = sum(terms.values())
+        doc['terms'] = list(terms)
+        self.docs[key] = doc
+        self.total_length += doc['length']
+
+    def _remove(self, key):
+        doc = self.docs.pop(key)
+        self.total_length -= doc['length']
+        for term in doc['terms']:
+            postings = self.postings.get(term)
+            if postings:
+                postings.pop(key, None)
+                if not postings:
+                    del self.postings[term]
@@ -0,0 +1,266 @@
+# segments.py
+"""Messages directory partitioned into monthly segments.
+
+Layout::
+
+    messages/<YYYY-MM>/<name>.txt     message files
+    messages/<YYYY-MM>/index.json     filename, author, date and hash of each
+
+Each segment's index records message dates, so reading a segment never
+depends on file timestamps, and a query for recent messages only opens the
+newest segments. Segments for past months no longer change; their parsed
+contents are kept in memory until the directory is modified.
+
+Files that arrive without going through `write` (a git pull, or every file
+of a fresh clone, since the indexes are not committed) are dated and
+attributed from their last git commit. Without git history they fall back
+to the file's timestamp, and a segment's dates are always kept within its
+month, so newest-first reads can stop at a segment boundary.
+
+Files still directly under messages/ (from before segments existed, or
+written by older tools) are read as well; `migrate` moves them into place.
+"""
+import os
+import re
+import json
+import heapq
+import subprocess
+from datetime import datetime, timedelta
+from itertools import islice
+from operator import attrgetter
+from pathlib import Path
+from file_lock import FileLock
+from message import Message, content_hash
+
+SEGMENT_FORMAT = '%Y-%m'
+SEGMENT_PATTERN = re.compile(r'^\d{4}-\d{2}$')
+INDEX_NAME = 'index.json'
+
+def segment_name(date):
+    """Segment a message dated date belongs to"""
+    return date.strftime(SEGMENT_FORMAT)
+
+def segment_bounds(name):
+    """(first, last) datetime a segment's messages may be dated"""
+    start = datetime.strptime(name, SEGMENT_FORMAT)
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end - timedelta(microseconds=1)
+
+def _file_date(path):
+    # The more recent of ctime and mtime, as messages have always been dated
+    stats = path.stat()
+    return datetime.fromtimestamp(max(stats.st_ctime, stats.st_mtime))
+
+def git_commits(directory):
+    """{filename: (date, author)} of the last commit touching each .txt file
+    directly in directory, or {} when it is not in a git work tree"""
+    try:
+        output = subprocess.run(
+            ['git', '-C', str(directory), 'log', '--relative', '--format=%x00%cI%x00%an',
+             '--name-only', '--', ':(glob)*.txt'],
+            capture_output=True, text=True, check=True
+        ).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return {}
+    commits = {}
+    date = author = None
+    for line in output.splitlines():
+        if line.startswith('\0'):
+            _, stamp, author = line.split('\0', 2)
+            # Local naive time, like the dates write() records
+            date = datetime.fromisoformat(stamp).astimezone().replace(tzinfo=None)
+        elif line and date is not None:
+            # Newest commits come first
+            commits.setdefault(line, (date, author or 'Anonymous'))
+    return commits
+
+class MessageStore:
+    def __init__(self, root):
+        self.root = Path(root)
+        self.lock = FileLock(self.root / '.lock')
+        # segment name -> (directory mtime, messages newest first)
+        self._segments = {}
+        # flat filename -> (file stamp, date, author)
+        self._flat = {}
+
+    def segments(self):
+        """Segment names, oldest first"""
+        if not self.root.is_dir():
+            return []
+        return sorted(
+            entry.name for entry in os.scandir(self.root)
+            if entry.is_dir() and SEGMENT_PATTERN.match(entry.name)
+        )
+
+    def write(self, filename, content, date=None, author='Anonymous'):
+        """Store a new message in its segment and return its path"""
+        date = date or datetime.now()
+        directory = self.root / segment_name(date)
+        with self.lock:
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / filename
+            path.write_text(content)
+            entries = self._read_index(directory)
+            entries = [e for e in entries if e['filename'] != filename]
+            entries.append(self._entry(filename, content, author, date))
+            self._write_index(directory, entries)
+        return path
+
+    def write_many(self, messages):
+        """Store many messages, writing each segment's index once; returns how many"""
+        indexes = {}
+        count = 0
+        with self.lock:
+            for msg in messages:
+                directory = self.root / segment_name(msg.date)
+                entries = indexes.get(directory)
+                if entries is None:
+                    directory.mkdir(parents=True, exist_ok=True)
+                    entries = indexes[directory] = {e['filename']: e for e in self._read_index(directory)}
+                (directory / msg.filename).write_text(msg.content)
+                entries[msg.filename] = self._entry(msg.filename, msg.content, msg.author, msg.date)
+                count += 1
+            for directory, entries in indexes.items():
+                self._write_index(directory, list(entries.values()))
+        return count
+
+    def read_segment(self, name, keep=True):
+        """Messages of one segment, newest first; keep=False skips the in-memory copy"""
+        directory = self.root / name
+        try:
+            mtime = directory.stat().st_mtime_ns
+        except FileNotFoundError:
+            return []
+        cached = self._segments.get(name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        entries = self._read_index(directory)
+        files = {entry.name for entry in os.scandir(directory) if entry.name.endswith('.txt')}
+        if files != {e['filename'] for e in entries}:
+            # Files were added or removed without going through write(),
+            # e.g. by a git pull: bring the index up to date
+            entries = self._reindex(directory, entries, files)
+
+        messages = []
+        for entry in entries:
+            try:
+                content = (directory / entry['filename']).read_text().strip()
+            except FileNotFoundError:
+                continue
+            messages.append(Message(
+                entry['filename'], content, entry.get('author', 'Anonymous'),
+                datetime.fromisoformat(entry['date'])
+            ))
+        messages.sort(key=attrgetter('timestamp'), reverse=True)
+        if keep:
+            self._segments[name] = (mtime, messages)
+        return messages
+
+    def iter_messages(self, since=None):
+        """Yield messages newest first, stopping at since, opening segments only as needed"""
+        def segmented():
+            for name in reversed(self.segments()):
+                if since is not None and name < segment_name(since):
+                    return
+                yield from self.read_segment(name)
+
+        merged = heapq.merge(segmented(), self._flat_messages(), key=attrgetter('timestamp'), reverse=True)
+        for msg in merged:
+            if since is not None and msg.date < since:
+                return
+            yield msg
+
+    def iter_oldest(self, since=None):
+        """Yield messages oldest first, one segment in memory at a time"""
+        def segmented():
+            for name in self.segments():
+                if since is not None and name < segment_name(since):
+                    continue
+                yield from reversed(self.read_segment(name, keep=False))
+
+        flat = reversed(self._flat_messages())
+        for msg in heapq.merge(segmented(), flat, key=attrgetter('timestamp')):
+            if since is None or msg.date >= since:
+                yield msg
+
+    def latest(self, limit=None, since=None):
+        """The newest limit messages dated at or after since, newest first"""
+        return list(islice(self.iter_messages(since), limit))
+
+    def migrate(self):
+        """Move flat message files into their segments; returns how many moved"""
+        moved = 0
+        with self.lock:
+            commits = git_commits(self.root)
+            for path in sorted(self.root.glob('*.txt')):
+                date, author = commits.get(path.name) or (_file_date(path), 'Anonymous')
+                directory = self.root / segment_name(date)
+                directory.mkdir(exist_ok=True)
+                target = directory / path.name
+                if target.exists():
+                    continue
+                entries = self._read_index(directory)
+                entries.append(self._entry(path.name, path.read_text().strip(), author, date))
+                os.replace(path, target)
+                self._write_index(directory, entries)
+                moved += 1
+        return moved
+
+    def _flat_messages(self):
+        paths = list(self.root.glob('*.txt')) if self.root.is_dir() else []
+        commits = None
+        flat = {}
+        messages = []
+        for path in paths:
+            stats = path.stat()
+            stamp = (stats.st_mtime_ns, stats.st_size)
+            known = self._flat.get(path.name)
+            if known is None or known[0] != stamp:
+                if commits is None:
+                    commits = git_commits(self.root)
+                date, author = commits.get(path.name) or (_file_date(path), 'Anonymous')
+                known = (stamp, date, author)
+            flat[path.name] = known
+            messages.append(Message(path.name, path.read_text().strip(), known[2], known[1]))
+        self._flat = flat
+        messages.sort(key=attrgetter('timestamp'), reverse=True)
+        return messages
+
+    def _entry(self, filename, content, author, date):
+        return {
+            'filename': filename,
+            'author': author,
+            'date': date.isoformat(),
+            'content_hash': content_hash(content.strip())
+        }
+
+    def _reindex(self, directory, entries, files):
+        with self.lock:
+            entries = [e for e in entries if e['filename'] in files]
+            added = files - {e['filename'] for e in entries}
+            commits = git_commits(directory) if added else {}
+            first, last = segment_bounds(directory.name)
+            for name in added:
+                path = directory / name
+                date, author = commits.get(name) or (_file_date(path), 'Anonymous')
+                # A commit or file date outside the month (the file was moved
+                # here later) is pinned to the segment it sits in
+                date = min(max(date, first), last)
+                entries.append(self._entry(name, path.read_text(), author, date))
+            self._write_index(directory, entries)
+        return entries
+
+    def _read_index(self, directory):
+        try:
+            with open(directory / INDEX_NAME) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    def _write_index(self, directory, entries):
+        entries.sort(key=lambda e: e['date'])
+        tmp = directory / f'.{INDEX_NAME}.{os.getpid()}'
+        with open(tmp, 'w') as f:
+            json.dump(entries, f, separators=(',', ':'))
+        os.replace(tmp, directory / INDEX_NAME)
@@ -1,14 +1,22 @@
 import os
+import time
 import argparse
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from http.server import HTTPServer, BaseHTTPRequestHandler
 import urllib.parse
 import cgi
 from pathlib import Path
 import html
+from admission import AdmissionControl, reject
+from config import load_settings
+from message import Message
+from profiling import Profiler, profiled
+from segments import MessageStore
+from static_assets import AssetTable, send_asset
 
 # Directory to store messages
 messages_directory = Path("./messages")
 messages_directory.mkdir(exist_ok=True)  # Ensure the messages directory exists
+message_store = MessageStore(messages_directory)
 
 # Function to generate the HTML chat interface
 def generate_chat_html():
@@ -87,19 +95,16 @@ def generate_chat_html():
 		<div class="chat-content">
 ''')
 
-		# Add messages from files
-		for filename in sorted(messages_directory.iterdir()):
-			if filename.is_file() and filename.suffix == '.txt':
-				with filename.open("r") as file:
-					content = file.read().strip()
-					# Escape HTML characters in the content
-					escaped_content = html.escape(content)
-					label = filename.stem
-					# Escape HTML characters in the label
-					escaped_label = html.escape(label)
-					message_class = "sender" if label.startswith(('a', 'e', 'i', 'o', 'u')) else "receiver"
-
-					html_file.write(f'''
+		# Add messages from the segmented store, oldest first
+		for message in reversed(message_store.latest()):
+			# Escape HTML characters in the content
+			escaped_content = message.content_html
+			label = Path(message.filename).stem
+			# Escape HTML characters in the label
+			escaped_label = html.escape(label)
+			message_class = "sender" if label.startswith(('a', 'e', 'i', 'o', 'u')) else "receiver"
+
+			html_file.write(f'''
 			<div class="message {message_class}">
 				<strong>{escaped_label.capitalize()}:</strong> {escaped_content}
 			</div>
@@ -117,15 +122,52 @@ def generate_chat_html():
 </html>
 ''')
 
+# Write a batch of posted messages, then regenerate the page once for all of them
+def write_messages(texts):
+	# Nanosecond names are unique without reading the existing messages
+	stamp = time.time_ns()
+	# Store the raw messages (unescaped) in their segments
+	message_store.write_many(Message(f"msg_{stamp + i}.txt", text) for i, text in enumerate(texts))
+	generate_chat_html()
+
+# Posts are rate limited per client and written by one background thread
+admission = AdmissionControl.from_settings(load_settings(), write_messages)
+
+# Only the stylesheet and SVG art are served besides the chat page
+assets = AssetTable()
+
 # Custom request handler to handle GET and POST requests
-class ChatRequestHandler(SimpleHTTPRequestHandler):
+class ChatRequestHandler(BaseHTTPRequestHandler):
+	# Headers and body go out as separate writes; don't hold the body back
+	disable_nagle_algorithm = True
+
+	# Set by --profile to profile each request
+	profiler = None
+
+	@profiled
 	def do_GET(self):
-		if self.path == '/':
+		path = urllib.parse.urlsplit(self.path).path
+		found = assets.get(path)
+		if path == '/':
 			# Serve the HTML file
-			self.path = '/chat_interface.html'
-		return super().do_GET()
+			body = Path('chat_interface.html').read_bytes()
+			self.send_response(200)
+			self.send_header('Content-Type', 'text/html; charset=utf-8')
+			self.send_header('Content-Length', str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+		elif found:
+			send_asset(self, *found)
+		else:
+			self.send_error(404, 'File Not Found')
 
+	@profiled
 	def do_POST(self):
+		# Turn the post away before reading a body that is too large or unwelcome
+		rejection = admission.check(self.client_address[0], self.headers['Content-Length'])
+		if rejection:
+			return reject(self, *rejection)
+
 		# Parse form data
 		ctype, pdict = cgi.parse_header(self.headers['Content-Type'])
 		if ctype == 'application/x-www-form-urlencoded':
@@ -135,14 +177,13 @@ class ChatRequestHandler(SimpleHTTPRequestHandler):
 
 			# Save message if not empty
 			if message:
-				# Use a simple counter for unique file names
-				count = len(list(messages_directory.iterdir())) + 1
-				with open(messages_directory / f"message{count}.txt", "w") as file:
-					# Store the raw message (unescaped) in the file
-					file.write(message)
-
-				# Regenerate the HTML file with the new message
-				generate_chat_html()
+				written = admission.ingest.submit(message)
+				if written is None:
+					return reject(self, *admission.shed())
+				# Wait for the writer so the redirected page shows the message
+				failure = admission.wait(written, 5)
+				if failure:
+					return reject(self, *failure)
 
 			# Redirect back to the main page
 			self.send_response(303)
@@ -158,6 +199,11 @@ def main():
 		default=8000,
 		help="Port to run the server on (default: 8000)"
 	)
+	parser.add_argument(
+		"--profile",
+		action="store_true",
+		help="Profile requests, keeping those over profile_threshold_ms in profile_dir"
+	)
 	args = parser.parse_args()
 
 	# Validate port range
@@ -165,10 +211,15 @@ def main():
 		print(f"Error: Invalid port number {args.port}. Please provide a port between 1 and 65535.")
 		return
 
+	if args.profile:
+		settings = load_settings()
+		ChatRequestHandler.profiler = Profiler(settings.profile_dir, settings.profile_threshold_ms)
+
 	# Initialize the chat HTML page
 	generate_chat_html()
 
 	# Start the server
+	admission.ingest.start()
 	server_address = ("", args.port)
 	httpd = HTTPServer(server_address, ChatRequestHandler)
 	print(f"Server running on http://localhost:{args.port}")
@@ -178,6 +229,7 @@ def main():
 	except KeyboardInterrupt:
 		print("Server shutting down...")
 		httpd.server_close()
+		admission.ingest.stop()
 
 if __name__ == "__main__":
 	main()
\ No newline at end of file
@@ -0,0 +1,127 @@
+# static_assets.py
+"""Whitelisted static files served from memory.
+
+The stylesheet and SVG art are read once, together with their hash,
+content type and a gzip variant, and answered from memory. Each asset is
+reachable at its own name (revalidated through its ETag) and at a
+fingerprinted name such as ``style.3f2a9c1d.css`` that changes with its
+contents and may be cached for a year. Files are re-read when they change
+on disk; nothing outside the whitelist is ever served.
+"""
+import gzip
+import hashlib
+import mimetypes
+import threading
+import time
+from pathlib import Path
+
+# Files served, relative to the asset directory
+ASSET_PATTERNS = ('style.css', '*.svg')
+FINGERPRINT_LENGTH = 8
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+mimetypes.add_type('image/svg+xml', '.svg')
+
+class Asset:
+    __slots__ = ('name', 'body', 'gzipped', 'etag', 'content_type', 'fingerprinted', 'stamp')
+
+    def __init__(self, path):
+        stat = path.stat()
+        self.stamp = (stat.st_mtime_ns, stat.st_size)
+        self.name = path.name
+        self.body = path.read_bytes()
+        digest = hashlib.sha256(self.body).hexdigest()
+        self.etag = f'"{digest[:16]}"'
+        content_type = mimetypes.guess_type(path.name)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type.endswith('+xml'):
+            content_type += '; charset=utf-8'
+        self.content_type = content_type
+        self.fingerprinted = f'{path.stem}.{digest[:FINGERPRINT_LENGTH]}{path.suffix}'
+        gzipped = gzip.compress(self.body, compresslevel=9, mtime=0)
+        # Small files can grow when compressed
+        self.gzipped = gzipped if len(gzipped) < len(self.body) else None
+
+class AssetTable:
+    def __init__(self, directory='.', patterns=ASSET_PATTERNS, check_interval=1.0):
+        self.directory = Path(directory)
+        self.patterns = patterns
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked = 0
+        # name -> Asset, and every served URL path -> (Asset, immutable)
+        self._assets = {}
+        self._routes = {}
+        self.reload()
+
+    def reload(self):
+        """Re-read new or changed files and drop removed ones"""
+        paths = {}
+        for pattern in self.patterns:
+            for path in self.directory.glob(pattern):
+                if path.is_file():
+                    paths[path.name] = path
+
+        assets = {}
+        for name, path in paths.items():
+            current = self._assets.get(name)
+            try:
+                stat = path.stat()
+                if current is not None and current.stamp == (stat.st_mtime_ns, stat.st_size):
+                    assets[name] = current
+                else:
+                    assets[name] = Asset(path)
+            except FileNotFoundError:
+                continue
+
+        routes = {}
+        for asset in assets.values():
+            routes[f'/{asset.name}'] = (asset, False)
+            routes[f'/{asset.fingerprinted}'] = (asset, True)
+        with self._lock:
+            self._assets, self._routes = assets, routes
+            self._checked = time.monotonic()
+
+    def get(self, path):
+        """(Asset, immutable) for a URL path, or None if it is not a static asset"""
+        self._refresh()
+        return self._routes.get(path)
+
+    def url(self, name):
+        """Fingerprinted URL of an asset, or its plain URL if it is not loaded"""
+        self._refresh()
+        asset = self._assets.get(name)
+        return f'/{asset.fingerprinted}' if asset else f'/{name}'
+
+    def _refresh(self):
+        # Changes on disk are noticed within check_interval seconds
+        if time.monotonic() - self._checked >= self.check_interval:
+            self.reload()
+
+def send_asset(handler, asset, immutable, head=False):
+    """Answer a request for asset on a BaseHTTPRequestHandler"""
+    compressed = asset.gzipped is not None and 'gzip' in handler.headers.get('Accept-Encoding', '')
+    body = asset.gzipped if compressed else asset.body
+    # Each encoding is a different representation, so it gets its own tag
+    etag = asset.etag[:-1] + '-gzip"' if compressed else asset.etag
+    cache_control = IMMUTABLE if immutable else REVALIDATE
+
+    if handler.headers.get('If-None-Match') == etag:
+        handler.send_response(304)
+        handler.send_header('ETag', etag)
+        handler.send_header('Cache-Control', cache_control)
+        handler.send_header('Vary', 'Accept-Encoding')
+        handler.end_headers()
+        return
+
+    handler.send_response(200)
+    handler.send_header('Content-Type', asset.content_type)
+    handler.send_header('Content-Length', str(len(body)))
+    handler.send_header('ETag', etag)
+    handler.send_header('Cache-Control', cache_control)
+    handler.send_header('Vary', 'Accept-Encoding')
+    if compressed:
+        handler.send_header('Content-Encoding', 'gzip')
+    handler.end_headers()
+    if not head:
+        handler.wfile.write(body)
@@ -0,0 +1,117 @@
+# sync_worker.py
+import random
+import threading
+import time
+from datetime import datetime
+from operator import attrgetter
+import metrics
+from logger import get_logger, log_context
+
+logger = get_logger(__name__)
+
+class SyncWorker:
+    """Keeps the cache in step with GitHub from a background thread.
+
+    Each run calls ChatSystem.update_cache, which reuses unchanged messages
+    from the cache, and then publishes the result by swapping `messages`
+    for a new list. Request threads only ever read that reference, so they
+    never wait on a sync. Runs are spaced `interval` seconds apart, +/-
+    `jitter`, and back off exponentially up to `max_backoff` while failing.
+    """
+
+    def __init__(self, chat_system, interval, jitter=0, max_backoff=900):
+        self.chat_system = chat_system
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max(max_backoff, interval)
+        self.messages = []
+        self.last_sync = None
+        self.last_duration = None
+        self.last_error = None
+        self.failures = 0
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Load the cached messages and start syncing in the background"""
+        self.messages = self.chat_system.timeline()
+        self._thread = threading.Thread(target=self._run, name="sync-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def trigger(self):
+        """Run a sync now instead of waiting for the next interval"""
+        self._wake.set()
+
+    def sync_once(self):
+        """Run one sync; returns True on success"""
+        # Held until the result is published, so a webhook change applied
+        # meanwhile is not overwritten by this run's older listing
+        with self.chat_system.sync_lock:
+            start = time.perf_counter()
+            try:
+                with log_context(f"sync-{int(time.time())}"):
+                    messages = self.chat_system.update_cache()
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                metrics.sync_runs.inc(result='error')
+                logger.warning(f"Background sync failed ({self.failures} in a row): {e}")
+                return False
+            finally:
+                self.last_duration = time.perf_counter() - start
+                metrics.sync_duration.observe(self.last_duration)
+
+            self.messages = sorted(messages, key=attrgetter('timestamp'), reverse=True)
+        self.last_sync = datetime.now()
+        self.last_error = None
+        self.failures = 0
+        metrics.sync_runs.inc(result='ok')
+        metrics.sync_last_success.set(time.time())
+        logger.info(
+            f"Background sync published {len(self.messages)} messages",
+            extra={'messages': len(self.messages), 'duration_ms': round(self.last_duration * 1000, 3)}
+        )
+        return True
+
+    def apply(self, messages, removed=()):
+        """Publish individual changes without waiting for the next sync; removed holds Message keys"""
+        changed = {msg.key for msg in messages} | set(removed)
+        updated = [msg for msg in self.messages if msg.key not in changed]
+        updated.extend(messages)
+        self.messages = sorted(updated, key=attrgetter('timestamp'), reverse=True)
+
+    def latest(self, limit=None, since=None):
+        """The newest synced messages, newest first, as of the last published sync"""
+        messages = self.messages
+        if since is not None:
+            messages = [msg for msg in messages if msg.date >= since]
+        return messages[:limit]
+
+    def next_delay(self):
+        """Seconds until the next run: the interval with jitter, or a backoff after failures"""
+        if self.failures:
+            return min(self.interval * 2 ** self.failures, self.max_backoff)
+        return max(self.interval + random.uniform(-self.jitter, self.jitter), 1)
+
+    def status(self):
+        return {
+            'interval': self.interval,
+            'messages': len(self.messages),
+            'last_sync': self.last_sync.isoformat() if self.last_sync else None,
+            'last_duration_ms': round(self.last_duration * 1000, 3) if self.last_duration is not None else None,
+            'last_error': self.last_error,
+            'failures': self.failures,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sync_once()
+            self._wake.wait(self.next_delay())
+            self._wake.clear()
@@ -1,6 +1,85 @@
+import html
+import urllib.parse
+from avatars import avatar_key
+from profiling import phase
+from thread_index import thread_id
+
+# Replies deeper than this are indented no further
+MAX_INDENT = 6
+
 class TemplateManager:
+	def __init__(self, assets=None, threads=None, avatars=False):
+		# AssetTable giving fingerprinted asset URLs when pages are served live
+		self.assets = assets
+		# ThreadIndex used to link messages to their threads
+		self.threads = threads
+		# Show author avatars, served by the live server from its avatar cache
+		self.avatars = avatars
+
 	def render(self, title, messages, last_updated):
 		"""Render the HTML template with provided data"""
+		body = f"""<form method="POST" action="/">
+			<div class="input-group">
+				<input type="text" name="message"
+					placeholder="Write a message..."
+					required
+					autofocus>
+				<button type="submit">Send</button>
+			</div>
+		</form>
+
+		<main>
+			{self._render_messages(messages)}
+		</main>"""
+		return self._render_page(title, f"Last updated: {last_updated}", body)
+
+	def render_search(self, title, query, messages, total, page, per_page):
+		"""Render a page of search results"""
+		pages = max((total + per_page - 1) // per_page, 1)
+		q = urllib.parse.quote_plus(query)
+		nav = []
+		if page > 1:
+			nav.append(f'<a href="/search?q={q}&page={page - 1}">Previous</a>')
+		if page < pages:
+			nav.append(f'<a href="/search?q={q}&page={page + 1}">Next</a>')
+		body = f"""<main>
+			{self._render_messages(messages) or '<p>No matching messages.</p>'}
+		</main>
+
+		<nav class="pagination">
+			<span>Page {page} of {pages}</span>
+			{' '.join(nav)}
+		</nav>"""
+		return self._render_page(title, f"{total} results for &quot;{html.escape(query)}&quot;", body, query)
+
+	def render_thread(self, title, entries, summary, page, per_page):
+		"""Render one page of a thread, replies indented under what they answer"""
+		pages = max((summary['count'] + per_page - 1) // per_page, 1)
+		url = self._thread_url(summary)
+		nav = []
+		if page > 1:
+			nav.append(f'<a href="{url}?page={page - 1}">Previous</a>')
+		if page < pages:
+			nav.append(f'<a href="{url}?page={page + 1}">Next</a>')
+		with phase('format'):
+			rendered = '\n'.join(
+				f'<div class="reply" style="margin-left: {min(depth, MAX_INDENT) * 24}px;">{self._render_message(msg, link=False)}</div>'
+				for msg, depth in entries
+			)
+		body = f"""<main>
+			{rendered}
+		</main>
+
+		<nav class="pagination">
+			<span>Page {page} of {pages}</span>
+			{' '.join(nav)}
+			<a href="/">All messages</a>
+		</nav>"""
+		subtitle = f"{summary['count']} messages, last by {html.escape(summary['last_author'])} at {html.escape(summary['last_activity'])}"
+		return self._render_page(title, subtitle, body)
+
+	def _render_page(self, title, subtitle, body, query=""):
+		"""Render the shared page layout around a body"""
 		return f"""<!DOCTYPE html>
 <html lang="en">
 <head>
@@ -8,28 +87,19 @@ class TemplateManager:
 	<meta name="viewport" content="width=device-width, initial-scale=1.0">
 	<title>{title}</title>
 	<meta http-equiv="refresh" content="60">
-	<link rel="stylesheet" href="style.css">
+	<link rel="stylesheet" href="{self._asset_url('style.css')}">
 </head>
 <body>
 	<div class="container">
 		<header>
 			<h1>{title}</h1>
-			<p>Last updated: {last_updated}</p>
+			<p>{subtitle}</p>
+			<form method="GET" action="/search" class="search">
+				<input type="search" name="q" value="{html.escape(query)}" placeholder="Search messages...">
+			</form>
 		</header>
 
-		<form method="POST" action="/">
-			<div class="input-group">
-				<input type="text" name="message"
-					placeholder="Write a message..."
-					required
-					autofocus>
-				<button type="submit">Send</button>
-			</div>
-		</form>
-
-		<main>
-			{self._render_messages(messages)}
-		</main>
+		{body}
 
 		<footer>
 			<p>To participate, visit the <a href="https://github.com/gulkily/bananachat">GitHub repository</a></p>
@@ -38,18 +108,38 @@ class TemplateManager:
 </body>
 </html>"""
 
+	def _asset_url(self, name):
+		"""URL of a static asset; relative for pages written to disk"""
+		return self.assets.url(name) if self.assets else name
+
 	def _render_messages(self, messages):
 		"""Render the message list"""
-		return '\n'.join(self._render_message(msg) for msg in messages)
+		with phase('format'):
+			return '\n'.join(self._render_message(msg) for msg in messages)
 
-	def _render_message(self, msg):
+	def _render_message(self, msg, link=True):
 		"""Render a single message"""
 		return f"""
-		<div class="message" style="background-color: {msg['color_class']};">
+		<div class="message" style="background-color: {msg.color_class};">
 			<div class="header">
-				<div class="author">{msg['author']}</div>
-				<div class="timestamp">{msg['timestamp']}</div>
+				<div class="author">{self._render_avatar(msg)}{msg.author_html}</div>
+				<div class="timestamp">{msg.formatted_date}</div>
 			</div>
-			<div class="content">{msg['content']}</div>
-			<div class="filename">File: {msg['filename']}</div>
+			<div class="content">{msg.content_html}</div>
+			<div class="filename">File: {msg.filename_html}{self._render_thread_link(msg) if link else ''}</div>
 		</div>"""
+
+	def _render_avatar(self, msg):
+		if not self.avatars:
+			return ''
+		return f'<img class="avatar" src="/avatar/{avatar_key(msg.author)}" width="24" height="24" alt="" loading="lazy">'
+
+	def _render_thread_link(self, msg):
+		"""Link to the thread a message starts or belongs to, if it has more than one message"""
+		summary = self.threads.summary(msg.key) if self.threads else None
+		if not summary or summary['count'] < 2:
+			return ''
+		return f' &middot; <a class="thread-link" href="{self._thread_url(summary)}">{summary["count"]} in thread</a>'
+
+	def _thread_url(self, summary):
+		return f"/thread/{urllib.parse.quote(thread_id(summary['root']))}"
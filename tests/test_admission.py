@@ -0,0 +1,93 @@
+# tests/test_admission.py
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from admission import AdmissionControl, IngestQueue, RateLimiter, TokenBucket
+
+def test_token_bucket_allows_a_burst_then_refills():
+    bucket = TokenBucket(rate=2, burst=3, now=0)
+
+    assert [bucket.take(now=0) for _ in range(3)] == [0, 0, 0]
+    assert bucket.take(now=0) == pytest.approx(0.5)
+    # Half a second later one token has come back, and only one
+    assert bucket.take(now=0.5) == 0
+    assert bucket.take(now=0.5) > 0
+    # A long idle period refills up to the burst, not beyond it
+    assert [bucket.take(now=100) for _ in range(4)][:3] == [0, 0, 0]
+    assert bucket.take(now=100) > 0
+
+def test_rate_limiter_tracks_clients_separately():
+    limiter = RateLimiter(per_minute=60, burst=1, max_clients=2)
+
+    assert limiter.check('10.0.0.1') == 0
+    assert limiter.check('10.0.0.1') > 0
+    assert limiter.check('10.0.0.2') == 0
+    # A third client evicts the least recently seen one, which returns with a full bucket
+    assert limiter.check('10.0.0.3') == 0
+    assert limiter.check('10.0.0.1') == 0
+    assert RateLimiter(per_minute=0, burst=1).check('anyone') == 0
+
+def test_check_rejects_bad_requests_in_order():
+    admission = AdmissionControl(RateLimiter(per_minute=60, burst=1), IngestQueue(list, maxsize=10), max_bytes=100)
+
+    assert admission.check('a', None) == (411, 'no_length', None)
+    assert admission.check('a', 'lots') == (411, 'no_length', None)
+    assert admission.check('a', '-1') == (400, 'bad_length', None)
+    assert admission.check('a', '101') == (413, 'too_large', None)
+    # Oversized or malformed requests do not spend the client's token
+    assert admission.check('a', '100') is None
+    assert admission.check('a', '100') == (429, 'rate_limited', 1)
+
+def test_full_queue_sheds_load():
+    ingest = IngestQueue(list, maxsize=2)
+    admission = AdmissionControl(RateLimiter(per_minute=0, burst=1), ingest, max_bytes=100)
+
+    assert ingest.submit('one') is not None
+    assert ingest.submit('two') is not None
+    assert ingest.submit('three') is None
+    assert admission.check('a', '10') == (503, 'queue_full', 1)
+
+def test_webhook_limit_is_separate_from_posts():
+    admission = AdmissionControl(RateLimiter(per_minute=0, burst=1), IngestQueue(list, maxsize=1), max_bytes=10,
+                                 webhook_max_bytes=1000)
+    admission.ingest.submit('queued')
+
+    # Deliveries are not queued, so a full post queue does not turn them away
+    assert admission.check_webhook('github', '500') is None
+    assert admission.check_webhook('github', '1001') == (413, 'too_large', None)
+
+def test_batches_are_written_and_failures_reported():
+    written = []
+    ingest = IngestQueue(written.extend, maxsize=10, batch_size=2)
+    admission = AdmissionControl(RateLimiter(per_minute=0, burst=1), ingest, max_bytes=100)
+    pending = [ingest.submit(n) for n in range(3)]
+    ingest.start()
+    ingest.stop()
+
+    assert written == [0, 1, 2]
+    assert all(admission.wait(p, timeout=1) is None for p in pending)
+
+    def fail(items):
+        raise OSError('disk full')
+    ingest = IngestQueue(fail, maxsize=10)
+    failed = ingest.submit('lost')
+    ingest.start()
+    ingest.stop()
+    assert isinstance(failed.error, OSError)
+    assert AdmissionControl(RateLimiter(0, 1), ingest, 100).wait(failed, timeout=1) == (500, 'write_failed', None)
+
+def test_slow_writer_times_out_with_retry_after():
+    release = threading.Event()
+    ingest = IngestQueue(lambda items: release.wait(5), maxsize=10)
+    admission = AdmissionControl(RateLimiter(per_minute=0, burst=1), ingest, max_bytes=100)
+    ingest.start()
+    try:
+        assert admission.wait(ingest.submit('slow'), timeout=0.05) == (503, 'write_timeout', 1)
+    finally:
+        release.set()
+        ingest.stop()
@@ -0,0 +1,102 @@
+# tests/test_cache_manager.py
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from cache_manager import CacheManager, blob_path
+from message import content_hash
+
+def store(cache, bodies, start=datetime(2024, 1, 1)):
+    """Publish one generation holding {filename: body}"""
+    with cache.snapshot() as snap:
+        snap.save_metadata([
+            {
+                'filename': filename,
+                'author': 'Alice',
+                'date': (start + timedelta(minutes=i)).isoformat(),
+                'content_hash': snap.save_message(filename, body),
+            }
+            for i, (filename, body) in enumerate(bodies.items())
+        ])
+
+def contents(cache):
+    return {msg.filename: msg.content for msg in cache.get_messages()}
+
+def test_each_snapshot_publishes_a_new_generation(tmp_path):
+    cache = CacheManager(tmp_path)
+    store(cache, {'a.txt': 'first'})
+    store(cache, {'a.txt': 'first', 'b.txt': 'second'})
+
+    assert cache.sequence() == 2
+    assert contents(cache) == {'a.txt': 'first', 'b.txt': 'second'}
+
+def test_failed_snapshot_leaves_the_live_generation(tmp_path):
+    cache = CacheManager(tmp_path)
+    store(cache, {'a.txt': 'first'})
+
+    with pytest.raises(RuntimeError):
+        with cache.snapshot() as snap:
+            snap.save_message('b.txt', 'half written')
+            raise RuntimeError('sync failed')
+
+    assert cache.sequence() == 1
+    assert contents(cache) == {'a.txt': 'first'}
+    assert not list(cache.generations_dir.glob('.staging-*'))
+    # The writer lock was released by the abort
+    store(cache, {'c.txt': 'third'})
+    assert cache.sequence() == 2
+
+def test_rollback_returns_to_the_previous_generation(tmp_path):
+    cache = CacheManager(tmp_path)
+    store(cache, {'a.txt': 'old'})
+    store(cache, {'a.txt': 'new'})
+
+    assert cache.rollback() == '00000001'
+    assert contents(cache) == {'a.txt': 'old'}
+    with pytest.raises(RuntimeError):
+        cache.rollback()
+
+def test_incremental_snapshot_keeps_earlier_messages(tmp_path):
+    cache = CacheManager(tmp_path)
+    store(cache, {'a.txt': 'first'})
+    with cache.snapshot(incremental=True) as snap:
+        metadata = snap.metadata + [{
+            'filename': 'b.txt', 'author': 'Bob', 'date': datetime(2024, 2, 1).isoformat(),
+            'content_hash': snap.save_message('b.txt', 'second'),
+        }]
+        snap.save_metadata(metadata)
+
+    assert contents(cache) == {'a.txt': 'first', 'b.txt': 'second'}
+
+def test_identical_bodies_share_one_blob(tmp_path):
+    cache = CacheManager(tmp_path)
+    store(cache, {'a.txt': 'same', 'b.txt': 'same'})
+
+    blobs = [p for p in cache.blobs_dir.rglob('*') if p.is_file()]
+    assert blobs == [blob_path(cache.blobs_dir, content_hash('same'))]
+
+def test_pruned_generations_release_their_blobs(tmp_path):
+    cache = CacheManager(tmp_path, keep_generations=2)
+    store(cache, {'a.txt': 'gone soon'})
+    store(cache, {'b.txt': 'kept'})
+    assert blob_path(cache.blobs_dir, content_hash('gone soon')).exists()
+
+    store(cache, {'b.txt': 'kept', 'c.txt': 'new'})
+    assert len(cache.generations()) == 2
+    assert not blob_path(cache.blobs_dir, content_hash('gone soon')).exists()
+    assert blob_path(cache.blobs_dir, content_hash('kept')).exists()
+
+def test_cold_bodies_are_compressed_and_read_back(tmp_path):
+    bodies = {f'msg_{i}.txt': f'lunch at the usual place, message number {i}' for i in range(40)}
+    cache = CacheManager(tmp_path, compress=True, hot_messages=5)
+    store(cache, bodies)
+
+    stats = cache.stats()
+    assert stats['compressed_blobs'] == 35
+    assert stats['plain_blobs'] == 5
+    # A fresh manager loads the dictionary from disk to read cold bodies
+    assert contents(CacheManager(tmp_path)) == bodies
@@ -0,0 +1,43 @@
+# tests/test_compression.py
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from compression import MAX_DICTIONARY_SIZE, Codec, train_dictionary
+
+SAMPLES = [f'anyone up for lunch? meet at the usual place at {h}:00' for h in range(12)]
+
+def test_round_trip_with_a_trained_dictionary():
+    codec = Codec()
+    key = codec.add_dictionary(train_dictionary(SAMPLES))
+    data = 'anyone up for lunch? meet at the usual place at 1:30'.encode()
+
+    packed = codec.compress(data, key)
+    assert len(packed) < len(data)
+    assert codec.decompress(packed) == data
+
+def test_dictionary_helps_short_messages():
+    data = SAMPLES[3].encode()
+    with_dictionary = Codec()
+    key = with_dictionary.add_dictionary(train_dictionary(SAMPLES))
+    without = Codec()
+    empty = without.add_dictionary(b'')
+
+    assert len(with_dictionary.compress(data, key)) < len(without.compress(data, empty))
+
+def test_decompress_needs_the_dictionary_used():
+    packed = Codec()
+    key = packed.add_dictionary(train_dictionary(SAMPLES))
+    data = packed.compress(b'hello', key)
+
+    with pytest.raises(KeyError):
+        Codec().decompress(data)
+    with pytest.raises(ValueError):
+        packed.decompress(b'plain text')
+
+def test_dictionary_stays_within_the_zlib_window():
+    samples = [' '.join(f'word{i}_{j}' for j in range(50)) for i in range(200)] * 2
+    assert len(train_dictionary(samples)) <= MAX_DICTIONARY_SIZE
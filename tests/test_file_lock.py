@@ -0,0 +1,57 @@
+# tests/test_file_lock.py
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from file_lock import FileLock
+
+ROOT = Path(__file__).resolve().parent.parent
+
+def test_lock_is_reentrant_across_instances(tmp_path):
+    outer = FileLock(tmp_path / 'index.lock')
+    inner = FileLock(tmp_path / 'index.lock')
+
+    # Nested instances on one path share a single flock instead of deadlocking
+    with outer, inner, outer:
+        pass
+    with inner:
+        pass
+
+def test_second_thread_waits_for_release(tmp_path):
+    lock = FileLock(tmp_path / 'index.lock')
+    order = []
+    acquired = threading.Event()
+
+    def other():
+        with FileLock(tmp_path / 'index.lock'):
+            order.append('other')
+        acquired.set()
+
+    with lock:
+        thread = threading.Thread(target=other)
+        thread.start()
+        assert not acquired.wait(0.2)
+        order.append('holder')
+    thread.join(5)
+
+    assert order == ['holder', 'other']
+
+def test_another_process_waits_for_release(tmp_path):
+    path = tmp_path / 'index.lock'
+    script = (
+        'import sys, time; from file_lock import FileLock\n'
+        'start = time.monotonic()\n'
+        f'with FileLock({str(path)!r}):\n'
+        '    print(time.monotonic() - start)\n'
+    )
+    with FileLock(path):
+        child = subprocess.Popen([sys.executable, '-c', script], cwd=ROOT, stdout=subprocess.PIPE, text=True)
+        time.sleep(0.5)
+    out, _ = child.communicate(timeout=10)
+
+    assert child.returncode == 0
+    assert float(out) >= 0.3
@@ -0,0 +1,68 @@
+# tests/test_indexes.py
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from author_registry import AuthorRegistry
+from message import Message
+from search_index import SearchIndex
+from thread_index import ThreadIndex
+
+def messages():
+    return (
+        Message('msg_1.txt', 'Anyone up for lunch?', 'Alice', datetime(2024, 1, 1, 12, 0)),
+        Message('msg_2.txt', '>>msg_1 sure', 'Bob', datetime(2024, 1, 1, 12, 5)),
+    )
+
+def test_local_posts_survive_sync(tmp_path):
+    listed, posted = messages()
+    bodies = {msg.content_hash: msg.content for msg in (listed, posted)}
+    threads = ThreadIndex(tmp_path / 'threads.json', read_body=lambda node: bodies[node['content_hash']])
+    index = SearchIndex(tmp_path / 'search.json')
+    authors = AuthorRegistry(tmp_path / 'authors.json')
+    for store in (threads, index, authors):
+        store.sync([listed])
+    threads.add_message(posted, local=True)
+    index.add_message(posted, local=True)
+    authors.add_messages([posted], local=True)
+
+    # The post is not published yet, so the listing does not have it
+    for store in (threads, index, authors):
+        store.sync([listed])
+    assert threads.summary('msg_1.txt')['count'] == 2
+    assert len(index) == 2
+    assert authors.lookup('Bob')['count'] == 1
+
+    # Once published it is counted once, from the listing
+    authors = AuthorRegistry(tmp_path / 'authors.json')
+    authors.sync([listed, posted])
+    assert authors.lookup('Bob')['count'] == 1
+    assert authors.local_posts == {}
+
+    reloaded = ThreadIndex(tmp_path / 'threads.json', read_body=lambda node: bodies[node['content_hash']])
+    entries, summary = reloaded.thread('msg_1.txt')
+    assert [(msg.content, depth) for msg, depth in entries] == [('Anyone up for lunch?', 0), ('>>msg_1 sure', 1)]
+    assert '"content"' not in (tmp_path / 'threads.json').read_text()
+
+def test_processes_sharing_an_index_keep_each_others_changes(tmp_path, monkeypatch):
+    # Two instances stand in for the server and a cron update-cache
+    monkeypatch.setattr('journaled_index.REFRESH_INTERVAL', 0)
+    listed, posted = messages()
+    server = SearchIndex(tmp_path / 'search.json')
+    cron = SearchIndex(tmp_path / 'search.json')
+
+    server.add_message(posted, local=True)
+    cron.sync([listed])
+    assert set(cron.docs) == {'msg_1.txt', 'msg_2.txt'}
+
+    # The server sees what cron saved and compacts without losing either
+    assert [msg.filename for msg in server.search('lunch')[0]] == ['msg_1.txt']
+    server.save()
+    assert set(SearchIndex(tmp_path / 'search.json').docs) == {'msg_1.txt', 'msg_2.txt'}
+    assert not list(tmp_path.glob('*.tmp'))
+
+def test_author_registry_has_no_message_hooks():
+    assert not hasattr(AuthorRegistry, 'add_message')
+    assert not hasattr(AuthorRegistry, 'remove_message')
@@ -0,0 +1,63 @@
+# tests/test_message.py
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from message import Message, dedupe, merge_timelines
+
+def at(minute, content, author='Alice', filename=None, commit_hash=None):
+    return Message(filename or f'msg_{minute}.txt', content, author, datetime(2024, 1, 1, 12, minute), commit_hash)
+
+def test_dedupe_policies():
+    messages = [
+        at(3, 'hello'),
+        at(1, 'hello'),
+        at(2, 'hello', author='Bob'),
+        at(1, 'hello', filename='copy.txt'),
+    ]
+
+    assert len(dedupe(messages, 'none')) == 4
+    # exact: same body, author and time
+    assert [m.filename for m in dedupe(messages, 'exact')] == ['msg_3.txt', 'msg_1.txt', 'msg_2.txt']
+    # author: the earliest copy per author is kept
+    assert [(m.author, m.timestamp) for m in dedupe(messages, 'author')] == [
+        ('Alice', at(1, '').timestamp), ('Bob', at(2, '').timestamp),
+    ]
+    assert [m.filename for m in dedupe(messages, 'content')] == ['msg_1.txt']
+    with pytest.raises(ValueError):
+        dedupe(messages, 'fuzzy')
+
+def test_merge_timelines_interleaves_sorted_streams():
+    primary = [at(1, 'a'), at(4, 'd')]
+    fork = [at(2, 'b'), at(3, 'c'), at(5, 'e')]
+
+    assert [m.content for m in merge_timelines([primary, fork])] == ['a', 'b', 'c', 'd', 'e']
+    newest = [list(reversed(primary)), list(reversed(fork))]
+    assert [m.content for m in merge_timelines(newest, newest_first=True)] == ['e', 'd', 'c', 'b', 'a']
+
+def test_merge_timelines_yields_shared_messages_once():
+    shared = at(2, 'from upstream', commit_hash='c0ffee')
+    renamed = at(3, 'from upstream', filename='renamed.txt', commit_hash='c0ffee')
+    primary = [at(1, 'a'), shared]
+    fork = [at(2, 'from upstream', commit_hash='c0ffee'), renamed]
+
+    # The same file at the same commit is one message, whatever the policy
+    merged = list(merge_timelines([primary, fork], policy='none'))
+    assert [m.filename for m in merged] == ['msg_1.txt', 'msg_2.txt', 'renamed.txt']
+    # A content policy also folds the renamed copy
+    merged = list(merge_timelines([primary, fork], policy='content'))
+    assert [m.filename for m in merged] == ['msg_1.txt', 'msg_2.txt']
+
+def test_merge_timelines_is_lazy():
+    def endless():
+        minute = 0
+        while True:
+            yield at(minute % 60, f'tick {minute}')
+            minute += 1
+
+    merged = merge_timelines([endless()], policy='none')
+    assert [next(merged).content for _ in range(3)] == ['tick 0', 'tick 1', 'tick 2']
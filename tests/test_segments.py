@@ -0,0 +1,73 @@
+# tests/test_segments.py
+import os
+import shutil
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from segments import INDEX_NAME, MessageStore
+
+pytestmark = pytest.mark.skipif(shutil.which('git') is None, reason='git is not installed')
+
+def git(repo, *args, date=None, author='Alice'):
+    env = {
+        **os.environ,
+        'GIT_AUTHOR_NAME': author, 'GIT_AUTHOR_EMAIL': 'a@example.com',
+        'GIT_COMMITTER_NAME': author, 'GIT_COMMITTER_EMAIL': 'a@example.com',
+    }
+    if date:
+        env['GIT_AUTHOR_DATE'] = env['GIT_COMMITTER_DATE'] = date
+    subprocess.run(['git', '-C', str(repo), *args], env=env, check=True, capture_output=True)
+
+def commit_file(repo, path, content, date, author='Alice'):
+    target = repo / path
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_text(content)
+    git(repo, 'add', path)
+    git(repo, 'commit', '-m', f'Add {path}', date=date, author=author)
+
+@pytest.fixture
+def repo(tmp_path):
+    git(tmp_path, 'init', '-q')
+    return tmp_path
+
+def test_pulled_file_is_dated_from_git(repo):
+    store = MessageStore(repo / 'messages')
+    store.write('msg_2.txt', 'june', date=datetime(2024, 6, 10, 12, 0))
+    # Arrives without going through write(), as from a git pull
+    commit_file(repo, 'messages/2024-01/msg_1.txt', 'january', '2024-01-15T10:00:00+00:00', author='Bob')
+
+    newest = store.latest(1)
+    assert [m.filename for m in newest] == ['msg_2.txt']
+    january = [m for m in store.latest() if m.filename == 'msg_1.txt'][0]
+    assert january.date.year == 2024 and january.date.month == 1
+    assert january.author == 'Bob'
+    assert [m.filename for m in store.latest(since=datetime(2024, 3, 1))] == ['msg_2.txt']
+    assert store.latest(since=datetime(2025, 1, 1)) == []
+
+def test_fresh_clone_keeps_message_dates(repo):
+    commit_file(repo, 'messages/2024-01/msg_1.txt', 'one', '2024-01-15T10:00:00+00:00', author='Bob')
+    commit_file(repo, 'messages/2024-06/msg_2.txt', 'two', '2024-06-10T10:00:00+00:00', author='Carol')
+    # A clone has the files but not the uncommitted segment indexes
+    for index in (repo / 'messages').glob(f'*/{INDEX_NAME}'):
+        index.unlink()
+
+    messages = MessageStore(repo / 'messages').latest()
+    assert [(m.filename, m.author, m.date.year, m.date.month) for m in messages] == [
+        ('msg_2.txt', 'Carol', 2024, 6),
+        ('msg_1.txt', 'Bob', 2024, 1),
+    ]
+
+def test_dates_stay_within_their_segment(tmp_path):
+    # No git history: the file timestamp is pinned to the segment's month
+    path = tmp_path / 'messages' / '2024-01' / 'msg_1.txt'
+    path.parent.mkdir(parents=True)
+    path.write_text('january')
+
+    (msg,) = MessageStore(tmp_path / 'messages').latest()
+    assert msg.date == datetime(2024, 1, 31, 23, 59, 59, 999999)
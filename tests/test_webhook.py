@@ -0,0 +1,100 @@
+# tests/test_webhook.py
+import json
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from chat_system import ChatSystem
+from webhook import WebhookReceiver, parse_push, sign
+
+SECRET = 'hush'
+
+class FakeGitHub:
+    def __init__(self, files):
+        self.files = files
+        self.fetched = []
+
+    def get_file(self, path, ref):
+        self.fetched.append((path, ref))
+        return self.files[path], f'sha-{path}'
+
+class FakeChat:
+    """The parts of ChatSystem a receiver uses, recording what it is asked to apply"""
+
+    removed_keys = ChatSystem.removed_keys
+
+    def __init__(self, files):
+        self.owner, self.repo = 'alice', 'chat'
+        self.repos = [('alice', 'chat')]
+        self.github = FakeGitHub(files)
+        self.sync_lock = threading.RLock()
+        self.applied = []
+
+    def client_for(self, owner, repo):
+        return self.github
+
+    def apply_changes(self, messages, removed=(), repo=None):
+        self.applied.append(({msg.filename: msg.content for msg in messages}, sorted(removed), repo))
+
+def push(*commits, after='abc123'):
+    return {
+        'ref': 'refs/heads/main',
+        'after': after,
+        'repository': {'name': 'chat', 'full_name': 'alice/chat', 'owner': {'login': 'alice'}, 'default_branch': 'main'},
+        'commits': list(commits),
+    }
+
+def commit(sha, added=(), modified=(), removed=(), timestamp='2024-05-01T12:00:00+02:00'):
+    return {'id': sha, 'timestamp': timestamp, 'author': {'name': 'Alice'},
+            'added': list(added), 'modified': list(modified), 'removed': list(removed)}
+
+def deliver(receiver, payload, secret=SECRET, event='push'):
+    body = json.dumps(payload).encode()
+    return receiver.handle(event, 'delivery-1', body, sign(secret, body))
+
+def test_signature_is_required_and_checked():
+    receiver = WebhookReceiver(FakeChat({}), SECRET, delay=60)
+    body = json.dumps(push()).encode()
+
+    assert receiver.handle('push', 'd', body, '') == 401
+    assert receiver.handle('push', 'd', body, sign('wrong', body)) == 401
+    assert receiver.handle('push', 'd', body + b' ', sign(SECRET, body)) == 401
+    assert receiver.handle('ping', 'd', body, sign(SECRET, body)) == 200
+    # Without a configured secret nothing is accepted
+    assert WebhookReceiver(FakeChat({}), '', delay=60).handle('push', 'd', body, sign('', body)) == 401
+
+def test_pushes_elsewhere_are_ignored():
+    receiver = WebhookReceiver(FakeChat({}), SECRET, delay=60)
+    other_branch = {**push(commit('1', added=['messages/a.txt'])), 'ref': 'refs/heads/feature'}
+    other_repo = push(commit('1', added=['messages/a.txt']))
+    other_repo['repository'] = {**other_repo['repository'], 'owner': {'login': 'mallory'}}
+
+    assert deliver(receiver, other_branch) == 204
+    assert deliver(receiver, other_repo) == 204
+    assert receiver._pending == {}
+
+def test_parse_push_replays_commits_in_order():
+    changed, removed = parse_push(push(
+        commit('1', added=['messages/a.txt', 'messages/b.txt', 'README.md']),
+        commit('2', removed=['messages/a.txt'], modified=['messages/2024-05/c.txt']),
+    ))
+
+    assert set(changed) == {'messages/b.txt', 'messages/2024-05/c.txt'}
+    assert removed == {'messages/a.txt'}
+    # Offsets become naive UTC, as stored everywhere else
+    assert changed['messages/b.txt']['date'].isoformat() == '2024-05-01T10:00:00'
+
+def test_bursts_are_coalesced_into_one_apply():
+    chat = FakeChat({'messages/a.txt': 'hello', 'messages/b.txt': 'world'})
+    receiver = WebhookReceiver(chat, SECRET, delay=60)
+
+    assert deliver(receiver, push(commit('1', added=['messages/a.txt']), after='one')) == 202
+    assert deliver(receiver, push(commit('2', added=['messages/b.txt', 'messages/c.txt']), after='two')) == 202
+    assert deliver(receiver, push(commit('3', removed=['messages/c.txt']), after='three')) == 202
+    receiver.flush()
+
+    assert chat.applied == [({'a.txt': 'hello', 'b.txt': 'world'}, ['c.txt'], ('alice', 'chat'))]
+    # Bodies are fetched once, at the newest commit of the burst
+    assert sorted(chat.github.fetched) == [('messages/a.txt', 'three'), ('messages/b.txt', 'three')]
@@ -0,0 +1,301 @@
+# thread_index.py
+"""Reply threads, kept up to date as messages arrive.
+
+A message replies to another when it names it with a ``>>`` marker
+(``>>msg_1712345678.txt``; the ``.txt`` may be left off) or quotes the
+start of it on a ``>`` line. Each message is linked to its parent when it
+is added, so the channel is never rescanned; a reply that arrives before
+its parent is attached once the parent shows up.
+
+Every thread keeps its members and a summary (message count, last
+activity), so rendering a thread only touches that thread. Like the
+search index, the index is saved as JSON with a journal of the changes
+made since. Message bodies are not stored: a thread page reads the bodies
+of the messages on it from the cache or the messages directory.
+"""
+import re
+import bisect
+from datetime import datetime
+from journaled_index import MessageIndex
+from logger import get_logger
+from message import Message, content_hash
+
+logger = get_logger(__name__)
+
+REPLY_MARKER = re.compile(r'>>([\w.-]+)')
+QUOTE_LINE = re.compile(r'^>(?!>)\s*(\S.*)$', re.M)
+# Characters of a message's start kept for matching quotes, and how many
+# of them a quote is looked up by; a quote must match a prefix of the start
+HEAD_LENGTH = 40
+HEAD_KEY_LENGTH = 16
+
+def head(text):
+    """Normalized start of a text, for matching quotes to the message they quote"""
+    return ' '.join(text.split()).casefold()[:HEAD_LENGTH]
+
+def links(text):
+    """What a message's text contributes to linking: its head, the files it
+    names with >> markers and the heads of the lines it quotes"""
+    return {
+        'head': head(text),
+        # A marker ending a sentence picks up its full stop
+        'refs': [ref.rstrip('.') for ref in REPLY_MARKER.findall(text)],
+        'quotes': [head(quote) for quote in QUOTE_LINE.findall(text)],
+    }
+
+def _drop_content(doc):
+    # Indexes and journals written before bodies were left out carry the
+    # full content; keep only what it contributes
+    content = doc.pop('content', None)
+    if content is not None:
+        doc.setdefault('content_hash', content_hash(content))
+        for key, value in links(content).items():
+            doc.setdefault(key, value)
+
+def thread_id(filename):
+    """URL id of the thread rooted at filename"""
+    return filename[:-4] if filename.endswith('.txt') else filename
+
+class ThreadIndex(MessageIndex):
+    """Reply threads over all messages, stored as a journaled JSON index.
+
+    Nodes keep what linking and summaries need, not message bodies;
+    read_body(node) fetches a body when a thread page is rendered.
+    """
+
+    kind = 'thread index'
+
+    def __init__(self, index_path=None, read_body=None):
+        self.read_body = read_body
+        super().__init__(index_path)
+
+    def __len__(self):
+        return len(self.threads)
+
+    def sync(self, messages):
+        """Bring the index in line with a full message listing"""
+        # Parents usually come before their replies, which saves adopting orphans
+        return super().sync(sorted(messages, key=lambda m: m.timestamp))
+
+    def summary(self, key):
+        """Summary of the thread a message (by Message.key) belongs to, or None"""
+        self.refresh()
+        with self.lock:
+            node = self.nodes.get(key)
+            return dict(self.threads[node['root']]) if node else None
+
+    def find(self, thread):
+        """Root filename for a thread id from a URL, or None"""
+        self.refresh()
+        with self.lock:
+            for candidate in (f'{thread}.txt', thread):
+                if candidate in self.threads:
+                    return candidate
+        return None
+
+    def thread(self, root, page=1, per_page=50):
+        """Return ([(message, depth)], summary) for one page of a thread.
+
+        Messages are in reply order: each reply follows the message it
+        answers, replies to the same message oldest first.
+        """
+        self.refresh()
+        with self.lock:
+            thread = self.threads.get(root)
+            if thread is None:
+                return [], None
+            members = set(thread['members'])
+            # Replies whose parent was removed start their own branch
+            tops = [f for f in thread['members'] if self.nodes[f]['parent'] not in members]
+            ordered = []
+            stack = list(reversed(tops))
+            while stack:
+                filename = stack.pop()
+                ordered.append(filename)
+                stack.extend(reversed(self.nodes[filename]['children']))
+
+            start = max(page - 1, 0) * per_page
+            entries = []
+            for filename in ordered[start:start + per_page]:
+                node = self.nodes[filename]
+                body = self.read_body(node) if self.read_body else ''
+                msg = Message(node.get('filename', filename), body, node['author'], datetime.fromisoformat(node['date']))
+                if node.get('repo'):
+                    msg.repo = tuple(node['repo'])
+                entries.append((msg, node['depth']))
+            return entries, dict(thread)
+
+    def _order(self, filename):
+        return self.nodes[filename]['date'], filename
+
+    def _find_parent(self, doc):
+        """(parent filename or None, filename wanted but not seen yet or None)"""
+        wanted = None
+        # owner/repo/ for messages outside the primary repository; replies
+        # name files of their own repository first
+        prefix = doc['key'][:len(doc['key']) - len(doc['filename'])]
+        for ref in doc['refs']:
+            for candidate in dict.fromkeys((prefix + ref, f'{prefix}{ref}.txt', ref, f'{ref}.txt')):
+                if candidate == doc['key']:
+                    continue
+                if candidate in self.nodes:
+                    return candidate, None
+            wanted = wanted or prefix + (ref if ref.endswith('.txt') else f'{ref}.txt')
+        if wanted is None:
+            for quoted in doc['quotes']:
+                parent = self.heads.get(quoted[:HEAD_KEY_LENGTH])
+                if parent and parent != doc['key'] and self.nodes[parent]['head'].startswith(quoted):
+                    return parent, None
+        return None, wanted
+
+    def _add_message(self, msg, local=False):
+        doc = {
+            'key': msg.key,
+            'filename': msg.filename,
+            'author': msg.author,
+            'date': msg.date.isoformat(),
+            'content_hash': msg.content_hash,
+            **links(msg.content),
+        }
+        if msg.repo:
+            doc['repo'] = list(msg.repo)
+        if local:
+            doc['local'] = True
+        existing = self.nodes.get(doc['key'])
+        if existing and all(existing.get(key) == doc.get(key) for key in ('author', 'date', 'content_hash', 'local')):
+            return False
+        self._journal({'op': 'add', 'doc': doc})
+        self._add(doc)
+        return True
+
+    def _remove_message(self, key):
+        if key in self.nodes:
+            self._remove(key)
+            self._journal({'op': 'remove', 'key': key})
+
+    def _local_keys(self):
+        return [(key, node.get('local', False)) for key, node in self.nodes.items()]
+
+    def _reset(self):
+        self.nodes, self.threads, self.orphans, self.heads = {}, {}, {}, {}
+
+    def _restore(self, data):
+        self.nodes = data.get('nodes', {})
+        self.threads = data.get('threads', {})
+        self.orphans = data.get('orphans', {})
+        for node in self.nodes.values():
+            _drop_content(node)
+            node.pop('refs', None)
+            node.pop('quotes', None)
+        for filename in sorted(self.nodes, key=self._order):
+            self.heads[self.nodes[filename]['head'][:HEAD_KEY_LENGTH]] = filename
+
+    def _snapshot(self):
+        return {
+            'nodes': {key: {**node, 'children': list(node['children'])} for key, node in self.nodes.items()},
+            'threads': {root: {**thread, 'members': list(thread['members'])} for root, thread in self.threads.items()},
+            'orphans': {key: list(waiting) for key, waiting in self.orphans.items()},
+        }
+
+    def _replay(self, entry):
+        if entry['op'] == 'add':
+            self._add(entry['doc'])
+        elif entry.get('key', entry.get('filename')) in self.nodes:
+            self._remove(entry.get('key', entry.get('filename')))
+
+    def _add(self, doc):
+        _drop_content(doc)
+        # Indexes written before keys existed use the filename
+        filename = doc.setdefault('key', doc['filename'])
+        if filename in self.nodes:
+            self._remove(filename)
+        parent, wanted = self._find_parent(doc)
+        node = {key: value for key, value in doc.items() if key not in ('refs', 'quotes')}
+        node.update(parent=parent, wants=wanted, children=[])
+        self.nodes[filename] = node
+        if parent is not None:
+            parent_node = self.nodes[parent]
+            bisect.insort(parent_node['children'], filename, key=self._order)
+            node['root'] = parent_node['root']
+            node['depth'] = parent_node['depth'] + 1
+        else:
+            node['root'] = filename
+            node['depth'] = 0
+            self.threads[filename] = {'root': filename, 'members': [], 'count': 0, 'last_activity': None, 'last_author': None}
+            if wanted is not None:
+                self.orphans.setdefault(wanted, []).append(filename)
+        self._join(node['root'], [filename])
+        self.heads[node['head'][:HEAD_KEY_LENGTH]] = filename
+
+        # Replies that arrived first join this message's thread now
+        for child in self.orphans.pop(filename, []):
+            child_node = self.nodes.get(child)
+            if child_node is None or child_node['parent'] is not None or child == node['root']:
+                # Gone, already placed, or this message is itself a reply within that thread
+                continue
+            child_node['parent'] = filename
+            child_node['wants'] = None
+            bisect.insort(node['children'], child, key=self._order)
+            self._move(child, node['root'], node['depth'] + 1)
+
+    def _remove(self, filename):
+        node = self.nodes.pop(filename)
+        thread = self.threads[node['root']]
+        thread['members'].remove(filename)
+        if node['parent'] in self.nodes:
+            self.nodes[node['parent']]['children'].remove(filename)
+        if node['wants'] is not None:
+            waiting = self.orphans.get(node['wants'], [])
+            if filename in waiting:
+                waiting.remove(filename)
+            if not waiting:
+                self.orphans.pop(node['wants'], None)
+        key = node['head'][:HEAD_KEY_LENGTH]
+        if self.heads.get(key) == filename:
+            del self.heads[key]
+
+        # Replies become threads of their own until the message comes back
+        for child in node['children']:
+            child_node = self.nodes[child]
+            child_node['parent'] = None
+            child_node['wants'] = filename
+            self.orphans.setdefault(filename, []).append(child)
+            self.threads[child] = {'root': child, 'members': [], 'count': 0, 'last_activity': None, 'last_author': None}
+            self._move(child, child, 0)
+
+        if thread['members']:
+            self._summarize(thread)
+        else:
+            self.threads.pop(node['root'], None)
+
+    def _move(self, top, root, depth):
+        """Move the replies under top into the thread rooted at root"""
+        moved = []
+        stack = [(top, depth)]
+        while stack:
+            filename, level = stack.pop()
+            node = self.nodes[filename]
+            if node['root'] != root:
+                old = self.threads[node['root']]
+                old['members'].remove(filename)
+                if old['members']:
+                    self._summarize(old)
+                elif old['root'] != root:
+                    del self.threads[old['root']]
+                node['root'] = root
+                moved.append(filename)
+            node['depth'] = level
+            stack.extend((child, level + 1) for child in node['children'])
+        self._join(root, moved)
+
+    def _join(self, root, filenames):
+        thread = self.threads[root]
+        for filename in filenames:
+            bisect.insort(thread['members'], filename, key=self._order)
+        self._summarize(thread)
+
+    def _summarize(self, thread):
+        last = self.nodes[thread['members'][-1]]
+        thread['count'] = len(thread['members'])
+        thread['last_activity'] = last['date']
+        thread['last_author'] = last['author']
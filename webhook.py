@@ -0,0 +1,175 @@
+# webhook.py
+"""GitHub push webhooks applied straight to the cache.
+
+A push payload already says which files changed, in which commit and by
+whom, so the receiver only downloads the changed message files; no
+listing or commits call is made. Pushes arriving within `delay` seconds
+of each other are merged and applied as one cache generation.
+"""
+import hmac
+import json
+import time
+import hashlib
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from logger import get_logger
+from message import Message
+from segments import SEGMENT_PATTERN
+
+logger = get_logger(__name__)
+
+MESSAGES_PREFIX = 'messages/'
+
+def sign(secret, body):
+    """X-Hub-Signature-256 header value for a request body"""
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+def verify_signature(secret, body, signature):
+    return bool(secret and signature) and hmac.compare_digest(sign(secret, body), signature)
+
+def is_message_path(path):
+    """True for messages/<name>.txt and messages/<YYYY-MM>/<name>.txt"""
+    if not path.startswith(MESSAGES_PREFIX) or not path.endswith('.txt'):
+        return False
+    segment, _, _ = path[len(MESSAGES_PREFIX):].rpartition('/')
+    return not segment or bool(SEGMENT_PATTERN.match(segment))
+
+def parse_push(payload):
+    """Return ({path: commit info}, {removed paths}) for message files in a push.
+
+    Commits are replayed in order, so a file added and later removed in the
+    same push ends up removed, and the last commit to touch a file wins.
+    """
+    changed = {}
+    removed = set()
+    for commit in payload.get('commits', []):
+        date = datetime.fromisoformat(commit['timestamp'])
+        if date.tzinfo is not None:
+            # Stored dates are naive UTC, like those from the commits API
+            date = date.astimezone(timezone.utc).replace(tzinfo=None)
+        info = {
+            'author': commit.get('author', {}).get('name') or 'unknown',
+            'date': date,
+            'commit_hash': commit['id'],
+        }
+        for path in commit.get('added', []) + commit.get('modified', []):
+            if is_message_path(path):
+                changed[path] = info
+                removed.discard(path)
+        for path in commit.get('removed', []):
+            if is_message_path(path):
+                changed.pop(path, None)
+                removed.add(path)
+    return changed, removed
+
+class WebhookReceiver:
+    def __init__(self, chat_system, secret, sync_worker=None, delay=1.0, record_dir=None):
+        self.chat_system = chat_system
+        self.secret = secret
+        self.sync_worker = sync_worker
+        self.delay = delay
+        self.record_dir = Path(record_dir) if record_dir else None
+        self._lock = threading.Lock()
+        self._apply_lock = threading.Lock()
+        # (owner, repo) -> {'changed': {path: commit info}, 'removed': set, 'ref': sha}
+        self._pending = {}
+        self._timer = None
+
+    def handle(self, event, delivery, body, signature):
+        """Process one delivery; returns an HTTP status code"""
+        if not verify_signature(self.secret, body, signature):
+            logger.warning("Rejected webhook delivery with a bad signature", extra={'delivery': delivery})
+            return 401
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return 400
+        self._record(event, delivery, payload)
+
+        if event == 'ping':
+            return 200
+        if event != 'push':
+            return 204
+        repository = payload.get('repository', {})
+        default_branch = repository.get('default_branch')
+        if default_branch and payload.get('ref') != f'refs/heads/{default_branch}':
+            return 204
+        if self._repo_of(payload) not in self.chat_system.repos:
+            logger.warning(f"Ignoring push to unknown repository {repository.get('full_name')}")
+            return 204
+        self.submit(payload)
+        return 202
+
+    def submit(self, payload):
+        """Queue a push's changes, applying them once the burst settles"""
+        changed, removed = parse_push(payload)
+        if not changed and not removed:
+            return
+        with self._lock:
+            pending = self._pending.setdefault(self._repo_of(payload), {'changed': {}, 'removed': set(), 'ref': None})
+            for path in removed:
+                pending['changed'].pop(path, None)
+            pending['removed'] -= changed.keys()
+            pending['changed'].update(changed)
+            pending['removed'] |= removed
+            pending['ref'] = payload.get('after') or pending['ref']
+            if self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Apply every queued change as a single cache update per repository"""
+        with self._apply_lock:
+            with self._lock:
+                batches, self._pending, self._timer = self._pending, {}, None
+            for repo, pending in batches.items():
+                try:
+                    self._apply(repo, pending['changed'], pending['removed'], pending['ref'] or 'HEAD')
+                except Exception as e:
+                    logger.error(f"Error applying webhook changes: {e}")
+                    if self.sync_worker:
+                        # Fall back to a full sync rather than serving stale messages
+                        self.sync_worker.trigger()
+
+    def _repo_of(self, payload):
+        repository = payload.get('repository', {})
+        owner = repository.get('owner', {})
+        name = owner.get('login') or owner.get('name')
+        if name and repository.get('name'):
+            return name, repository['name']
+        # Payloads without repository details go to the primary repository
+        return self.chat_system.repos[0]
+
+    def _apply(self, repo, changed, removed, ref):
+        start = time.perf_counter()
+        github = self.chat_system.client_for(*repo)
+        messages = []
+        for path, info in changed.items():
+            text, sha = github.get_file(path, ref)
+            messages.append(Message(
+                path.rsplit('/', 1)[-1], text.strip(), info['author'], info['date'], info['commit_hash'], sha
+            ))
+        removed_names = [path.rsplit('/', 1)[-1] for path in removed]
+
+        # A sync publishing its listing must not land between these two
+        with self.chat_system.sync_lock:
+            self.chat_system.apply_changes(messages, removed_names, repo=repo)
+            if self.sync_worker:
+                self.sync_worker.apply(messages, self.chat_system.removed_keys(removed_names, repo))
+        logger.info(
+            f"Applied webhook changes: {len(messages)} updated, {len(removed_names)} removed",
+            extra={'duration_ms': round((time.perf_counter() - start) * 1000, 3)}
+        )
+
+    def _record(self, event, delivery, payload):
+        if not self.record_dir:
+            return
+        try:
+            self.record_dir.mkdir(parents=True, exist_ok=True)
+            name = f"{time.time_ns()}-{delivery or 'delivery'}.json"
+            with open(self.record_dir / name, 'w') as f:
+                json.dump({'event': event, 'delivery': delivery, 'payload': payload}, f)
+        except OSError as e:
+            logger.warning(f"Could not record webhook delivery: {e}")